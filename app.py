@@ -1,12 +1,15 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import (
     JWTManager, jwt_required, create_access_token, 
     create_refresh_token, get_jwt_identity, get_jwt,
-    verify_jwt_in_request
+    verify_jwt_in_request, decode_token, create_tokens_batch
 )
 from flask_cors import CORS
 from werkzeug.exceptions import BadRequest
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, InvalidTokenError
 import uuid
+import json
 from datetime import datetime, timedelta
 import logging
 import time
@@ -15,11 +18,18 @@ from config import Config
 from database import db
 from models import User, RevokedToken, TokenAudit
 from redis_manager import redis_manager
+from blocklist import blocklist, BlocklistUnavailableError
+from revocation_sync import revocation_sync
+from jwt_keys import keyring
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Claims que fija el emisor; no se aceptan en los claims adicionales de un lote
+# (sid ligaría el token a la sesión de otro usuario)
+RESERVED_CLAIMS = frozenset({'sub', 'type', 'fresh', 'jti', 'iat', 'nbf', 'exp', 'csrf', 'sid'})
+
 app = Flask(__name__)
 app.config.from_object(Config)
 
@@ -29,18 +39,36 @@ CORS(app)
 # Configurar JWT
 jwt = JWTManager(app)
 
-# Callback para verificar tokens revocados (SQL)
+# Copias asíncronas entre SQL y Redis y reconciliador de revocaciones
+revocation_sync.start()
+
+# Con algoritmos asimétricos firma la clave vigente del llavero y el kid elige la de verificación
+if keyring is not None:
+    keyring.start()
+
+    @jwt.additional_headers_loader
+    def add_key_id(identity):
+        """Anunciar en la cabecera kid la clave que firmará el token"""
+        return {'kid': keyring.select_signing_key().kid}
+
+    @jwt.encode_key_loader
+    def signing_key(identity):
+        return keyring.selected_signing_key().private_pem
+
+    @jwt.decode_key_loader
+    def verification_key(jwt_header, jwt_payload):
+        """Clave pública del kid del token (búsqueda O(1))"""
+        key = keyring.verification_key(jwt_header.get('kid'))
+        if key is None:
+            raise InvalidTokenError('Clave de firma desconocida o retirada')
+        return key.public_pem
+
+# Callback para verificar tokens revocados (estrategia según JWT_BLOCKLIST_BACKEND)
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
     """Verificar si un token está en la blocklist"""
     jti = jwt_payload['jti']
-    return RevokedToken.is_revoked(jti)
-
-# Callback para verificar tokens revocados (Redis)
-def check_if_token_revoked_redis(jwt_header, jwt_payload):
-    """Verificar si un token está en la blocklist de Redis"""
-    jti = jwt_payload['jti']
-    return RevokedToken.is_revoked_redis(jti)
+    return blocklist.is_revoked(jti, jwt_payload['sub'], jwt_payload.get('exp'))
 
 # Callback para manejar tokens expirados
 @jwt.expired_token_loader
@@ -74,17 +102,70 @@ def revoked_token_callback(jwt_header, jwt_payload):
         'error': 'token_revoked'
     }), 401
 
+# Sin backend fiable para la blocklist no se acepta ningún token (falla cerrado)
+@app.errorhandler(BlocklistUnavailableError)
+def blocklist_unavailable_callback(error):
+    logger.error(f"Blocklist no disponible: {error}")
+    return jsonify({
+        'message': 'No se puede verificar la revocación del token, inténtalo más tarde',
+        'error': 'blocklist_unavailable'
+    }), 503
+
 def get_client_info():
     """Obtener información del cliente (IP y User-Agent)"""
     ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
     user_agent = request.headers.get('User-Agent', '')
     return ip_address, user_agent
 
-def log_token_action(user_id, action, token_jti=None):
-    """Registrar acción de token en la bitácora"""
+def is_admin(user_id):
+    """Usuario activo incluido en Config.ADMIN_USERS"""
+    user = User.find_by_id(user_id)
+    return bool(user and user.is_active and user.username in Config.ADMIN_USERS)
+
+def session_token_claims(session_id, expires_delta):
+    """Claims de un token de sesión con jti y exp fijados de antemano (evita decodificar el token)"""
+    return {
+        'sid': session_id,
+        'jti': str(uuid.uuid4()),
+        'exp': int(time.time() + expires_delta.total_seconds())
+    }
+
+def create_session_tokens(user, session_id):
+    """Crear access y refresh token ligados a una sesión (claim sid) y su sesión en Redis"""
+    access_claims = session_token_claims(session_id, app.config['JWT_ACCESS_TOKEN_EXPIRES'])
+    refresh_claims = session_token_claims(session_id, app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+    access_token = create_access_token(identity=user.id, additional_claims=access_claims)
+    refresh_token = create_refresh_token(identity=user.id, additional_claims=refresh_claims)
+    
+    ip_address, user_agent = get_client_info()
+    now = datetime.utcnow().isoformat()
+    session_data = {
+        'session_id': session_id,
+        'user_id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'login_time': now,
+        'last_seen': now,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'access_jti': access_claims['jti'],
+        'access_exp': access_claims['exp'],
+        'refresh_jti': refresh_claims['jti'],
+        'refresh_exp': refresh_claims['exp']
+    }
+    # Las sesiones expulsadas por MAX_SESSIONS_PER_USER quedan revocadas también en SQL
+    revoked_tokens = redis_manager.create_user_session(user.id, session_id, session_data) or []
+    for token in revoked_tokens:
+        blocklist.record_redis_revocation(
+            token['jti'], token['token_type'], user.id, datetime.fromtimestamp(token['exp'])
+        )
+    return access_token, refresh_token
+
+def log_token_action(user_id, action, token_jti=None, details=None):
+    """Registrar acción de token en la bitácora; False si no se pudo guardar"""
     ip_address, user_agent = get_client_info()
-    audit = TokenAudit(user_id, action, token_jti, ip_address, user_agent)
-    audit.save()
+    audit = TokenAudit(user_id, action, token_jti, ip_address, user_agent, details)
+    return audit.save()
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -264,8 +345,7 @@ def logout():
         expires_at = datetime.fromtimestamp(exp)
         
         # Agregar token a la blocklist
-        revoked_token = RevokedToken(jti, token_type, current_user_id, expires_at)
-        revoked_token.save()
+        blocklist.revoke(jti, token_type, current_user_id, expires_at)
         
         # Registrar en bitácora
         log_token_action(current_user_id, 'logout', jti)
@@ -377,6 +457,236 @@ def get_admin_audit_log():
             'error': 'internal_error'
         }), 500
 
+@app.route('/api/admin/users/<int:user_id>/active', methods=['PUT'])
+@jwt_required()
+def set_user_active(user_id):
+    """Activar o desactivar un usuario (admin); los workers invalidan su caché de usuarios"""
+    try:
+        current_user_id = get_jwt_identity()
+        if not is_admin(current_user_id):
+            return jsonify({
+                'message': 'Se requieren permisos de administrador',
+                'error': 'forbidden'
+            }), 403
+        
+        data = request.get_json(silent=True) or {}
+        is_active = data.get('is_active')
+        if not isinstance(is_active, bool):
+            return jsonify({
+                'message': 'is_active debe ser true o false',
+                'error': 'invalid_fields'
+            }), 400
+        
+        if not User.find_by_id(user_id):
+            return jsonify({
+                'message': 'Usuario no encontrado',
+                'error': 'user_not_found'
+            }), 404
+        
+        if not User.set_active(user_id, is_active):
+            return jsonify({
+                'message': 'Error actualizando el usuario',
+                'error': 'internal_error'
+            }), 500
+        
+        logger.info(f"Usuario {current_user_id} cambia is_active={is_active} del usuario {user_id}")
+        
+        return jsonify({
+            'message': 'Usuario actualizado exitosamente',
+            'user_id': user_id,
+            'is_active': is_active
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error actualizando usuario: {e}")
+        return jsonify({
+            'message': 'Error interno del servidor',
+            'error': 'internal_error'
+        }), 500
+
+@app.route('/api/admin/tokens/batch', methods=['POST'])
+@jwt_required()
+def issue_tokens_batch():
+    """Emitir tokens en lote para cuentas de servicio o generadores de carga (NDJSON en streaming)"""
+    try:
+        current_user_id = get_jwt_identity()
+        if not is_admin(current_user_id):
+            return jsonify({
+                'message': 'Se requieren permisos de administrador',
+                'error': 'forbidden'
+            }), 403
+        
+        data = request.get_json(silent=True) or {}
+        
+        identities = data.get('identities')
+        if identities is None and data.get('count'):
+            # Identidades generadas (acotadas antes de crear la lista)
+            count = min(int(data['count']), Config.TOKEN_BATCH_MAX_IDENTITIES + 1)
+            prefix = str(data.get('prefix', Config.SERVICE_ACCOUNT_PREFIX))
+            identities = [f"{prefix}{i}" for i in range(count)]
+        
+        if not isinstance(identities, list) or not identities:
+            return jsonify({
+                'message': 'Se requiere una lista de identities o un count',
+                'error': 'missing_fields'
+            }), 400
+        
+        if len(identities) > Config.TOKEN_BATCH_MAX_IDENTITIES:
+            return jsonify({
+                'message': f'Máximo {Config.TOKEN_BATCH_MAX_IDENTITIES} identidades por lote',
+                'error': 'batch_too_large'
+            }), 400
+        
+        # Solo cuentas de servicio: un id numérico daría un token válido de un usuario real
+        prefix = Config.SERVICE_ACCOUNT_PREFIX
+        invalid = [i for i in identities if not isinstance(i, str) or not i.startswith(prefix) or i == prefix]
+        if invalid:
+            return jsonify({
+                'message': f'Las identidades deben empezar por "{prefix}" (cuentas de servicio)',
+                'error': 'invalid_identities',
+                'invalid': invalid[:10]
+            }), 400
+        
+        claims = data.get('claims')
+        if claims is not None and not isinstance(claims, dict):
+            return jsonify({
+                'message': 'claims debe ser un objeto JSON',
+                'error': 'invalid_claims'
+            }), 400
+        
+        reserved = RESERVED_CLAIMS.intersection(claims or ())
+        if reserved:
+            return jsonify({
+                'message': f'Claims reservados no permitidos: {", ".join(sorted(reserved))}',
+                'error': 'invalid_claims'
+            }), 400
+        
+        expires_in = data.get('expires_in')
+        access_expires = None
+        if expires_in is not None:
+            expires_in = int(expires_in)
+            if not 0 < expires_in <= Config.TOKEN_BATCH_MAX_EXPIRES:
+                return jsonify({
+                    'message': f'expires_in debe estar entre 1 y {Config.TOKEN_BATCH_MAX_EXPIRES} segundos',
+                    'error': 'invalid_fields'
+                }), 400
+            access_expires = timedelta(seconds=expires_in)
+        
+        include_refresh = data.get('refresh', False)
+        if not isinstance(include_refresh, bool):
+            return jsonify({
+                'message': 'refresh debe ser true o false',
+                'error': 'invalid_fields'
+            }), 400
+        # Los refresh tokens del lote tampoco superan el tope
+        refresh_expires = timedelta(seconds=min(
+            Config.JWT_REFRESH_TOKEN_EXPIRES.total_seconds(), Config.TOKEN_BATCH_MAX_EXPIRES
+        ))
+        
+        details = json.dumps({
+            'count': len(identities),
+            'identities': identities,
+            'refresh': include_refresh,
+            'expires_in': expires_in
+        })
+        if not log_token_action(current_user_id, 'issue_batch', details=details):
+            # Sin registro en la bitácora no se emite el lote
+            return jsonify({
+                'message': 'No se pudo registrar el lote en la bitácora, inténtalo más tarde',
+                'error': 'audit_unavailable'
+            }), 503
+        
+        logger.info(f"Usuario {current_user_id} emite {len(identities)} tokens en lote")
+        
+        def generate():
+            tokens = create_tokens_batch(
+                identities,
+                refresh=include_refresh,
+                access_expires_delta=access_expires,
+                refresh_expires_delta=refresh_expires,
+                additional_claims=claims,
+                workers=Config.TOKEN_BATCH_WORKERS
+            )
+            try:
+                for identity, access_token, refresh_token in tokens:
+                    item = {'identity': identity, 'access_token': access_token}
+                    if include_refresh:
+                        item['refresh_token'] = refresh_token
+                    yield json.dumps(item) + '\n'
+            except Exception as e:
+                # La respuesta ya empezó: se informa el error en la última línea
+                logger.error(f"Error emitiendo tokens en lote: {e}")
+                yield json.dumps({'error': 'internal_error', 'message': str(e)}) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    except (TypeError, ValueError):
+        return jsonify({
+            'message': 'count y expires_in deben ser enteros',
+            'error': 'invalid_fields'
+        }), 400
+    except Exception as e:
+        logger.error(f"Error en emisión de tokens en lote: {e}")
+        return jsonify({
+            'message': 'Error interno del servidor',
+            'error': 'internal_error'
+        }), 500
+
+@app.route('/api/tokens/introspect', methods=['POST'])
+@jwt_required()
+def introspect_tokens():
+    """Validar varios tokens por petición (gateways): firma, expiración y revocación en lote"""
+    try:
+        data = request.get_json(silent=True) or {}
+        tokens = data.get('tokens')
+        
+        if not isinstance(tokens, list) or not tokens:
+            return jsonify({
+                'message': 'Se requiere una lista de tokens',
+                'error': 'missing_fields'
+            }), 400
+        
+        if len(tokens) > Config.TOKEN_INTROSPECTION_MAX_TOKENS:
+            return jsonify({
+                'message': f'Máximo {Config.TOKEN_INTROSPECTION_MAX_TOKENS} tokens por petición',
+                'error': 'batch_too_large'
+            }), 400
+        
+        # Firma y expiración token a token (los ya verificados salen de la caché)
+        results = [None] * len(tokens)
+        decoded = []
+        for i, token in enumerate(tokens):
+            try:
+                claims = decode_token(token) if isinstance(token, str) else None
+            except ExpiredSignatureError:
+                results[i] = {'active': False, 'error': 'token_expired'}
+                continue
+            except (InvalidTokenError, JWTExtendedException):
+                claims = None
+            if claims is None or 'jti' not in claims:
+                results[i] = {'active': False, 'error': 'invalid_token'}
+            else:
+                decoded.append((i, claims))
+        
+        # Revocación de todos los tokens válidos con una consulta por nivel
+        revoked = blocklist.are_revoked([(claims['jti'], claims['sub'], claims.get('exp')) for _, claims in decoded])
+        for (i, claims), is_revoked in zip(decoded, revoked):
+            if is_revoked:
+                results[i] = {'active': False, 'error': 'token_revoked'}
+            else:
+                results[i] = {**claims, 'active': True}
+        
+        return jsonify({'results': results}), 200
+        
+    except BlocklistUnavailableError as e:
+        return blocklist_unavailable_callback(e)
+    except Exception as e:
+        logger.error(f"Error en introspección de tokens: {e}")
+        return jsonify({
+            'message': 'Error interno del servidor',
+            'error': 'internal_error'
+        }), 500
+
 # ==================== ENDPOINTS REDIS ====================
 
 @app.route('/api-redis/login', methods=['POST'])
@@ -417,18 +727,8 @@ def login_redis():
                 'error': 'user_inactive'
             }), 401
         
-        # Crear tokens
-        access_token = create_access_token(identity=user.id)
-        refresh_token = create_refresh_token(identity=user.id)
-        
-        # Almacenar sesión en Redis
-        session_data = {
-            'user_id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'login_time': datetime.utcnow().isoformat()
-        }
-        redis_manager.store_user_session(user.id, session_data)
+        # Crear tokens y registrar la sesión de este dispositivo en Redis
+        access_token, refresh_token = create_session_tokens(user, uuid.uuid4().hex)
         
         # Registrar en bitácora (Redis)
         audit = TokenAudit(user.id, 'login')
@@ -469,8 +769,25 @@ def refresh_redis():
                 'error': 'invalid_user'
             }), 401
         
-        # Crear nuevo access token
-        new_access_token = create_access_token(identity=current_user_id)
+        # Crear nuevo access token ligado a la misma sesión
+        session_id = get_jwt().get('sid')
+        if session_id is None:
+            new_access_token = create_access_token(identity=current_user_id)
+        else:
+            access_claims = session_token_claims(session_id, app.config['JWT_ACCESS_TOKEN_EXPIRES'])
+            new_access_token = create_access_token(identity=current_user_id, additional_claims=access_claims)
+            
+            # Actualizar la sesión y renovar su TTL (ventana deslizante)
+            session_fields = {
+                'access_jti': access_claims['jti'],
+                'access_exp': access_claims['exp'],
+                'last_seen': datetime.utcnow().isoformat()
+            }
+            if not redis_manager.touch_user_session(current_user_id, session_id, session_fields):
+                return jsonify({
+                    'message': 'La sesión ha expirado o fue cerrada',
+                    'error': 'session_expired'
+                }), 401
         
         # Registrar en bitácora (Redis)
         audit = TokenAudit(current_user_id, 'refresh')
@@ -504,20 +821,16 @@ def logout_redis():
         jti = get_jwt()['jti']
         token_type = get_jwt()['type']
         exp = get_jwt()['exp']
+        session_id = get_jwt().get('sid')
         
         # Convertir timestamp a datetime
         expires_at = datetime.fromtimestamp(exp)
         
-        # Agregar token a la blocklist (Redis)
-        revoked_token = RevokedToken(jti, token_type, current_user_id, expires_at)
-        revoked_token.save_redis()
-        
-        # Eliminar sesión de Redis
-        redis_manager.delete_user_session(current_user_id)
-        
-        # Registrar en bitácora (Redis)
-        audit = TokenAudit(current_user_id, 'logout', jti)
-        audit.save_redis()
+        # Revocar token, eliminar la sesión del dispositivo y registrar en
+        # bitácora en un solo paso atómico del lado del servidor (script Lua)
+        if redis_manager.logout_token(jti, token_type, current_user_id, expires_at, session_id):
+            # Copia en SQL en segundo plano para que ambas blocklists coincidan
+            blocklist.record_redis_revocation(jti, token_type, current_user_id, expires_at)
         
         end_time = time.time()
         response_time = (end_time - start_time) * 1000
@@ -544,15 +857,13 @@ def logout_all_redis():
     try:
         current_user_id = get_jwt_identity()
         
-        # Revocar todos los tokens del usuario (Redis)
-        RevokedToken.revoke_all_user_tokens_redis(current_user_id)
-        
-        # Eliminar sesión de Redis
-        redis_manager.delete_user_session(current_user_id)
-        
-        # Registrar en bitácora (Redis)
-        audit = TokenAudit(current_user_id, 'revoke')
-        audit.save_redis()
+        # Revocar todos los tokens del usuario, eliminar sesión y registrar en
+        # bitácora en un solo paso atómico (script Lua)
+        revoked_tokens = RevokedToken.revoke_all_user_tokens_redis(current_user_id) or []
+        for token in revoked_tokens:
+            blocklist.record_redis_revocation(
+                token['jti'], token['token_type'], current_user_id, datetime.fromtimestamp(token['exp'])
+            )
         
         end_time = time.time()
         response_time = (end_time - start_time) * 1000
@@ -571,6 +882,32 @@ def logout_all_redis():
             'error': 'internal_error'
         }), 500
 
+@app.route('/api-redis/sessions', methods=['GET'])
+@jwt_required()
+def get_sessions_redis():
+    """Listar las sesiones activas (dispositivos) del usuario usando Redis"""
+    try:
+        current_user_id = get_jwt_identity()
+        current_session_id = get_jwt().get('sid')
+        
+        sessions = redis_manager.list_user_sessions(current_user_id)
+        for session in sessions:
+            # No exponer los JTIs de los tokens de otras sesiones
+            session.pop('access_jti', None)
+            session.pop('refresh_jti', None)
+            session['current'] = session.get('session_id') == current_session_id
+        
+        return jsonify({
+            'sessions': sessions
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error listando sesiones Redis: {e}")
+        return jsonify({
+            'message': 'Error interno del servidor',
+            'error': 'internal_error'
+        }), 500
+
 @app.route('/api-redis/audit-log', methods=['GET'])
 @jwt_required()
 def get_audit_log_redis():
@@ -684,18 +1021,8 @@ def compare_performance():
         # Probar Redis
         redis_start = time.time()
         try:
-            # Simular operaciones Redis
-            access_token_redis = create_access_token(identity=user.id)
-            refresh_token_redis = create_refresh_token(identity=user.id)
-            
-            # Almacenar sesión en Redis
-            session_data = {
-                'user_id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'login_time': datetime.utcnow().isoformat()
-            }
-            redis_manager.store_user_session(user.id, session_data)
+            # Simular operaciones Redis (tokens y sesión del dispositivo)
+            access_token_redis, refresh_token_redis = create_session_tokens(user, uuid.uuid4().hex)
             
             # Registrar en bitácora Redis
             audit_redis = TokenAudit(user.id, 'login')
@@ -764,7 +1091,7 @@ def health_check():
             db.disconnect()
             db_status = 'connected'
         
-        # Verificar conexión a Redis
+        # Verificar conexión a Redis (estado pasivo, sin PING)
         redis_status = 'disconnected'
         if redis_manager.is_connected():
             redis_status = 'connected'
@@ -775,6 +1102,7 @@ def health_check():
             'status': overall_status,
             'database': db_status,
             'redis': redis_status,
+            'redis_state': redis_manager.state,
             'timestamp': datetime.utcnow().isoformat()
         }), 200 if overall_status == 'healthy' else 503
         
@@ -785,6 +1113,33 @@ def health_check():
             'timestamp': datetime.utcnow().isoformat()
         }), 503
 
+@app.route('/.well-known/jwks.json', methods=['GET'])
+def get_jwks():
+    """Claves públicas vigentes para verificar los tokens en otros servicios"""
+    if keyring is None:
+        # HS256: no hay claves públicas que publicar
+        body, etag = b'{"keys":[]}', 'empty'
+    else:
+        body, etag = keyring.jwks()
+    headers = {
+        'Cache-Control': f'public, max-age={Config.JWKS_MAX_AGE}',
+        'ETag': f'"{etag}"'
+    }
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Obtener métricas internas de la aplicación"""
+    return jsonify({
+        'redis': redis_manager.get_metrics(),
+        'blocklist': blocklist.get_metrics(),
+        'jwt_verified_cache': jwt.get_verified_token_cache_stats(),
+        'jwt_keys': keyring.get_stats() if keyring is not None else None,
+        'timestamp': datetime.utcnow().isoformat()
+    }), 200
+
 if __name__ == '__main__':
     # Inicializar base de datos
     logger.info("Inicializando aplicación...")
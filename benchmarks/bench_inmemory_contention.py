@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark de contención de locks en InMemoryRedis
+Ejecuta una carga mixta (GET/SETEX/HSET/LPUSH+LTRIM sobre claves de distintos
+usuarios) con 1, 4, 16 y 64 hilos y compara un único lock global (shards=1)
+con el espacio de claves repartido en shards
+
+Uso: python benchmarks/bench_inmemory_contention.py [operaciones_por_hilo]
+"""
+
+import os
+import sys
+import time
+from threading import Barrier, Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from redis_alternative import InMemoryRedis
+
+THREADS = (1, 4, 16, 64)
+SHARDS = (1, InMemoryRedis.SHARDS)
+USERS = 1000
+
+
+def worker(client, thread_id, operations, barrier):
+    barrier.wait()
+    for i in range(operations):
+        user = f"{{u:{(thread_id * 7919 + i) % USERS}}}"
+        op = i % 4
+        if op == 0:
+            client.setex(f"session:{user}:s1", 60, "session")
+        elif op == 1:
+            client.get(f"session:{user}:s1")
+        elif op == 2:
+            client.hset(f"user_sessions:{user}", "s1", i)
+        else:
+            client.lpush(f"audit_log_list:{user}", i)
+            client.ltrim(f"audit_log_list:{user}", 0, 99)
+
+
+def bench(shards, threads, operations):
+    client = InMemoryRedis(shards=shards)
+    barrier = Barrier(threads + 1)
+    workers = [Thread(target=worker, args=(client, n, operations, barrier)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return threads * operations / elapsed, client.get_lock_stats()
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print(f"{'hilos':>6} {'shards':>7} {'ops/s':>12} {'contención':>11} {'espera total':>13} {'espera máx':>11}")
+    for threads in THREADS:
+        for shards in SHARDS:
+            ops_per_second, locks = bench(shards, threads, operations)
+            print(f"{threads:>6} {shards:>7} {ops_per_second:>12.0f} {locks['contention_rate']:>10.2%} "
+                  f"{locks['wait_seconds'] * 1000:>11.2f}ms {locks['max_wait_seconds'] * 1000:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
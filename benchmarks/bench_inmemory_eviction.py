@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Benchmark de desalojo en InMemoryRedis con maxmemory
+Simula un pico de logins: cada login escribe una clave de auditoría con TTL
+de 30 días y lee las sesiones activas (claves calientes). Para cada política
+muestra el coste por operación, la memoria final, las claves desalojadas y
+la tasa de aciertos sobre las sesiones calientes
+
+Uso: python benchmarks/bench_inmemory_eviction.py [logins]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from redis_alternative import EVICTION_POLICIES, InMemoryRedis, ResponseError
+
+MAXMEMORY = 2 * 1024 * 1024
+SESSIONS = 500
+AUDIT_TTL = 30 * 24 * 3600
+
+
+def run(policy, logins):
+    client = InMemoryRedis(maxmemory=MAXMEMORY, maxmemory_policy=policy)
+    for user in range(SESSIONS):
+        client.setex(f"session:{{u:{user}}}:s1", 3600, "active")
+    hits = reads = rejected = 0
+    start = time.perf_counter()
+    for i in range(logins):
+        user = i % SESSIONS
+        try:
+            client.setex(f"audit_log:{{u:{user}}}:{i}", AUDIT_TTL, "login " * 40)
+        except ResponseError:
+            rejected += 1
+        reads += 1
+        hits += client.get(f"session:{{u:{(i * 7) % SESSIONS}}}:s1") is not None
+    elapsed = time.perf_counter() - start
+    return elapsed / logins * 1e6, client.get_memory_stats(), hits / reads, rejected
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    print(f"{'política':>13} {'µs/login':>9} {'memoria':>10} {'desalojadas':>12} {'rechazadas':>11} {'aciertos':>9}")
+    for policy in EVICTION_POLICIES:
+        us, memory, hit_rate, rejected = run(policy, logins)
+        print(f"{policy:>13} {us:>9.2f} {memory['used_memory']:>10} {memory['evicted_keys']:>12} "
+              f"{rejected:>11} {hit_rate:>9.2%}")
+
+
+if __name__ == "__main__":
+    main()
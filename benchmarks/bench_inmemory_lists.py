@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark de listas de InMemoryRedis
+Mide el coste por LPUSH/RPUSH/LPOP/LTRIM con listas de distintos tamaños y lo
+compara con la implementación anterior basada en list.insert(0, valor)
+
+Uso: python benchmarks/bench_inmemory_lists.py [tamaño_máximo]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from redis_alternative import InMemoryRedis
+
+OPERATIONS = 10000
+
+
+def per_operation_us(func, operations=OPERATIONS):
+    """Tiempo medio por operación en microsegundos"""
+    start = time.perf_counter()
+    for _ in range(operations):
+        func()
+    return (time.perf_counter() - start) / operations * 1e6
+
+
+def bench_size(size):
+    client = InMemoryRedis()
+    client.rpush("bench:list", *range(size))
+
+    results = {
+        'lpush': per_operation_us(lambda: client.lpush("bench:list", "x")),
+        'rpush': per_operation_us(lambda: client.rpush("bench:list", "x")),
+        'lpop': per_operation_us(lambda: client.lpop("bench:list")),
+        'rpop': per_operation_us(lambda: client.rpop("bench:list")),
+        'lrange_tail': per_operation_us(lambda: client.lrange("bench:list", -10, -1), 1000),
+        # LPUSH + LTRIM a tamaño fijo, como la lista de auditoría por usuario
+        'lpush_ltrim': per_operation_us(
+            lambda: (client.lpush("bench:list", "x"), client.ltrim("bench:list", 0, size - 1))
+        ),
+    }
+
+    # Implementación anterior: insert(0) desplaza toda la lista
+    legacy = list(range(size))
+    results['legacy_lpush'] = per_operation_us(lambda: legacy.insert(0, "x"), min(OPERATIONS, 1000))
+    return results
+
+
+def main():
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    sizes = [size for size in (1000, 10000, 100000, 1000000, 10000000) if size <= max_size]
+    columns = ['lpush', 'rpush', 'lpop', 'rpop', 'lrange_tail', 'lpush_ltrim', 'legacy_lpush']
+
+    print(f"{'tamaño':>10} " + " ".join(f"{column:>12}" for column in columns) + "   (µs/op)")
+    for size in sizes:
+        results = bench_size(size)
+        print(f"{size:>10} " + " ".join(f"{results[column]:>12.3f}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
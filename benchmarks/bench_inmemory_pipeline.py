@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark de pipelines en InMemoryRedis
+Compara ejecutar los comandos de una sesión (HSET + EXPIRE + LPUSH + LTRIM +
+XADD) uno a uno con encolarlos en un pipeline, que toma los locks de los
+shards una sola vez por lote y lo ejecuta de forma atómica; mide el coste
+de encolar y de bloquear el lote completo
+
+Uso: python benchmarks/bench_inmemory_pipeline.py [operaciones]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from redis_alternative import InMemoryRedis
+
+BATCHES = (1, 10, 100)
+USERS = 1000
+
+
+def session_commands(client, i):
+    user = f"{{u:{i % USERS}}}"
+    client.hset(f"session:{user}:s1", "last_seen", i)
+    client.expire(f"session:{user}:s1", 60)
+    client.lpush(f"audit:{user}", i)
+    client.ltrim(f"audit:{user}", 0, 9)
+    client.xadd(f"events:{user}", {"event": "login", "n": i}, maxlen=100)
+
+
+def per_operation_us(client, operations, batch):
+    """Tiempo medio por sesión en microsegundos (batch=None: sin pipeline)"""
+    start = time.perf_counter()
+    if batch is None:
+        for i in range(operations):
+            session_commands(client, i)
+    else:
+        pipe = client.pipeline()
+        for i in range(operations):
+            session_commands(pipe, i)
+            if len(pipe) >= batch * 5:
+                pipe.execute()
+        pipe.execute()
+    return (time.perf_counter() - start) / operations * 1e6
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print(f"{'modo':>14} {'µs/sesión':>10} {'adquisiciones':>14}")
+    for batch in (None, *BATCHES):
+        client = InMemoryRedis()
+        us = per_operation_us(client, operations, batch)
+        label = 'sin pipeline' if batch is None else f"pipeline x{batch}"
+        print(f"{label:>14} {us:>10.2f} {client.get_lock_stats()['acquisitions']:>14}")
+
+
+if __name__ == "__main__":
+    main()
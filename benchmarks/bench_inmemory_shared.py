@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark del simulador compartido entre procesos (SharedMemoryRedis)
+Compara el coste por operación con el simulador por proceso (InMemoryRedis)
+y mide el throughput agregado con varios procesos sobre el mismo archivo
+
+Uso: python benchmarks/bench_inmemory_shared.py [operaciones]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from redis_alternative import InMemoryRedis
+from redis_shared_memory import SharedMemoryRedis
+
+PROCESSES = (1, 2, 4)
+USERS = 1000
+
+
+def per_operation_us(func, operations):
+    """Tiempo medio por operación en microsegundos"""
+    start = time.perf_counter()
+    for i in range(operations):
+        func(i)
+    return (time.perf_counter() - start) / operations * 1e6
+
+
+def bench_commands(client, operations):
+    return {
+        'setex': per_operation_us(lambda i: client.setex(f"revoked_token:{{u:{i % USERS}}}:{i}", 60, "1"), operations),
+        'get': per_operation_us(lambda i: client.get(f"revoked_token:{{u:{i % USERS}}}:{i}"), operations),
+        'hset': per_operation_us(lambda i: client.hset(f"session:{{u:{i % USERS}}}:s1", "last_seen", i), operations),
+        'lpush_ltrim': per_operation_us(
+            lambda i: (client.lpush(f"audit:{{u:{i % USERS}}}", i), client.ltrim(f"audit:{{u:{i % USERS}}}", 0, 9)),
+            operations
+        ),
+    }
+
+
+def worker(path, operations, results):
+    client = SharedMemoryRedis(path) if path else InMemoryRedis()
+    start = time.perf_counter()
+    for i in range(operations):
+        key = f"revoked_token:{{u:{(os.getpid() + i) % USERS}}}:{i}"
+        client.setex(key, 60, "1")
+        client.get(key)
+    results.put(2 * operations / (time.perf_counter() - start))
+
+
+def bench_processes(path, processes, operations):
+    """Throughput agregado (ops/s) de varios procesos"""
+    results = Queue()
+    workers = [Process(target=worker, args=(path, operations, results)) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    return sum(results.get() for _ in workers)
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    path = os.path.join(tempfile.gettempdir(), f"bench_shared_redis_{os.getpid()}")
+    try:
+        local = bench_commands(InMemoryRedis(), operations)
+        shared = bench_commands(SharedMemoryRedis(path), operations)
+        print(f"{'comando':>12} {'local':>10} {'compartido':>11}   (µs/op)")
+        for command in local:
+            print(f"{command:>12} {local[command]:>10.2f} {shared[command]:>11.2f}")
+
+        print(f"\n{'procesos':>8} {'local ops/s':>12} {'compartido ops/s':>17}")
+        for processes in PROCESSES:
+            print(f"{processes:>8} {bench_processes(None, processes, operations):>12.0f} "
+                  f"{bench_processes(path, processes, operations):>17.0f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark de conjuntos ordenados de InMemoryRedis
+Mide el coste por ZADD/ZREM/ZPOPMIN/ZRANGEBYSCORE con conjuntos de distintos
+tamaños y lo compara con la implementación anterior (lista ordenada con
+bisect.insort), que desplaza la lista en cada inserción o borrado
+
+Uso: python benchmarks/bench_inmemory_zsets.py [tamaño_máximo]
+"""
+
+import bisect
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from redis_alternative import InMemoryRedis
+
+OPERATIONS = 10000
+
+
+def per_operation_us(func, operations=OPERATIONS):
+    """Tiempo medio por operación en microsegundos"""
+    start = time.perf_counter()
+    for _ in range(operations):
+        func()
+    return (time.perf_counter() - start) / operations * 1e6
+
+
+def bench_size(size):
+    client = InMemoryRedis()
+    for start in range(0, size, 10000):
+        client.zadd("bench:zset", {f"m{i}": random.random() for i in range(start, min(start + 10000, size))})
+    # Los nodos ya creados no cuentan en las colecciones del GC durante la medición
+    gc.collect()
+    counter = iter(range(10 ** 9))
+
+    results = {
+        # ZADD de un miembro nuevo + ZPOPMIN: el tamaño se mantiene, como el tope de sesiones
+        'zadd_zpopmin': per_operation_us(
+            lambda: (client.zadd("bench:zset", {f"x{next(counter)}": random.random()}), client.zpopmin("bench:zset"))
+        ),
+        'zadd_update': per_operation_us(lambda: client.zadd("bench:zset", {"m0": random.random()})),
+        'zrem_zadd': per_operation_us(
+            lambda: (client.zrem("bench:zset", "m1"), client.zadd("bench:zset", {"m1": random.random()}))
+        ),
+        'zrangebyscore': per_operation_us(lambda: client.zrangebyscore("bench:zset", 0.5, 0.5001), 1000),
+    }
+
+    # Implementación anterior: insort y pop(0) desplazan toda la lista
+    legacy = sorted((random.random(), f"m{i}") for i in range(size))
+    results['legacy_add_pop'] = per_operation_us(
+        lambda: (bisect.insort(legacy, (random.random(), "x")), legacy.pop(0)), min(OPERATIONS, 1000)
+    )
+    return results
+
+
+def main():
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    sizes = [size for size in (5, 100, 1000, 100000, 1000000) if size <= max_size]
+    columns = ['zadd_zpopmin', 'zadd_update', 'zrem_zadd', 'zrangebyscore', 'legacy_add_pop']
+
+    print(f"{'tamaño':>10} " + " ".join(f"{column:>14}" for column in columns) + "   (µs/op)")
+    for size in sizes:
+        results = bench_size(size)
+        print(f"{size:>10} " + " ".join(f"{results[column]:>14.3f}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark de emisión de tokens en lote
+Compara crear pares access + refresh con create_access_token y
+create_refresh_token uno a uno frente a create_tokens_batch, que comparte la
+configuración, las expiraciones y la clave preparada entre todo el lote
+
+Uso: python benchmarks/bench_jwt_batch.py [identidades]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, create_tokens_batch
+
+SECRET = 'benchmark-secret-key-de-32-bytes!'
+
+
+def one_by_one(identities):
+    for identity in identities:
+        create_access_token(identity=identity)
+        create_refresh_token(identity=identity)
+
+
+def batched(identities):
+    for _ in create_tokens_batch(identities):
+        pass
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    identities = [f"svc-{i}" for i in range(count)]
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = SECRET
+    JWTManager(app)
+
+    print(f"{'modo':>10} {'tokens/s':>10} {'µs/token':>9}")
+    with app.app_context():
+        for name, func in (('uno a uno', one_by_one), ('lote', batched)):
+            start = time.perf_counter()
+            func(identities)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>10} {count * 2 / elapsed:>10.0f} {elapsed / (count * 2) * 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la decodificación de JWT en flask_jwt_extended
+Compara el camino anterior (jwt.decode sin verificar para el callback de la
+clave, get_unverified_header y jwt.decode verificado: tres parseos de la
+cabecera y dos del payload) con la decodificación en una sola pasada de
+JWTManager, ambas con la caché de tokens verificados desactivada
+
+Uso: python benchmarks/bench_jwt_decode.py [tokens]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import jwt
+from flask import Flask
+
+from flask_jwt_extended import JWTManager, create_access_token
+
+SECRET = 'benchmark-secret-key-de-32-bytes!'
+
+
+def three_pass_decode(encoded_token):
+    """Decodificación previa: parsea la cabecera tres veces y el payload dos"""
+    jwt.decode(encoded_token, algorithms=['HS256'], options={"verify_signature": False})
+    jwt.get_unverified_header(encoded_token)
+    return jwt.decode(encoded_token, SECRET, algorithms=['HS256'])
+
+
+def per_token_us(func, tokens):
+    """Tiempo medio por token en microsegundos"""
+    start = time.perf_counter()
+    for token in tokens:
+        func(token)
+    return (time.perf_counter() - start) / len(tokens) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = SECRET
+    app.config['JWT_VERIFIED_TOKEN_CACHE_SIZE'] = 0
+    manager = JWTManager(app)
+
+    with app.app_context():
+        tokens = [create_access_token(identity=f"user{i}", additional_claims={'sid': f"s{i}"})
+                  for i in range(count)]
+        results = {
+            'tres pasadas': per_token_us(three_pass_decode, tokens),
+            'una pasada': per_token_us(manager._decode_jwt_and_header_from_config, tokens),
+        }
+
+    for name, us in results.items():
+        print(f"{name:>13} {us:>8.2f} µs/token")
+    print(f"{'mejora':>13} {results['tres pasadas'] / results['una pasada']:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark de emisión de tokens en flask_jwt_extended
+Mide tokens por segundo de create_access_token y de un login completo
+(access + refresh con el claim sid, como create_session_tokens en app.py),
+frente a jwt.encode con los mismos claims como referencia de PyJWT
+
+Uso: python benchmarks/bench_jwt_encode.py [tokens]
+"""
+
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import jwt
+from flask import Flask
+
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token
+
+SECRET = 'benchmark-secret-key-de-32-bytes!'
+
+
+def pyjwt_access_token(identity):
+    """Claims de un access token codificados directamente con PyJWT"""
+    now = datetime.now(timezone.utc)
+    return jwt.encode({
+        'fresh': False, 'iat': now, 'jti': str(uuid.uuid4()), 'type': 'access',
+        'sub': identity, 'nbf': now, 'exp': now + timedelta(minutes=15),
+    }, SECRET, 'HS256')
+
+
+def login_tokens(identity):
+    session_id = str(uuid.uuid4())
+    create_access_token(identity=identity, additional_claims={'sid': session_id})
+    create_refresh_token(identity=identity, additional_claims={'sid': session_id})
+
+
+def tokens_per_second(func, count, per_call=1):
+    start = time.perf_counter()
+    for i in range(count):
+        func(f"user{i}")
+    return count * per_call / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = SECRET
+    JWTManager(app)
+
+    with app.app_context():
+        results = {
+            'jwt.encode': tokens_per_second(pyjwt_access_token, count),
+            'access token': tokens_per_second(create_access_token, count),
+            'login (x2)': tokens_per_second(login_tokens, count // 2, per_call=2),
+        }
+
+    for name, rate in results.items():
+        print(f"{name:>13} {rate:>10.0f} tokens/s {1e6 / rate:>8.2f} µs/token")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark del coste de @jwt_required por petición
+Resta el tiempo de la misma vista sin proteger (contexto de petición incluido)
+para aislar lo que añade el decorador: búsqueda del token en las ubicaciones
+configuradas, decodificación (con la caché de tokens verificados activa),
+blocklist y carga del contexto del JWT
+
+Uso: python benchmarks/bench_jwt_required.py [peticiones]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+
+SECRET = 'benchmark-secret-key-de-32-bytes!'
+SCENARIOS = {
+    'headers': ('headers', lambda token: {'headers': {'Authorization': f"Bearer {token}"}}),
+    'cookies': (['cookies', 'headers'], lambda token: {'headers': {'Cookie': f"access_token_cookie={token}"}}),
+    'query_string': (['headers', 'query_string'], lambda token: {'query_string': {'jwt': token}}),
+}
+
+
+def build_app(locations):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = SECRET
+    app.config['JWT_TOKEN_LOCATION'] = locations
+    app.config['JWT_COOKIE_CSRF_PROTECT'] = False
+    jwt = JWTManager(app)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return False
+
+    def view():
+        return ''
+
+    app.add_url_rule('/bare', 'bare', view)
+    app.add_url_rule('/protected', 'protected', jwt_required()(view))
+    with app.app_context():
+        token = create_access_token(identity='user')
+    return app, token
+
+
+def per_request_us(app, endpoint, request_kwargs, requests):
+    """Tiempo medio por petición en microsegundos"""
+    view = app.view_functions[endpoint]
+    start = time.perf_counter()
+    for _ in range(requests):
+        with app.test_request_context(f"/{endpoint}", **request_kwargs):
+            view()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print(f"{'ubicación':>13} {'sin JWT':>9} {'con JWT':>9} {'decorador':>10}   (µs/petición)")
+    for name, (locations, request_kwargs) in SCENARIOS.items():
+        app, token = build_app(locations)
+        kwargs = request_kwargs(token)
+        bare = per_request_us(app, 'bare', kwargs, requests)
+        protected = per_request_us(app, 'protected', kwargs, requests)
+        print(f"{name:>13} {bare:>9.2f} {protected:>9.2f} {protected - bare:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la caché de tokens verificados de flask_jwt_extended
+Mide el coste de una petición protegida con @jwt_required (decodificación,
+verificación de firma, blocklist y verificación de claims) con la caché
+desactivada y activada, repitiendo un conjunto de tokens como haría un
+cliente real durante la vida de su access token
+
+Uso: python benchmarks/bench_jwt_verified_cache.py [peticiones]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+
+TOKENS = 100
+
+
+def build_app(cache_size):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'benchmark-secret-key-de-32-bytes!'
+    app.config['JWT_VERIFIED_TOKEN_CACHE_SIZE'] = cache_size
+    jwt = JWTManager(app)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return False
+
+    @app.route('/protected')
+    @jwt_required()
+    def protected():
+        return ''
+
+    with app.app_context():
+        tokens = [create_access_token(identity=f"user{i}") for i in range(TOKENS)]
+    return app, jwt, tokens
+
+
+def per_request_us(cache_size, requests):
+    """Tiempo medio por verificación en microsegundos"""
+    app, jwt, tokens = build_app(cache_size)
+    view = app.view_functions['protected']
+    headers = [{'Authorization': f"Bearer {token}"} for token in tokens]
+    start = time.perf_counter()
+    for i in range(requests):
+        with app.test_request_context('/protected', headers=headers[i % TOKENS]):
+            view()
+    return (time.perf_counter() - start) / requests * 1e6, jwt.get_verified_token_cache_stats()
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print(f"{'caché':>8} {'µs/petición':>12} {'aciertos':>9}")
+    for cache_size in (0, 1024):
+        us, stats = per_request_us(cache_size, requests)
+        hit_rate = f"{stats['hit_rate']:.2%}" if stats['enabled'] else '-'
+        print(f"{cache_size:>8} {us:>12.2f} {hit_rate:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark del servidor RESP sobre InMemoryRedis
+Compara el coste por operación llamando al simulador directamente con el de
+usar el cliente redis real por localhost (RESP2 y RESP3), que incluye la red
+y la serialización igual que contra un Redis de producción
+
+Uso: python benchmarks/bench_resp_server.py [operaciones]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import redis
+
+from redis_alternative import InMemoryRedis
+from resp_server import RespServer
+
+USERS = 1000
+
+
+def per_operation_us(func, operations):
+    """Tiempo medio por operación en microsegundos"""
+    start = time.perf_counter()
+    for i in range(operations):
+        func(i)
+    return (time.perf_counter() - start) / operations * 1e6
+
+
+def bench_commands(client, operations):
+    def pipelined(i):
+        pipe = client.pipeline(transaction=False)
+        pipe.hset(f"session:{{u:{i % USERS}}}:s1", "last_seen", i)
+        pipe.expire(f"session:{{u:{i % USERS}}}:s1", 3600)
+        pipe.lpush(f"audit_log_list:{{u:{i % USERS}}}", i)
+        pipe.ltrim(f"audit_log_list:{{u:{i % USERS}}}", 0, 99)
+        pipe.execute()
+
+    return {
+        'setex': per_operation_us(lambda i: client.setex(f"revoked_token:{{u:{i % USERS}}}:{i}", 60, "1"), operations),
+        'get': per_operation_us(lambda i: client.get(f"revoked_token:{{u:{i % USERS}}}:{i}"), operations),
+        'hgetall': per_operation_us(lambda i: client.hgetall(f"session:{{u:{i % USERS}}}:s1"), operations),
+        'pipeline x4': per_operation_us(pipelined, operations),
+    }
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    server = RespServer(InMemoryRedis(), port=0).start_in_thread()
+    try:
+        results = {
+            'directo': bench_commands(InMemoryRedis(), operations),
+            'RESP2': bench_commands(redis.Redis(port=server.port, decode_responses=True), operations),
+            'RESP3': bench_commands(redis.Redis(port=server.port, decode_responses=True, protocol=3), operations),
+        }
+    finally:
+        server.stop()
+
+    print(f"{'comando':>12} " + ' '.join(f"{mode:>9}" for mode in results) + "   (µs/op)")
+    for command in results['directo']:
+        print(f"{command:>12} " + ' '.join(f"{results[mode][command]:>9.2f}" for mode in results))
+
+
+if __name__ == "__main__":
+    main()
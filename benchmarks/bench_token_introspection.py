@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark de introspección de tokens en lote
+Compara lo que hace hoy un gateway (una petición a un endpoint protegido por
+token, con su GET de revocación en Redis) frente a /api/tokens/introspect,
+que valida muchos tokens por petición y resuelve su revocación con un MGET.
+Redis es el simulador en memoria servido por RESP en localhost, así cada
+consulta paga un viaje de red como contra un Redis real
+
+Uso: python benchmarks/bench_token_introspection.py [tokens] [tokens_por_petición]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import redis
+from flask import Flask, jsonify, request
+
+from flask_jwt_extended import JWTManager, create_access_token, decode_token, jwt_required
+from redis_alternative import InMemoryRedis
+from resp_server import RespServer
+
+SECRET = 'benchmark-secret-key-de-32-bytes!'
+REVOKED_EVERY = 10
+
+
+def revoked_key(claims):
+    return f"revoked_token:{{u:{claims['sub']}}}:{claims['jti']}"
+
+
+def create_app(client):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = SECRET
+    # Sin caché de tokens verificados: ambos modos pagan la verificación completa
+    app.config['JWT_VERIFIED_TOKEN_CACHE_SIZE'] = 0
+    jwt = JWTManager(app)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return client.get(revoked_key(jwt_payload)) is not None
+
+    @app.route('/api/check')
+    @jwt_required()
+    def check():
+        return jsonify({'active': True})
+
+    @app.route('/api/introspect', methods=['POST'])
+    def introspect():
+        claims = [decode_token(token) for token in request.get_json()['tokens']]
+        revoked = client.mget([revoked_key(c) for c in claims])
+        return jsonify({'results': [{'active': value is None} for value in revoked]})
+
+    return app
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    per_request = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    server = RespServer(InMemoryRedis(), port=0).start_in_thread()
+    try:
+        client = redis.Redis(port=server.port, decode_responses=True)
+        app = create_app(client)
+        with app.app_context():
+            tokens = [create_access_token(identity=f"u{i}") for i in range(count)]
+            for token in tokens[::REVOKED_EVERY]:
+                client.setex(revoked_key(decode_token(token)), 3600, '1')
+        test_client = app.test_client()
+
+        start = time.perf_counter()
+        for token in tokens:
+            test_client.get('/api/check', headers={'Authorization': f"Bearer {token}"})
+        one_by_one = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, count, per_request):
+            test_client.post('/api/introspect', json={'tokens': tokens[i:i + per_request]})
+        batched = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    print(f"{'modo':>12} {'peticiones':>11} {'tokens/s':>10} {'µs/token':>9}")
+    for name, requests, elapsed in (('uno a uno', count, one_by_one),
+                                    (f"lote de {per_request}", -(-count // per_request), batched)):
+        print(f"{name:>12} {requests:>11} {count / elapsed:>10.0f} {elapsed / count * 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Estrategias de blocklist para verificar tokens JWT revocados
+- sql: consulta la tabla revoked_tokens en cada verificación
+- redis: caché local (L1) y Redis (L2)
+- tiered: caché local (L1), Redis (L2) y SQL como fuente de verdad (L3);
+  mientras Redis esté reconciliado con SQL, un negativo de Redis es definitivo
+Se elige por despliegue con JWT_BLOCKLIST_BACKEND
+Si ningún nivel fiable responde se lanza BlocklistUnavailableError (503): un
+token cuya revocación no se pudo comprobar nunca se acepta
+"""
+
+import logging
+from threading import Lock
+from config import Config
+from models import BlocklistUnavailableError, RevokedToken
+from redis_manager import redis_manager
+from revocation_sync import revocation_sync
+
+logger = logging.getLogger(__name__)
+
+# Niveles consultados por cada estrategia: (caché local, Redis, SQL)
+BACKENDS = {
+    'sql': (False, False, True),
+    'redis': (True, True, False),
+    'tiered': (True, True, True)
+}
+
+
+class TierStats:
+    """Contadores de un nivel: resuelto aquí (hit), pasa al siguiente (miss) o error"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    def record(self, outcome, count=1):
+        with self.lock:
+            self.counts[outcome] += count
+
+    def get_metrics(self):
+        lookups = self.counts['hits'] + self.counts['misses']
+        return {
+            **self.counts,
+            'hit_rate': round(self.counts['hits'] / lookups, 4) if lookups else 0.0
+        }
+
+
+class Blocklist:
+    """Verificación y revocación de tokens sobre los niveles de una estrategia"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.use_cache, self.use_redis, self.use_sql = BACKENDS[backend]
+        # La caché local es la del RedisManager: se invalida por pub/sub y
+        # solo está activa mientras el suscriptor de invalidaciones funciona
+        self.cache = redis_manager.revocation_cache
+        self.tiers = {}
+        if self.use_cache:
+            self.tiers['l1_local'] = TierStats()
+        if self.use_redis:
+            self.tiers['l2_redis'] = TierStats()
+        if self.use_sql:
+            self.tiers['l3_sql'] = TierStats()
+
+    def is_revoked(self, jti, user_id, token_exp=None):
+        """Verificar si un token está revocado recorriendo los niveles en orden"""
+        generation = None
+        if self.use_cache:
+            cached = self.cache.get(jti)
+            if cached is not None:
+                self.tiers['l1_local'].record('hits')
+                return cached
+            self.tiers['l1_local'].record('misses')
+            generation = self.cache.generation
+
+        revoked, reliable = self._lookup(jti, user_id)
+        # Los negativos quedan acotados por exp (y el TTL negativo de la caché)
+        if self.use_cache and reliable:
+            self.cache.set(jti, revoked, token_exp, generation)
+        return revoked
+
+    def _lookup(self, jti, user_id):
+        """Consultar Redis y SQL; devuelve (revocado, resultado_cacheable)"""
+        redis_ok = True
+        if self.use_redis:
+            revoked = redis_manager.lookup_token_revoked(jti, user_id)
+            if revoked is None:
+                redis_ok = False
+                self.tiers['l2_redis'].record('errors')
+                if not self.use_sql:
+                    raise BlocklistUnavailableError("Redis no disponible para verificar revocaciones")
+            elif revoked or not self.use_sql or revocation_sync.redis_in_sync():
+                self.tiers['l2_redis'].record('hits')
+                return revoked, True
+            else:
+                self.tiers['l2_redis'].record('misses')
+
+        try:
+            revoked = RevokedToken.is_revoked(jti)
+        except Exception as e:
+            self.tiers['l3_sql'].record('errors')
+            raise BlocklistUnavailableError(f"SQL no disponible para verificar revocaciones: {e}") from e
+        self.tiers['l3_sql'].record('hits')
+        # Sin Redis no se conocen las revocaciones hechas solo en Redis:
+        # un negativo en ese caso no se cachea
+        return revoked, revoked or redis_ok
+
+    def are_revoked(self, tokens):
+        """Verificar varios tokens (jti, user_id, exp) con una consulta por nivel"""
+        results = [None] * len(tokens)
+        pending = list(range(len(tokens)))
+        generation = None
+        if self.use_cache:
+            generation = self.cache.generation
+            pending = []
+            for i, (jti, _, _) in enumerate(tokens):
+                cached = self.cache.get(jti)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    results[i] = cached
+            self.tiers['l1_local'].record('hits', len(tokens) - len(pending))
+            self.tiers['l1_local'].record('misses', len(pending))
+
+        for i, (revoked, reliable) in self._lookup_many(tokens, pending).items():
+            results[i] = revoked
+            if self.use_cache and reliable:
+                self.cache.set(tokens[i][0], revoked, tokens[i][2], generation)
+        return results
+
+    def _lookup_many(self, tokens, pending):
+        """Como _lookup, con un MGET en Redis y un IN en SQL; devuelve {índice: (revocado, cacheable)}"""
+        found = {}
+        redis_ok = True
+        if self.use_redis and pending:
+            revoked = redis_manager.lookup_tokens_revoked([tokens[i][:2] for i in pending])
+            if revoked is None:
+                redis_ok = False
+                self.tiers['l2_redis'].record('errors', len(pending))
+                if not self.use_sql:
+                    raise BlocklistUnavailableError("Redis no disponible para verificar revocaciones")
+            else:
+                in_sync = self.use_sql and revocation_sync.redis_in_sync()
+                misses = []
+                for i, is_revoked in zip(pending, revoked):
+                    if is_revoked or not self.use_sql or in_sync:
+                        found[i] = (is_revoked, True)
+                    else:
+                        misses.append(i)
+                self.tiers['l2_redis'].record('hits', len(pending) - len(misses))
+                self.tiers['l2_redis'].record('misses', len(misses))
+                pending = misses
+
+        if self.use_sql and pending:
+            try:
+                revoked_jtis = RevokedToken.revoked_among([tokens[i][0] for i in pending])
+            except Exception as e:
+                self.tiers['l3_sql'].record('errors', len(pending))
+                raise BlocklistUnavailableError(f"SQL no disponible para verificar revocaciones: {e}") from e
+            self.tiers['l3_sql'].record('hits', len(pending))
+            for i in pending:
+                revoked = tokens[i][0] in revoked_jtis
+                found[i] = (revoked, revoked or redis_ok)
+        return found
+
+    def revoke(self, jti, token_type, user_id, expires_at):
+        """Revocar un token en SQL (fuente de verdad) y copiarlo a Redis antes de responder"""
+        saved = RevokedToken(jti, token_type, user_id, expires_at).save()
+        if saved:
+            # Síncrono: en cuanto el logout responde, un negativo de Redis ya es
+            # fiable en todos los workers (o el marcador compartido se borró)
+            revocation_sync.write_redis(jti, token_type, user_id, expires_at)
+        return saved
+
+    def record_redis_revocation(self, jti, token_type, user_id, expires_at):
+        """Copiar a SQL en segundo plano una revocación hecha primero en Redis"""
+        revocation_sync.write_sql_async(jti, token_type, user_id, expires_at)
+
+    def get_metrics(self):
+        return {
+            'backend': self.backend,
+            'tiers': {name: stats.get_metrics() for name, stats in self.tiers.items()},
+            'sync': revocation_sync.get_metrics()
+        }
+
+
+def create_blocklist(backend=None):
+    """Crear la blocklist configurada (JWT_BLOCKLIST_BACKEND)"""
+    backend = (backend or Config.JWT_BLOCKLIST_BACKEND).lower()
+    if backend not in BACKENDS:
+        logger.warning(f"Backend de blocklist desconocido '{backend}', usando 'tiered'")
+        backend = 'tiered'
+    logger.info(f"Blocklist de tokens usando backend '{backend}'")
+    return Blocklist(backend)
+
+
+# Instancia global de la blocklist
+blocklist = create_blocklist()
@@ -18,11 +18,57 @@ class Config:
     REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', None)
     REDIS_DB = int(os.getenv('REDIS_DB', 0))
     REDIS_DECODE_RESPONSES = True
+    REDIS_MODE = os.getenv('REDIS_MODE', 'single')  # single | sharded | cluster
+    REDIS_PROTOCOL = int(os.getenv('REDIS_PROTOCOL', 2))  # 2 (RESP2) | 3 (RESP3)
+    REDIS_NODES = os.getenv('REDIS_NODES', '')  # host:port,host:port (sharded/cluster)
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 2))
+    REDIS_HEALTH_CHECK_INTERVAL = float(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))  # segundos
+    REDIS_BACKOFF_BASE = float(os.getenv('REDIS_BACKOFF_BASE', 0.5))  # segundos
+    REDIS_BACKOFF_MAX = float(os.getenv('REDIS_BACKOFF_MAX', 60))  # segundos
+    REVOCATION_CACHE_SIZE = int(os.getenv('REVOCATION_CACHE_SIZE', 10000))
+    REVOCATION_CACHE_NEGATIVE_TTL = float(os.getenv('REVOCATION_CACHE_NEGATIVE_TTL', 30))  # segundos
+    REVOCATION_CHANNEL = os.getenv('REVOCATION_CHANNEL', 'revocation_invalidations')
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 60))  # segundos
+    AUDIT_LOG_MAX_ENTRIES = int(os.getenv('AUDIT_LOG_MAX_ENTRIES', 1000))  # por usuario en Redis
+    INMEMORY_BACKEND = os.getenv('INMEMORY_BACKEND', 'local')  # local (por proceso) | shared (entre procesos del host)
+    INMEMORY_SHARED_PATH = os.getenv('INMEMORY_SHARED_PATH', '')  # vacío = /dev/shm/jwt_inmemory_redis
+    INMEMORY_SHARED_SLOTS = int(os.getenv('INMEMORY_SHARED_SLOTS', 8192))  # por shard
+    INMEMORY_SHARED_SLOT_SIZE = int(os.getenv('INMEMORY_SHARED_SLOT_SIZE', 256))  # bytes
+    INMEMORY_PERSISTENCE_DIR = os.getenv('INMEMORY_PERSISTENCE_DIR', '')  # vacío = simulador sin persistencia; un solo proceso escritor por directorio
+    INMEMORY_AOF_FSYNC = os.getenv('INMEMORY_AOF_FSYNC', 'everysec')  # always | everysec | no
+    INMEMORY_SNAPSHOT_INTERVAL = float(os.getenv('INMEMORY_SNAPSHOT_INTERVAL', 300))  # segundos, 0 = solo al compactar
+    INMEMORY_AOF_REWRITE_SIZE = int(os.getenv('INMEMORY_AOF_REWRITE_SIZE', 64 * 1024 * 1024))  # bytes, 0 = sin compactación por tamaño
+    INMEMORY_MAXMEMORY = int(os.getenv('INMEMORY_MAXMEMORY', 0))  # bytes aproximados, 0 = sin límite
+    INMEMORY_MAXMEMORY_POLICY = os.getenv('INMEMORY_MAXMEMORY_POLICY', 'volatile-lru')  # noeviction | volatile-lru | allkeys-lru | volatile-lfu | allkeys-lfu | volatile-ttl
+    INMEMORY_MAXMEMORY_PROTECTED = [n.strip() for n in os.getenv(
+        'INMEMORY_MAXMEMORY_PROTECTED',
+        'revoked_token,user_revoked_tokens,session,user_sessions,revocation_events_seq,revocation_sync'
+    ).split(',') if n.strip()]  # espacios de nombres que nunca se desalojan: solo se pierden auditoría y cachés
+    INMEMORY_MAXMEMORY_SAMPLES = int(os.getenv('INMEMORY_MAXMEMORY_SAMPLES', 5))  # claves muestreadas por desalojo
+    SESSION_TTL = int(os.getenv('SESSION_TTL', 3600))  # segundos, se renueva con cada refresh
+    MAX_SESSIONS_PER_USER = int(os.getenv('MAX_SESSIONS_PER_USER', 5))  # 0 = sin límite
     
     # Configuración JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-super-secret-jwt-key-change-this-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 900)))  # 15 minutos
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(seconds=int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 2592000)))  # 30 días
+    JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')  # HS256 | RS256 | ES256 | EdDSA
+    JWT_KEYS_DIR = os.getenv('JWT_KEYS_DIR', 'jwt_keys')  # claves privadas rotadas (solo algoritmos asimétricos)
+    JWT_KEY_ROTATION_INTERVAL = int(os.getenv('JWT_KEY_ROTATION_INTERVAL', 7 * 24 * 3600))  # segundos, 0 = sin rotación
+    JWT_KEY_RETIRE_AFTER = int(os.getenv('JWT_KEY_RETIRE_AFTER', JWT_REFRESH_TOKEN_EXPIRES.total_seconds()))  # segundos que una clave rotada sigue verificando
+    JWKS_MAX_AGE = int(os.getenv('JWKS_MAX_AGE', 300))  # segundos de caché de /.well-known/jwks.json
+    JWT_BLOCKLIST_BACKEND = os.getenv('JWT_BLOCKLIST_BACKEND', 'tiered')  # sql | redis | tiered
+    JWT_VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv('JWT_VERIFIED_TOKEN_CACHE_SIZE', 1024))  # tokens verificados en caché, 0 = desactivada
+    ADMIN_USERS = [u.strip() for u in os.getenv('ADMIN_USERS', '').split(',') if u.strip()]  # usernames con acceso a las rutas /api/admin que modifican estado
+    SERVICE_ACCOUNT_PREFIX = os.getenv('SERVICE_ACCOUNT_PREFIX', 'svc-')  # identidades permitidas en /api/admin/tokens/batch (nunca ids de usuario)
+    TOKEN_BATCH_MAX_IDENTITIES = int(os.getenv('TOKEN_BATCH_MAX_IDENTITIES', 10000))  # identidades por llamada a /api/admin/tokens/batch
+    TOKEN_BATCH_MAX_EXPIRES = int(os.getenv('TOKEN_BATCH_MAX_EXPIRES', 86400))  # segundos, tope de expires_in en /api/admin/tokens/batch
+    TOKEN_INTROSPECTION_MAX_TOKENS = int(os.getenv('TOKEN_INTROSPECTION_MAX_TOKENS', 500))  # tokens por llamada a /api/tokens/introspect
+    TOKEN_BATCH_WORKERS = int(os.getenv('TOKEN_BATCH_WORKERS', 0))  # hilos de firma en lote (solo algoritmos asimétricos)
+    REVOCATION_QUEUE_SIZE = int(os.getenv('REVOCATION_QUEUE_SIZE', 10000))
+    REVOCATION_RECONCILE_INTERVAL = float(os.getenv('REVOCATION_RECONCILE_INTERVAL', 60))  # segundos
     
     # Configuración de la aplicación
     FLASK_ENV = os.getenv('FLASK_ENV', 'development')
@@ -131,10 +131,11 @@ class Database:
             CREATE TABLE IF NOT EXISTS token_audit (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 user_id INT NOT NULL,
-                action ENUM('login', 'logout', 'refresh', 'revoke') NOT NULL,
+                action ENUM('login', 'logout', 'refresh', 'revoke', 'issue_batch') NOT NULL,
                 token_jti VARCHAR(36),
                 ip_address VARCHAR(45),
                 user_agent TEXT,
+                details MEDIUMTEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
             )
@@ -145,6 +146,13 @@ class Database:
             self.execute_query(revoked_tokens_table)
             self.execute_query(token_audit_table)
             
+            # Migrar tablas token_audit creadas antes de la emisión en lote
+            self.execute_update(
+                "ALTER TABLE token_audit MODIFY action "
+                "ENUM('login', 'logout', 'refresh', 'revoke', 'issue_batch') NOT NULL"
+            )
+            self.execute_update("ALTER TABLE token_audit ADD COLUMN IF NOT EXISTS details MEDIUMTEXT")
+            
             logger.info("Tablas creadas exitosamente")
             return True
         except Error as e:
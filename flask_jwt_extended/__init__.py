@@ -1,6 +1,7 @@
 from .jwt_manager import JWTManager as JWTManager
 from .utils import create_access_token as create_access_token
 from .utils import create_refresh_token as create_refresh_token
+from .utils import create_tokens_batch as create_tokens_batch
 from .utils import current_user as current_user
 from .utils import decode_token as decode_token
 from .utils import get_csrf_token as get_csrf_token
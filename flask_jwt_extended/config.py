@@ -2,6 +2,8 @@ from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
 from json import JSONEncoder
+from typing import Any
+from typing import Dict
 from typing import Iterable
 from typing import List
 from typing import Optional
@@ -10,6 +12,7 @@ from typing import Type
 from typing import Union
 
 from flask import current_app
+from flask import Flask
 from jwt.algorithms import requires_cryptography
 
 from flask_jwt_extended.internal_utils import get_json_encoder
@@ -312,4 +315,87 @@ class _Config(object):
         return current_app.config["JWT_ENCODE_NBF"]
 
 
-config = _Config()
+# Every public option of _Config, compiled once per app by FrozenConfig
+_OPTION_NAMES = tuple(
+    name
+    for name, value in vars(_Config).items()
+    if isinstance(value, property) and not name.startswith("_")
+)
+
+# Options that are only looked up, frozen so the snapshot can not be mutated
+_FROZEN_SEQUENCES = {"decode_algorithms", "token_location"}
+_FROZEN_SETS = {"csrf_request_methods", "exempt_methods"}
+
+
+class FrozenConfig(object):
+    """
+    Immutable snapshot of the options of :class:`_Config` for one flask app.
+
+    :meth:`JWTManager.init_app` compiles it once, so the hot paths read plain
+    attributes instead of going through ``current_app.config`` and repeating
+    the validation on every request. Options that can not be computed yet
+    (for example a missing ``JWT_SECRET_KEY``) raise the same ``RuntimeError``
+    as :class:`_Config` when they are accessed. Changes made to
+    ``app.config`` after ``init_app`` take effect after calling
+    :meth:`JWTManager.refresh_config`.
+    """
+
+    def __init__(self, app: Flask) -> None:
+        live = _Config()
+        values: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        with app.app_context():
+            for name in _OPTION_NAMES:
+                try:
+                    value = getattr(live, name)
+                except RuntimeError as e:
+                    errors[name] = str(e)
+                    continue
+                if name in _FROZEN_SEQUENCES:
+                    value = tuple(value)
+                elif name in _FROZEN_SETS:
+                    value = frozenset(value)
+                values[name] = value
+        self.__dict__.update(values)
+        self.__dict__["_errors"] = errors
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for the options that failed to compile
+        errors = self.__dict__.get("_errors", {})
+        if name in errors:
+            raise RuntimeError(errors[name])
+        raise AttributeError(name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("The JWT config is read only, use refresh_config()")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("The JWT config is read only, use refresh_config()")
+
+
+def get_config() -> FrozenConfig:
+    """
+    Returns the compiled config of the current app. Hot paths keep the result
+    in a local variable instead of going through the ``config`` proxy for
+    every option.
+    """
+    try:
+        return current_app.extensions["flask-jwt-extended-config"]
+    except KeyError:  # pragma: no cover
+        raise RuntimeError(
+            "You must initialize a JWTManager with this flask "
+            "application before using this method"
+        ) from None
+
+
+class _ConfigProxy(object):
+    """
+    Module level ``config`` object, forwards attribute access to the compiled
+    config of the current app.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_config(), name)
+
+
+config: _Config = _ConfigProxy()  # type: ignore
@@ -1,9 +1,19 @@
 import datetime
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 from typing import Callable
+from typing import Deque
+from typing import Iterable
+from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import Union
 
-import jwt
+from flask import current_app
 from flask import Flask
 from jwt import DecodeError
 from jwt import ExpiredSignatureError
@@ -12,7 +22,8 @@ from jwt import InvalidIssuerError
 from jwt import InvalidTokenError
 from jwt import MissingRequiredClaimError
 
-from flask_jwt_extended.config import config
+from flask_jwt_extended.config import FrozenConfig
+from flask_jwt_extended.config import get_config
 from flask_jwt_extended.default_callbacks import default_additional_claims_callback
 from flask_jwt_extended.default_callbacks import default_blocklist_callback
 from flask_jwt_extended.default_callbacks import default_decode_key_callback
@@ -39,8 +50,16 @@ from flask_jwt_extended.exceptions import RevokedTokenError
 from flask_jwt_extended.exceptions import UserClaimsVerificationError
 from flask_jwt_extended.exceptions import UserLookupError
 from flask_jwt_extended.exceptions import WrongTokenError
+from flask_jwt_extended.token_cache import cache_options
+from flask_jwt_extended.token_cache import VerifiedTokenCache
 from flask_jwt_extended.tokens import _decode_jwt
-from flask_jwt_extended.tokens import _encode_jwt
+from flask_jwt_extended.tokens import _issue_time
+from flask_jwt_extended.tokens import _IssueTime
+from flask_jwt_extended.tokens import _parse_jwt
+from flask_jwt_extended.tokens import _sign_jwt
+from flask_jwt_extended.tokens import _sign_jwts
+from flask_jwt_extended.tokens import _token_data
+from flask_jwt_extended.tokens import _verify_csrf
 from flask_jwt_extended.typing import ExpiresDelta
 from flask_jwt_extended.typing import Fresh
 from flask_jwt_extended.utils import current_user_context_processor
@@ -91,6 +110,9 @@ class JWTManager(object):
             default_token_verification_failed_callback
         )
 
+        # Created in init_app from JWT_VERIFIED_TOKEN_CACHE_SIZE
+        self._verified_token_cache: Optional[VerifiedTokenCache] = None
+
         # Register this extension with the flask app now (if it is provided)
         if app is not None:
             self.init_app(app, add_context_processor)
@@ -118,6 +140,28 @@ class JWTManager(object):
         self._set_default_configuration_options(app)
         self._set_error_handler_callbacks(app)
 
+        cache_size = app.config["JWT_VERIFIED_TOKEN_CACHE_SIZE"]
+        self._verified_token_cache = (
+            VerifiedTokenCache(cache_size) if cache_size else None
+        )
+        self.refresh_config(app)
+
+    def refresh_config(self, app: Optional[Flask] = None) -> None:
+        """
+        Compile the ``JWT_*`` options of the app into the read only snapshot
+        used by this extension. This runs in :meth:`init_app`; call it again
+        after changing any of those options in ``app.config`` at runtime
+        (like rotating ``JWT_SECRET_KEY``).
+
+        :param app:
+            The Flask Application object. Defaults to the current app.
+        """
+        if app is None:
+            app = current_app._get_current_object()  # type: ignore
+        app.extensions["flask-jwt-extended-config"] = FrozenConfig(app)
+        if self._verified_token_cache is not None:
+            self._verified_token_cache.clear()
+
     def _set_error_handler_callbacks(self, app: Flask) -> None:
         @app.errorhandler(CSRFError)
         def handle_csrf_error(e):
@@ -229,6 +273,7 @@ class JWTManager(object):
         app.config.setdefault("JWT_SESSION_COOKIE", True)
         app.config.setdefault("JWT_TOKEN_LOCATION", ("headers",))
         app.config.setdefault("JWT_ENCODE_NBF", True)
+        app.config.setdefault("JWT_VERIFIED_TOKEN_CACHE_SIZE", 1024)
 
     def additional_claims_loader(self, callback: Callable) -> Callable:
         """
@@ -498,6 +543,35 @@ class JWTManager(object):
         expires_delta: Optional[ExpiresDelta] = None,
         headers=None,
     ) -> str:
+        cfg = get_config()
+        if expires_delta is None:
+            if token_type == "access":
+                expires_delta = cfg.access_expires
+            else:
+                expires_delta = cfg.refresh_expires
+
+        return _sign_jwt(
+            cfg.algorithm,
+            cfg.json_encoder,
+            *self._prepare_jwt(
+                cfg, identity, token_type, claims, fresh, expires_delta, headers
+            ),
+        )
+
+    def _prepare_jwt(
+        self,
+        cfg: FrozenConfig,
+        identity: Any,
+        token_type: str,
+        claims: Optional[dict],
+        fresh: Fresh,
+        expires_delta: ExpiresDelta,
+        headers: Optional[dict],
+        issue_time: Optional[_IssueTime] = None,
+        secret: Any = None,
+    ) -> Tuple[dict, Any, dict]:
+        # Runs the callbacks and builds the claims, returning the
+        # (header_overrides, secret, token_data) that _sign_jwt expects
         header_overrides = self._jwt_additional_header_callback(identity)
         if headers is not None:
             header_overrides.update(headers)
@@ -506,58 +580,193 @@ class JWTManager(object):
         if claims is not None:
             claim_overrides.update(claims)
 
-        if expires_delta is None:
-            if token_type == "access":
-                expires_delta = config.access_expires
-            else:
-                expires_delta = config.refresh_expires
-
-        return _encode_jwt(
-            algorithm=config.algorithm,
-            audience=config.encode_audience,
+        token_data = _token_data(
+            audience=cfg.encode_audience,
             claim_overrides=claim_overrides,
-            csrf=config.csrf_protect,
+            csrf=cfg.csrf_protect,
             expires_delta=expires_delta,
             fresh=fresh,
-            header_overrides=header_overrides,
             identity=self._user_identity_callback(identity),
-            identity_claim_key=config.identity_claim_key,
-            issuer=config.encode_issuer,
-            json_encoder=config.json_encoder,
-            secret=self._encode_key_callback(identity),
+            identity_claim_key=cfg.identity_claim_key,
+            issuer=cfg.encode_issuer,
             token_type=token_type,
-            nbf=config.encode_nbf,
+            nbf=cfg.encode_nbf,
+            issue_time=issue_time,
+        )
+        if secret is None:
+            secret = self._encode_key_callback(identity)
+        return header_overrides, secret, token_data
+
+    def _encode_jwt_batch_from_config(
+        self,
+        identities: Iterable[Any],
+        refresh: bool = True,
+        claims: Union[dict, Callable[[Any], dict], None] = None,
+        fresh: Fresh = False,
+        access_expires_delta: Optional[ExpiresDelta] = None,
+        refresh_expires_delta: Optional[ExpiresDelta] = None,
+        headers=None,
+        workers: int = 0,
+        use_processes: bool = False,
+        chunk_size: int = 256,
+    ) -> Iterator[Tuple[Any, str, Optional[str]]]:
+        cfg = get_config()
+        if access_expires_delta is None:
+            access_expires_delta = cfg.access_expires
+        if refresh_expires_delta is None:
+            refresh_expires_delta = cfg.refresh_expires
+        # The default callback returns the same key for every identity
+        secret = None
+        if self._encode_key_callback is default_encode_key_callback:
+            secret = cfg.encode_key
+
+        def chunks() -> Iterator[Tuple[list, list]]:
+            chunk_identities: list = []
+            items: list = []
+            access_time = refresh_time = None
+            for identity in identities:
+                # Every chunk shares its iat/exp timestamps
+                if not chunk_identities:
+                    access_time = _issue_time(access_expires_delta)
+                    refresh_time = _issue_time(refresh_expires_delta, access_time.now)
+                extra_claims = claims(identity) if callable(claims) else claims
+                items.append(
+                    self._prepare_jwt(
+                        cfg,
+                        identity,
+                        "access",
+                        None if extra_claims is None else dict(extra_claims),
+                        fresh,
+                        access_expires_delta,
+                        None if headers is None else dict(headers),
+                        access_time,
+                        secret,
+                    )
+                )
+                if refresh:
+                    items.append(
+                        self._prepare_jwt(
+                            cfg,
+                            identity,
+                            "refresh",
+                            None if extra_claims is None else dict(extra_claims),
+                            False,
+                            refresh_expires_delta,
+                            None if headers is None else dict(headers),
+                            refresh_time,
+                            secret,
+                        )
+                    )
+                chunk_identities.append(identity)
+                if len(chunk_identities) >= chunk_size:
+                    yield chunk_identities, items
+                    chunk_identities, items = [], []
+            if chunk_identities:
+                yield chunk_identities, items
+
+        def results(
+            chunk_identities: list, tokens: List[str]
+        ) -> Iterator[Tuple[Any, str, Optional[str]]]:
+            step = 2 if refresh else 1
+            for i, identity in enumerate(chunk_identities):
+                refresh_token = tokens[i * step + 1] if refresh else None
+                yield identity, tokens[i * step], refresh_token
+
+        # HMAC signing holds the GIL and is cheap next to building the
+        # claims, so only asymmetric algorithms are signed in parallel
+        if workers <= 1 or not cfg.is_asymmetric:
+            for chunk_identities, items in chunks():
+                tokens = _sign_jwts(cfg.algorithm, cfg.json_encoder, items)
+                yield from results(chunk_identities, tokens)
+            return
+
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        executor = executor_class(max_workers=workers)
+        pending: Deque[Tuple[list, Future]] = deque()
+        try:
+            for chunk_identities, items in chunks():
+                future = executor.submit(
+                    _sign_jwts, cfg.algorithm, cfg.json_encoder, items
+                )
+                pending.append((chunk_identities, future))
+                # Keep a bounded window of chunks in flight, in order
+                while len(pending) > workers * 2:
+                    done_identities, done = pending.popleft()
+                    yield from results(done_identities, done.result())
+            while pending:
+                done_identities, done = pending.popleft()
+                yield from results(done_identities, done.result())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def get_verified_token_cache_stats(self) -> dict:
+        """
+        Returns the hit rate and size of the verified token cache. The cache
+        is disabled when ``JWT_VERIFIED_TOKEN_CACHE_SIZE`` is ``0``.
+        """
+        if self._verified_token_cache is None:
+            return {"enabled": False}
+        return self._verified_token_cache.stats()
+
+    def _decode_options(self, headers: dict, claims: dict) -> tuple:
+        cfg = get_config()
+        return cache_options(
+            cfg.decode_algorithms,
+            cfg.decode_audience,
+            cfg.decode_issuer,
+            cfg.leeway,
+            cfg.identity_claim_key,
+            self._decode_key_callback(headers, claims),
         )
 
     def _decode_jwt_from_config(
         self, encoded_token: str, csrf_value=None, allow_expired: bool = False
     ) -> dict:
-        unverified_claims = jwt.decode(
-            encoded_token,
-            algorithms=config.decode_algorithms,
-            options={"verify_signature": False},
-        )
-        unverified_headers = jwt.get_unverified_header(encoded_token)
-        secret = self._decode_key_callback(unverified_headers, unverified_claims)
+        return self._decode_jwt_and_header_from_config(
+            encoded_token, csrf_value, allow_expired
+        )[0]
 
+    def _decode_jwt_and_header_from_config(
+        self, encoded_token: str, csrf_value=None, allow_expired: bool = False
+    ) -> Tuple[dict, dict]:
+        # A token that was already verified with the same options and key
+        # skips the signature check and JSON parsing (the CSRF double submit
+        # value still has to match on every request)
+        cache = self._verified_token_cache
+        if cache is not None:
+            cached = cache.get(encoded_token, self._decode_options)
+            if cached is not None:
+                _verify_csrf(cached[0], csrf_value)
+                return cached
+
+        # The header and claims are parsed once and handed, still unverified,
+        # to the decode key callback; the signature is then checked over the
+        # original bytes and the claims validated without parsing them again
+        parsed_token = _parse_jwt(encoded_token)
+        secret = self._decode_key_callback(parsed_token.header, parsed_token.claims)
+
+        cfg = get_config()
         kwargs = {
-            "algorithms": config.decode_algorithms,
-            "audience": config.decode_audience,
+            "algorithms": cfg.decode_algorithms,
+            "audience": cfg.decode_audience,
             "csrf_value": csrf_value,
-            "encoded_token": encoded_token,
-            "identity_claim_key": config.identity_claim_key,
-            "issuer": config.decode_issuer,
-            "leeway": config.leeway,
+            "identity_claim_key": cfg.identity_claim_key,
+            "issuer": cfg.decode_issuer,
+            "leeway": cfg.leeway,
+            "parsed_token": parsed_token,
             "secret": secret,
-            "verify_aud": config.decode_audience is not None,
+            "verify_aud": cfg.decode_audience is not None,
         }
-
-        try:
-            return _decode_jwt(**kwargs, allow_expired=allow_expired)
-        except ExpiredSignatureError as e:
-            # TODO: If we ever do another breaking change, don't raise this pyjwt
-            #       error directly, instead raise a custom error of ours from this
-            #       error.
-            e.jwt_header = unverified_headers  # type: ignore
-            e.jwt_data = _decode_jwt(**kwargs, allow_expired=True)  # type: ignore
-            raise
+        decoded_token = _decode_jwt(**kwargs, allow_expired=allow_expired)
+
+        if cache is not None and not allow_expired:
+            options = cache_options(
+                kwargs["algorithms"],
+                kwargs["audience"],
+                kwargs["issuer"],
+                kwargs["leeway"],
+                kwargs["identity_claim_key"],
+                secret,
+            )
+            cache.put(encoded_token, options, decoded_token, parsed_token.header)
+        return decoded_token, parsed_token.header
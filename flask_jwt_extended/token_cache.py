@@ -0,0 +1,108 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import Tuple
+
+
+class VerifiedTokenCache(object):
+    """
+    Bounded LRU of already verified JWTs, keyed by the encoded token.
+
+    Each entry keeps the verified claims and headers, the decode options and
+    key used to verify them, and the ``exp`` of the token. An entry is only
+    returned while the token has not expired and the options and key are
+    unchanged, so rotating ``JWT_SECRET_KEY`` or changing the audience, issuer
+    or algorithms never serves a stale verification. Revocation and custom
+    claim checks are not cached; they run on every request.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(
+        self, encoded_token: str, options: Callable[[dict, dict], tuple]
+    ) -> Optional[Tuple[dict, dict]]:
+        """
+        Returns copies of the cached ``(claims, headers)`` or ``None``.
+
+        ``options`` receives the cached headers and claims and returns the
+        current decode options; it runs outside of the lock because it calls
+        the user defined decode key callback.
+        """
+        with self._lock:
+            entry = self._entries.get(encoded_token)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, headers, entry_options, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[encoded_token]
+                self.expired += 1
+                self.misses += 1
+                return None
+
+        current_options = options(headers, claims)
+        with self._lock:
+            if current_options != entry_options:
+                if self._entries.get(encoded_token) is entry:
+                    del self._entries[encoded_token]
+                self.misses += 1
+                return None
+            if encoded_token in self._entries:
+                self._entries.move_to_end(encoded_token)
+            self.hits += 1
+        # Callers are free to modify the dicts they get back
+        return dict(claims), dict(headers)
+
+    def put(
+        self, encoded_token: str, options: tuple, claims: dict, headers: dict
+    ) -> None:
+        expires_at = claims.get("exp")
+        if expires_at is not None and not isinstance(expires_at, (int, float)):
+            return
+        with self._lock:
+            self._entries[encoded_token] = (
+                dict(claims),
+                dict(headers),
+                options,
+                expires_at,
+            )
+            self._entries.move_to_end(encoded_token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def cache_options(*values: Any) -> tuple:
+    """
+    Builds a comparable snapshot of the decode options, turning lists (like the
+    algorithms or audiences) into tuples.
+    """
+    return tuple(tuple(v) if isinstance(v, list) else v for v in values)
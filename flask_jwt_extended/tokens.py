@@ -1,57 +1,187 @@
-import uuid
+import binascii
+import json
+import os
+import time
+from calendar import timegm
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
+from functools import lru_cache
 from hmac import compare_digest
 from json import JSONEncoder
+from threading import Lock
 from typing import Any
 from typing import Iterable
 from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
 from typing import Type
 from typing import Union
 
 import jwt
+from jwt import DecodeError
+from jwt import ExpiredSignatureError
+from jwt import ImmatureSignatureError
+from jwt import InvalidAlgorithmError
+from jwt import InvalidAudienceError
+from jwt import InvalidIssuedAtError
+from jwt import InvalidIssuerError
+from jwt import InvalidSignatureError
+from jwt import InvalidTokenError
+from jwt import MissingRequiredClaimError
+from jwt.algorithms import get_default_algorithms
+from jwt.utils import base64url_decode
+from jwt.utils import base64url_encode
 
 from flask_jwt_extended.exceptions import CSRFError
 from flask_jwt_extended.exceptions import JWTDecodeError
 from flask_jwt_extended.typing import ExpiresDelta
 from flask_jwt_extended.typing import Fresh
 
+_ALGORITHMS = get_default_algorithms()
 
-def _encode_jwt(
-    algorithm: str,
+# Random bytes read from the OS per batch of JTIs (16 bytes each)
+_JTI_BATCH = 256
+
+
+class _JTISource(object):
+    """
+    Random UUID4 strings, the same format as ``str(uuid.uuid4())``, drawn from
+    a buffer of ``os.urandom`` bytes that is refilled in batches instead of
+    making one system call per token. The buffer is dropped in forked
+    children so worker processes never hand out the same values.
+    """
+
+    def __init__(self) -> None:
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._lock = Lock()
+        self._buffer = b""
+        self._offset = 0
+
+    def __call__(self) -> str:
+        with self._lock:
+            if self._offset >= len(self._buffer):
+                self._buffer = os.urandom(16 * _JTI_BATCH)
+                self._offset = 0
+            raw = bytearray(self._buffer[self._offset : self._offset + 16])
+            self._offset += 16
+        # Version 4 and RFC 4122 variant bits, as uuid.UUID(version=4) does
+        raw[6] = (raw[6] & 0x0F) | 0x40
+        raw[8] = (raw[8] & 0x3F) | 0x80
+        h = raw.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+_new_jti = _JTISource()
+
+
+@lru_cache(maxsize=64)
+def _cached_signing_key(algorithm: str, key: Any) -> Tuple[Any, Any]:
+    alg_obj = _ALGORITHMS[algorithm]
+    return alg_obj, alg_obj.prepare_key(key)
+
+
+def _signing_key(algorithm: str, key: Any) -> Tuple[Any, Any]:
+    """
+    Returns the algorithm object and the prepared key (HMAC bytes, parsed PEM
+    keys...) for signing or verifying, prepared once per algorithm and key.
+    Raises ``KeyError`` for algorithms PyJWT does not implement.
+    """
+    try:
+        return _cached_signing_key(algorithm, key)
+    except TypeError:
+        # Unhashable keys (like a JWK dict) are prepared every time
+        alg_obj = _ALGORITHMS[algorithm]
+        return alg_obj, alg_obj.prepare_key(key)
+
+
+@lru_cache(maxsize=16)
+def _json_encoder(json_encoder: Type[JSONEncoder], sort_keys: bool) -> JSONEncoder:
+    # Same instance json.dumps(..., separators=(",", ":"), cls=json_encoder)
+    # would build on every call
+    return (json_encoder or JSONEncoder)(separators=(",", ":"), sort_keys=sort_keys)
+
+
+@lru_cache(maxsize=16)
+def _default_header_segment(algorithm: str, json_encoder: Type[JSONEncoder]) -> bytes:
+    header = {"typ": "JWT", "alg": algorithm}
+    return base64url_encode(_json_encoder(json_encoder, True).encode(header).encode())
+
+
+def _header_segment(
+    algorithm: str, header_overrides: dict, json_encoder: Type[JSONEncoder]
+) -> Tuple[str, bytes]:
+    # Same header jwt.encode builds: overrides (including "alg") win and an
+    # empty "typ" is dropped
+    if not header_overrides:
+        return algorithm, _default_header_segment(algorithm, json_encoder)
+
+    algorithm = header_overrides.get("alg") or algorithm
+    if "kid" in header_overrides and not isinstance(header_overrides["kid"], str):
+        raise InvalidTokenError("Key ID header parameter must be a string")
+    header = {"typ": "JWT", "alg": algorithm}
+    header.update(header_overrides)
+    if not header["typ"]:
+        del header["typ"]
+    json_header = _json_encoder(json_encoder, True).encode(header).encode()
+    return algorithm, base64url_encode(json_header)
+
+
+class _IssueTime(NamedTuple):
+    now: datetime
+    iat: int
+    exp: Optional[int]
+
+
+def _issue_time(
+    expires_delta: ExpiresDelta, now: Optional[datetime] = None
+) -> _IssueTime:
+    # Time claims as jwt.encode writes them (whole seconds). Batches compute
+    # them once and share them between the tokens they mint
+    if now is None:
+        now = datetime.now(timezone.utc)
+    exp = timegm((now + expires_delta).utctimetuple()) if expires_delta else None
+    return _IssueTime(now, timegm(now.utctimetuple()), exp)
+
+
+def _token_data(
     audience: Union[str, Iterable[str]],
     claim_overrides: dict,
     csrf: bool,
     expires_delta: ExpiresDelta,
     fresh: Fresh,
-    header_overrides: dict,
     identity: Any,
     identity_claim_key: str,
     issuer: str,
-    json_encoder: Type[JSONEncoder],
-    secret: str,
     token_type: str,
     nbf: bool,
-) -> str:
-    now = datetime.now(timezone.utc)
+    issue_time: Optional[_IssueTime] = None,
+) -> dict:
+    if issue_time is None:
+        issue_time = _issue_time(expires_delta)
+    now, iat, exp = issue_time
 
     if isinstance(fresh, timedelta):
         fresh = datetime.timestamp(now + fresh)
 
     token_data = {
         "fresh": fresh,
-        "iat": now,
-        "jti": str(uuid.uuid4()),
+        "iat": iat,
+        "jti": _new_jti(),
         "type": token_type,
         identity_claim_key: identity,
     }
 
     if nbf:
-        token_data["nbf"] = now
+        token_data["nbf"] = iat
 
     if csrf:
-        token_data["csrf"] = str(uuid.uuid4())
+        token_data["csrf"] = _new_jti()
 
     if audience:
         token_data["aud"] = audience
@@ -59,19 +189,195 @@ def _encode_jwt(
     if issuer:
         token_data["iss"] = issuer
 
-    if expires_delta:
-        token_data["exp"] = now + expires_delta
+    if exp is not None:
+        token_data["exp"] = exp
 
     if claim_overrides:
         token_data.update(claim_overrides)
+        for time_claim in ("exp", "iat", "nbf"):
+            if isinstance(token_data.get(time_claim), datetime):
+                token_data[time_claim] = timegm(token_data[time_claim].utctimetuple())
+
+    return token_data
+
 
-    return jwt.encode(
-        token_data,
-        secret,
-        algorithm,
-        json_encoder=json_encoder,  # type: ignore
-        headers=header_overrides,
+def _sign_jwt(
+    algorithm: str,
+    json_encoder: Type[JSONEncoder],
+    header_overrides: dict,
+    secret: Any,
+    token_data: dict,
+) -> str:
+    if header_overrides and "b64" in header_overrides:
+        # Unencoded (detached) payloads are left to PyJWT
+        return jwt.encode(
+            token_data,
+            secret,
+            algorithm,
+            json_encoder=json_encoder,  # type: ignore
+            headers=header_overrides,
+        )
+
+    # Same bytes as jwt.encode, with the JSON encoders, the default header
+    # and the prepared key reused between tokens
+    algorithm, header_segment = _header_segment(
+        algorithm, header_overrides, json_encoder
     )
+    payload = _json_encoder(json_encoder, False).encode(token_data).encode("utf-8")
+    signing_input = header_segment + b"." + base64url_encode(payload)
+    try:
+        alg_obj, prepared_key = _signing_key(algorithm, secret)
+    except KeyError:
+        raise NotImplementedError("Algorithm not supported") from None
+    signature = alg_obj.sign(signing_input, prepared_key)
+    return (signing_input + b"." + base64url_encode(signature)).decode("utf-8")
+
+
+def _sign_jwts(
+    algorithm: str, json_encoder: Type[JSONEncoder], items: List[Tuple[dict, Any, dict]]
+) -> List[str]:
+    """
+    Signs a chunk of ``(header_overrides, secret, token_data)`` items. It only
+    needs picklable arguments, so batches can run it in worker processes.
+    """
+    return [
+        _sign_jwt(algorithm, json_encoder, header_overrides, secret, token_data)
+        for header_overrides, secret, token_data in items
+    ]
+
+
+class _ParsedJWT(NamedTuple):
+    header: dict
+    claims: dict
+    signing_input: bytes
+    signature: bytes
+
+
+def _parse_jwt(encoded_token: str) -> _ParsedJWT:
+    """
+    Splits the token once and parses its header and payload once. The parsed
+    header and claims are *not* verified yet; they are what the decode key
+    callback receives before calling :func:`_decode_jwt`.
+    """
+    if isinstance(encoded_token, str):
+        encoded_token = encoded_token.encode("utf-8")  # type: ignore
+    if not isinstance(encoded_token, bytes):
+        raise DecodeError(f"Invalid token type. Token must be a {bytes}")
+
+    try:
+        signing_input, crypto_segment = encoded_token.rsplit(b".", 1)
+        header_segment, payload_segment = signing_input.split(b".", 1)
+    except ValueError as err:
+        raise DecodeError("Not enough segments") from err
+
+    try:
+        header = json.loads(base64url_decode(header_segment))
+    except (TypeError, binascii.Error) as err:
+        raise DecodeError("Invalid header padding") from err
+    except ValueError as err:
+        raise DecodeError(f"Invalid header string: {err}") from err
+    if not isinstance(header, dict):
+        raise DecodeError("Invalid header string: must be a json object")
+    if "kid" in header and not isinstance(header["kid"], str):
+        raise InvalidTokenError("Key ID header parameter must be a string")
+
+    try:
+        claims = json.loads(base64url_decode(payload_segment))
+    except (TypeError, binascii.Error) as err:
+        raise DecodeError("Invalid payload padding") from err
+    except ValueError as err:
+        raise DecodeError(f"Invalid payload string: {err}") from err
+    if not isinstance(claims, dict):
+        raise DecodeError("Invalid payload string: must be a json object")
+
+    try:
+        signature = base64url_decode(crypto_segment)
+    except (TypeError, binascii.Error) as err:
+        raise DecodeError("Invalid crypto padding") from err
+
+    return _ParsedJWT(header, claims, signing_input, signature)
+
+
+def _verify_signature(parsed_token: _ParsedJWT, algorithms: List, secret: Any) -> None:
+    alg = parsed_token.header.get("alg")
+    if not alg or (algorithms is not None and alg not in algorithms):
+        raise InvalidAlgorithmError("The specified alg value is not allowed")
+    try:
+        alg_obj, prepared_key = _signing_key(alg, secret)
+    except KeyError:
+        raise InvalidAlgorithmError("Algorithm not supported") from None
+
+    signing_input, signature = parsed_token.signing_input, parsed_token.signature
+    if not alg_obj.verify(signing_input, prepared_key, signature):
+        raise InvalidSignatureError("Signature verification failed")
+
+
+def _numeric_claim(claims: dict, claim: str, error: Type[Exception], msg: str) -> int:
+    try:
+        return int(claims[claim])
+    except (TypeError, ValueError):
+        raise error(msg) from None
+
+
+def _validate_claims(
+    claims: dict,
+    audience: Union[str, Iterable[str]],
+    issuer: str,
+    leeway: float,
+    verify_aud: bool,
+    now: float,
+) -> None:
+    # Same checks (and errors) as jwt.decode, except for exp which the caller
+    # checks last so that an expired token still reports its claims
+    if "iat" in claims:
+        msg = "Issued At claim (iat) must be an integer."
+        iat = _numeric_claim(claims, "iat", InvalidIssuedAtError, msg)
+        if iat > now + leeway:
+            raise ImmatureSignatureError("The token is not yet valid (iat)")
+
+    if "nbf" in claims:
+        msg = "Not Before claim (nbf) must be an integer."
+        nbf = _numeric_claim(claims, "nbf", DecodeError, msg)
+        if nbf > now + leeway:
+            raise ImmatureSignatureError("The token is not yet valid (nbf)")
+
+    if "exp" in claims:
+        msg = "Expiration Time claim (exp) must be an integer."
+        _numeric_claim(claims, "exp", DecodeError, msg)
+
+    if issuer is not None:
+        if "iss" not in claims:
+            raise MissingRequiredClaimError("iss")
+        if isinstance(issuer, list):
+            if claims["iss"] not in issuer:
+                raise InvalidIssuerError("Invalid issuer")
+        elif claims["iss"] != issuer:
+            raise InvalidIssuerError("Invalid issuer")
+
+    if verify_aud:
+        _validate_audience(claims, audience)
+
+
+def _validate_audience(claims: dict, audience: Union[str, Iterable[str]]) -> None:
+    if audience is None:
+        if claims.get("aud"):
+            raise InvalidAudienceError("Invalid audience")
+        return
+
+    audience_claims = claims.get("aud")
+    if not audience_claims:
+        raise MissingRequiredClaimError("aud")
+    if isinstance(audience_claims, str):
+        audience_claims = [audience_claims]
+    if not isinstance(audience_claims, list) or any(
+        not isinstance(c, str) for c in audience_claims
+    ):
+        raise InvalidAudienceError("Invalid claim format in token")
+
+    if isinstance(audience, str):
+        audience = [audience]
+    if all(aud not in audience_claims for aud in audience):
+        raise InvalidAudienceError("Audience doesn't match")
 
 
 def _decode_jwt(
@@ -79,27 +385,26 @@ def _decode_jwt(
     allow_expired: bool,
     audience: Union[str, Iterable[str]],
     csrf_value: str,
-    encoded_token: str,
     identity_claim_key: str,
     issuer: str,
-    leeway: int,
-    secret: str,
+    leeway: Union[float, timedelta],
+    parsed_token: _ParsedJWT,
+    secret: Any,
     verify_aud: bool,
 ) -> dict:
-    options = {"verify_aud": verify_aud}
-    if allow_expired:
-        options["verify_exp"] = False
-
-    # This call verifies the ext, iat, and nbf claims
-    # This optionally verifies the exp and aud claims if enabled
-    decoded_token = jwt.decode(
-        encoded_token,
-        secret,
-        algorithms=algorithms,
-        audience=audience,
-        issuer=issuer,
-        leeway=leeway,
-        options=options,
+    _verify_signature(parsed_token, algorithms, secret)
+
+    # This verifies the iat, nbf, iss and (optionally) aud claims over the
+    # already parsed payload, no second base64/JSON pass is done
+    if isinstance(leeway, timedelta):
+        leeway = leeway.total_seconds()
+    now = time.time()
+    decoded_token = parsed_token.claims
+    _validate_claims(decoded_token, audience, issuer, leeway, verify_aud, now)
+    expired = (
+        not allow_expired
+        and "exp" in decoded_token
+        and int(decoded_token["exp"]) <= now - leeway
     )
 
     # Make sure that any custom claims we expect in the token are present
@@ -115,10 +420,23 @@ def _decode_jwt(
     if "jti" not in decoded_token:
         decoded_token["jti"] = None
 
+    _verify_csrf(decoded_token, csrf_value)
+
+    if expired:
+        # TODO: If we ever do another breaking change, don't raise this pyjwt
+        #       error directly, instead raise a custom error of ours from this
+        #       error.
+        error = ExpiredSignatureError("Signature has expired")
+        error.jwt_header = parsed_token.header  # type: ignore
+        error.jwt_data = decoded_token  # type: ignore
+        raise error
+
+    return decoded_token
+
+
+def _verify_csrf(decoded_token: dict, csrf_value: str) -> None:
     if csrf_value:
         if "csrf" not in decoded_token:
             raise JWTDecodeError("Missing claim: csrf")
         if not compare_digest(decoded_token["csrf"], csrf_value):
             raise CSRFError("CSRF double submit tokens do not match")
-
-    return decoded_token
@@ -1,5 +1,10 @@
 from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
 from typing import Optional
+from typing import Tuple
+from typing import Union
 
 import jwt
 from flask import g
@@ -228,6 +233,82 @@ def create_refresh_token(
     )
 
 
+def create_tokens_batch(
+    identities: Iterable[Any],
+    refresh: bool = True,
+    fresh: Fresh = False,
+    access_expires_delta: Optional[ExpiresDelta] = None,
+    refresh_expires_delta: Optional[ExpiresDelta] = None,
+    additional_claims: Union[dict, Callable[[Any], dict], None] = None,
+    additional_headers=None,
+    workers: int = 0,
+    use_processes: bool = False,
+) -> Iterator[Tuple[Any, str, Optional[str]]]:
+    """
+    Create access (and refresh) tokens for many identities in one call, for
+    example to provision service accounts or feed a load generator. The
+    config, expiration deltas and prepared signing key are shared by the
+    whole batch; the callbacks still run for every identity.
+
+    Tokens are generated lazily in chunks, so the returned iterator has to
+    be consumed inside the application context (use
+    ``flask.stream_with_context`` to stream it from a view).
+
+    :param identities:
+        An iterable of identities, one access token (and refresh token) each.
+
+    :param refresh:
+        If ``True``, also create a refresh token for every identity. Defaults
+        to ``True``.
+
+    :param fresh:
+        If the access tokens should be marked as fresh (see
+        :func:`create_access_token`). Defaults to ``False``.
+
+    :param access_expires_delta:
+        Expiration of the access tokens. If this is None, it will use the
+        ``JWT_ACCESS_TOKEN_EXPIRES`` config value.
+
+    :param refresh_expires_delta:
+        Expiration of the refresh tokens. If this is None, it will use the
+        ``JWT_REFRESH_TOKEN_EXPIRES`` config value.
+
+    :param additional_claims:
+        Optional. A hash of claims to include in every token, or a function
+        that receives the identity and returns that hash.
+
+    :param additional_headers:
+        Optional. A hash of headers to include in every token.
+
+    :param workers:
+        Number of workers signing the tokens in parallel. Only used with
+        asymmetric algorithms (RS*, ES*, PS*, EdDSA), where signing dominates;
+        HMAC tokens are always signed in the calling thread. Defaults to ``0``.
+
+    :param use_processes:
+        If ``True``, the workers are processes instead of threads. The keys
+        returned by the encode key callback must then be picklable (like PEM
+        strings). Defaults to ``False``.
+
+    :return:
+        An iterator of ``(identity, access_token, refresh_token)`` tuples in
+        the order of ``identities``. ``refresh_token`` is ``None`` when
+        ``refresh=False``.
+    """
+    jwt_manager = get_jwt_manager()
+    return jwt_manager._encode_jwt_batch_from_config(
+        identities,
+        refresh=refresh,
+        claims=additional_claims,
+        fresh=fresh,
+        access_expires_delta=access_expires_delta,
+        refresh_expires_delta=refresh_expires_delta,
+        headers=additional_headers,
+        workers=workers,
+        use_processes=use_processes,
+    )
+
+
 def get_unverified_jwt_headers(encoded_token: str) -> dict:
     """
     Returns the Headers of an encoded JWT without verifying the signature of the JWT.
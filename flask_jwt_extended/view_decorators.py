@@ -1,8 +1,11 @@
 from datetime import datetime
 from datetime import timezone
+from functools import lru_cache
+from functools import partial
 from functools import wraps
-from re import split
+from re import compile as compile_regex
 from typing import Any
+from typing import Callable
 from typing import Optional
 from typing import Sequence
 from typing import Tuple
@@ -14,6 +17,7 @@ from flask import request
 from werkzeug.exceptions import BadRequest
 
 from flask_jwt_extended.config import config
+from flask_jwt_extended.config import get_config
 from flask_jwt_extended.exceptions import CSRFError
 from flask_jwt_extended.exceptions import FreshTokenRequired
 from flask_jwt_extended.exceptions import InvalidHeaderError
@@ -21,15 +25,16 @@ from flask_jwt_extended.exceptions import InvalidQueryParamError
 from flask_jwt_extended.exceptions import NoAuthorizationError
 from flask_jwt_extended.exceptions import UserLookupError
 from flask_jwt_extended.internal_utils import custom_verification_for_token
+from flask_jwt_extended.internal_utils import get_jwt_manager
 from flask_jwt_extended.internal_utils import has_user_lookup
 from flask_jwt_extended.internal_utils import user_lookup
 from flask_jwt_extended.internal_utils import verify_token_not_blocklisted
 from flask_jwt_extended.internal_utils import verify_token_type
-from flask_jwt_extended.utils import decode_token
-from flask_jwt_extended.utils import get_unverified_jwt_headers
 
 LocationType = Union[str, Sequence, None]
 
+_HEADER_FIELDS_SEPARATOR = compile_regex(r",\s*")
+
 
 def _verify_token_is_fresh(jwt_header: dict, jwt_data: dict) -> None:
     fresh = jwt_data["fresh"]
@@ -161,11 +166,19 @@ def jwt_required(
         revocation status of the token will be checked.
     """
 
+    # Normalized once here, so every request hits the compiled extractors
+    normalized_locations = _normalize_locations(locations)
+
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
             verify_jwt_in_request(
-                optional, fresh, refresh, locations, verify_type, skip_revocation_check
+                optional,
+                fresh,
+                refresh,
+                normalized_locations,
+                verify_type,
+                skip_revocation_check,
             )
             return current_app.ensure_sync(fn)(*args, **kwargs)
 
@@ -187,8 +200,9 @@ def _load_user(jwt_header: dict, jwt_data: dict) -> Optional[dict]:
 
 
 def _decode_jwt_from_headers() -> Tuple[str, None]:
-    header_name = config.header_name
-    header_type = config.header_type
+    cfg = get_config()
+    header_name = cfg.header_name
+    header_type = cfg.header_type
 
     # Verify we have the auth header
     auth_header = request.headers.get(header_name, "").strip().strip(",")
@@ -201,7 +215,14 @@ def _decode_jwt_from_headers() -> Tuple[str, None]:
     # Also handle the fact that the header that can be comma delimited, ie
     # <HeaderName>: <field> <value>, <field> <value>, etc...
     if header_type:
-        field_values = split(r",\s*", auth_header)
+        # Fast path for the common "<HeaderType> <JWT>" header, same result
+        # as the general case below without the regex split
+        if "," not in auth_header:
+            parts = auth_header.split()
+            if len(parts) == 2 and parts[0] == header_type:
+                return parts[1], None
+
+        field_values = _HEADER_FIELDS_SEPARATOR.split(auth_header)
         jwt_headers = [s for s in field_values if s.split()[0] == header_type]
         if len(jwt_headers) != 1:
             msg = (
@@ -231,22 +252,23 @@ def _decode_jwt_from_headers() -> Tuple[str, None]:
 
 
 def _decode_jwt_from_cookies(refresh: bool) -> Tuple[str, Optional[str]]:
+    cfg = get_config()
     if refresh:
-        cookie_key = config.refresh_cookie_name
-        csrf_header_key = config.refresh_csrf_header_name
-        csrf_field_key = config.refresh_csrf_field_name
+        cookie_key = cfg.refresh_cookie_name
+        csrf_header_key = cfg.refresh_csrf_header_name
+        csrf_field_key = cfg.refresh_csrf_field_name
     else:
-        cookie_key = config.access_cookie_name
-        csrf_header_key = config.access_csrf_header_name
-        csrf_field_key = config.access_csrf_field_name
+        cookie_key = cfg.access_cookie_name
+        csrf_header_key = cfg.access_csrf_header_name
+        csrf_field_key = cfg.access_csrf_field_name
 
     encoded_token = request.cookies.get(cookie_key)
     if not encoded_token:
         raise NoAuthorizationError('Missing cookie "{}"'.format(cookie_key))
 
-    if config.csrf_protect and request.method in config.csrf_request_methods:
+    if cfg.csrf_protect and request.method in cfg.csrf_request_methods:
         csrf_value = request.headers.get(csrf_header_key, None)
-        if not csrf_value and config.csrf_check_form:
+        if not csrf_value and cfg.csrf_check_form:
             csrf_value = request.form.get(csrf_field_key, None)
         if not csrf_value:
             raise CSRFError("Missing CSRF token")
@@ -257,8 +279,9 @@ def _decode_jwt_from_cookies(refresh: bool) -> Tuple[str, Optional[str]]:
 
 
 def _decode_jwt_from_query_string() -> Tuple[str, None]:
-    param_name = config.query_string_name
-    prefix = config.query_string_value_prefix
+    cfg = get_config()
+    param_name = cfg.query_string_name
+    prefix = cfg.query_string_value_prefix
 
     value = request.args.get(param_name)
     if not value:
@@ -295,27 +318,25 @@ def _decode_jwt_from_json(refresh: bool) -> Tuple[str, None]:
     return encoded_token, None
 
 
-def _decode_jwt_from_request(
-    locations: LocationType,
-    fresh: bool,
-    refresh: bool = False,
-    verify_type: bool = True,
-    skip_revocation_check: bool = False,
-) -> Tuple[dict, dict, str]:
-    # Figure out what locations to look for the JWT in this request
+def _normalize_locations(locations: LocationType) -> Optional[Tuple[str, ...]]:
     if isinstance(locations, str):
-        locations = [locations]
-
+        return (locations,)
     if not locations:
-        locations = config.token_location
+        return None
+    return tuple(locations)
+
 
+@lru_cache(maxsize=None)
+def _compile_token_extractors(
+    locations: Tuple[str, ...], refresh: bool
+) -> Tuple[Tuple[str, Callable[[], Tuple[str, Optional[str]]]], ...]:
     # Get the decode functions in the order specified by locations.
-    # Each entry in this list is a tuple (<location>, <encoded-token-function>)
+    # Each entry is a tuple (<location>, <encoded-token-function>)
     get_encoded_token_functions = []
     for location in locations:
         if location == "cookies":
             get_encoded_token_functions.append(
-                (location, lambda: _decode_jwt_from_cookies(refresh))
+                (location, partial(_decode_jwt_from_cookies, refresh))
             )
         elif location == "query_string":
             get_encoded_token_functions.append(
@@ -325,10 +346,28 @@ def _decode_jwt_from_request(
             get_encoded_token_functions.append((location, _decode_jwt_from_headers))
         elif location == "json":
             get_encoded_token_functions.append(
-                (location, lambda: _decode_jwt_from_json(refresh))
+                (location, partial(_decode_jwt_from_json, refresh))
             )
         else:
             raise RuntimeError(f"'{location}' is not a valid location")
+    return tuple(get_encoded_token_functions)
+
+
+def _decode_jwt_from_request(
+    locations: LocationType,
+    fresh: bool,
+    refresh: bool = False,
+    verify_type: bool = True,
+    skip_revocation_check: bool = False,
+) -> Tuple[dict, dict, str]:
+    # Figure out what locations to look for the JWT in this request
+    locations = _normalize_locations(locations)
+    if not locations:
+        locations = get_config().token_location
+
+    # The (<location>, <encoded-token-function>) pairs for these locations
+    # are compiled once per combination of locations and refresh
+    get_encoded_token_functions = _compile_token_extractors(locations, refresh)
 
     # Try to find the token from one of these locations. It only needs to exist
     # in one place to be valid (not every location).
@@ -337,9 +376,11 @@ def _decode_jwt_from_request(
     for location, get_encoded_token_function in get_encoded_token_functions:
         try:
             encoded_token, csrf_token = get_encoded_token_function()
-            decoded_token = decode_token(encoded_token, csrf_token)
+            jwt_manager = get_jwt_manager()
+            decoded_token, jwt_header = jwt_manager._decode_jwt_and_header_from_config(
+                encoded_token, csrf_token
+            )
             jwt_location = location
-            jwt_header = get_unverified_jwt_headers(encoded_token)
             break
         except NoAuthorizationError as e:
             errors.append(str(e))
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Llavero de claves asimétricas para firmar JWT (RS256, ES256, EdDSA)
+- Cada clave se identifica por su kid "<alg>-<slot>", donde slot es el
+  intervalo de rotación en el que firma; todos los procesos que comparten
+  JWT_KEYS_DIR eligen la misma clave sin coordinarse
+- La clave del intervalo siguiente se genera y publica en el JWKS por
+  adelantado, así los servicios que cachean el JWKS ya la conocen cuando
+  empiezan a llegar tokens firmados con ella
+- Las claves anteriores siguen verificando durante JWT_KEY_RETIRE_AFTER
+  segundos (al menos la vida del refresh token) y después se retiran
+Los demás servicios verifican los tokens localmente con /.well-known/jwks.json
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+from threading import Event, Lock, Thread, local
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
+
+RSA_KEY_SIZE = 2048
+
+# Mínimo entre recargas del directorio al recibir un kid desconocido
+UNKNOWN_KID_RELOAD_INTERVAL = 1.0
+
+
+def generate_private_key(algorithm):
+    """Generar una clave privada nueva para el algoritmo"""
+    # cryptography solo es necesaria con algoritmos asimétricos
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+    if algorithm == 'RS256':
+        return rsa.generate_private_key(public_exponent=65537, key_size=RSA_KEY_SIZE)
+    if algorithm == 'ES256':
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Algoritmo no soportado: {algorithm}")
+
+
+class SigningKey:
+    """Par de claves de un slot: PEM privado para firmar, PEM público y JWK para verificar"""
+
+    __slots__ = ('kid', 'algorithm', 'slot', 'private_pem', 'public_pem', 'jwk')
+
+    def __init__(self, kid, algorithm, slot, private_pem):
+        from cryptography.hazmat.primitives import serialization
+        from jwt.algorithms import get_default_algorithms
+
+        private_key = serialization.load_pem_private_key(private_pem, password=None)
+        public_key = private_key.public_key()
+        self.kid = kid
+        self.algorithm = algorithm
+        self.slot = slot
+        # PEM en bytes: se puede usar como clave de caché y enviar a otros procesos
+        self.private_pem = private_pem
+        self.public_pem = public_key.public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        jwk = get_default_algorithms()[algorithm].to_jwk(public_key, as_dict=True)
+        jwk.update({'kid': kid, 'use': 'sig', 'alg': algorithm})
+        self.jwk = jwk
+
+
+class KeyRing:
+    """Claves de firma rotadas por intervalos de tiempo, con búsqueda O(1) por kid"""
+
+    def __init__(self, algorithm, keys_dir, rotation_interval, retire_after, reload_interval=30):
+        if algorithm not in SUPPORTED_ALGORITHMS:
+            raise ValueError(f"Algoritmo no soportado: {algorithm}")
+        self.algorithm = algorithm
+        self.keys_dir = keys_dir
+        # 0 = sin rotación, una sola clave
+        self.rotation_interval = rotation_interval
+        self.retire_after = retire_after
+        self.reload_interval = reload_interval
+        self.keys = {}
+        self.lock = Lock()
+        self.current_slot = None
+        self.last_reload = 0.0
+        self.last_unknown_reload = 0.0
+        self.jwks_body = b'{"keys":[]}'
+        self.jwks_etag = hashlib.sha256(self.jwks_body).hexdigest()[:16]
+        self.metrics = {
+            'generated': 0,
+            'loaded': 0,
+            'retired': 0,
+            'unknown_kid': 0
+        }
+        # Clave elegida para el token que se está firmando en este hilo
+        self._selected = local()
+        self._stop = Event()
+        self._rotation_thread = None
+
+    def _slot(self, now):
+        if not self.rotation_interval:
+            return 0
+        return int(now // self.rotation_interval)
+
+    def _retire_slots(self):
+        """Slots anteriores al actual que aún verifican"""
+        if not self.rotation_interval:
+            return 0
+        return math.ceil(self.retire_after / self.rotation_interval)
+
+    def _kid(self, slot):
+        return f"{self.algorithm}-{slot}"
+
+    def _path(self, kid):
+        return os.path.join(self.keys_dir, f"{kid}.pem")
+
+    def _create_key(self, slot):
+        """Generar la clave del slot si ningún proceso la creó todavía"""
+        from cryptography.hazmat.primitives import serialization
+
+        path = self._path(self._kid(slot))
+        if os.path.exists(path):
+            return
+        private_pem = generate_private_key(self.algorithm).private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        # mkstemp crea el archivo con permisos 0600
+        fd, tmp_path = tempfile.mkstemp(dir=self.keys_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(private_pem)
+                f.flush()
+                os.fsync(f.fileno())
+            # link falla si otro proceso publicó la clave del slot antes
+            os.link(tmp_path, path)
+            self.metrics['generated'] += 1
+            logger.info(f"Clave JWT {self._kid(slot)} generada")
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+
+    def _reload(self, now):
+        """Crear las claves del slot actual y el siguiente, cargar el directorio y retirar las viejas"""
+        slot = self._slot(now)
+        os.makedirs(self.keys_dir, mode=0o700, exist_ok=True)
+        self._create_key(slot)
+        if self.rotation_interval:
+            self._create_key(slot + 1)
+
+        oldest = slot - self._retire_slots()
+        keys = {}
+        prefix = f"{self.algorithm}-"
+        for name in os.listdir(self.keys_dir):
+            if not name.startswith(prefix) or not name.endswith('.pem'):
+                continue
+            kid = name[:-4]
+            try:
+                key_slot = int(kid[len(prefix):])
+            except ValueError:
+                continue
+            if key_slot < oldest:
+                try:
+                    os.unlink(os.path.join(self.keys_dir, name))
+                    self.metrics['retired'] += 1
+                    logger.info(f"Clave JWT {kid} retirada")
+                except FileNotFoundError:
+                    pass
+                continue
+            key = self.keys.get(kid)
+            if key is None:
+                with open(os.path.join(self.keys_dir, name), 'rb') as f:
+                    key = SigningKey(kid, self.algorithm, key_slot, f.read())
+                self.metrics['loaded'] += 1
+            keys[kid] = key
+
+        if keys.keys() != self.keys.keys():
+            ordered = sorted(keys.values(), key=lambda k: k.slot, reverse=True)
+            self.jwks_body = json.dumps(
+                {'keys': [k.jwk for k in ordered]}, separators=(',', ':')
+            ).encode()
+            self.jwks_etag = hashlib.sha256(self.jwks_body).hexdigest()[:16]
+        self.keys = keys
+        self.current_slot = slot
+        self.last_reload = now
+
+    def refresh(self, force=False):
+        """Recargar si cambió el slot o venció el intervalo de recarga"""
+        now = time.time()
+        if (not force and self._slot(now) == self.current_slot
+                and now - self.last_reload < self.reload_interval):
+            return
+        with self.lock:
+            if (not force and self._slot(now) == self.current_slot
+                    and now - self.last_reload < self.reload_interval):
+                return
+            self._reload(now)
+
+    def signing_key(self):
+        """Clave que firma en el slot actual"""
+        self.refresh()
+        return self.keys[self._kid(self.current_slot)]
+
+    def select_signing_key(self):
+        """Elegir la clave del próximo token de este hilo (cabecera kid)"""
+        key = self.signing_key()
+        self._selected.key = key
+        return key
+
+    def selected_signing_key(self):
+        """Clave elegida por select_signing_key, la misma que anunció el kid"""
+        key = getattr(self._selected, 'key', None)
+        return key if key is not None else self.signing_key()
+
+    def verification_key(self, kid):
+        """Clave pública del kid (O(1)); None si no existe o está retirada"""
+        self.refresh()
+        key = self.keys.get(kid)
+        if key is None and kid and kid.startswith(f"{self.algorithm}-"):
+            # Puede ser una clave recién creada por otro proceso
+            now = time.time()
+            if now - self.last_unknown_reload >= UNKNOWN_KID_RELOAD_INTERVAL:
+                self.last_unknown_reload = now
+                self.refresh(force=True)
+                key = self.keys.get(kid)
+        if key is None:
+            self.metrics['unknown_kid'] += 1
+        return key
+
+    def jwks(self):
+        """JWKS serializado de las claves vigentes y su ETag"""
+        self.refresh()
+        return self.jwks_body, self.jwks_etag
+
+    def start(self):
+        """Generar por adelantado la clave de cada intervalo al empezar el anterior"""
+        self.refresh()
+        if not self.rotation_interval or self._rotation_thread is not None:
+            return
+        self._rotation_thread = Thread(target=self._rotation_loop, name='jwt-key-rotation', daemon=True)
+        self._rotation_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _rotation_loop(self):
+        while not self._stop.is_set():
+            next_slot_start = (self._slot(time.time()) + 1) * self.rotation_interval
+            self._stop.wait(max(next_slot_start - time.time(), 0) + 0.1)
+            try:
+                self.refresh(force=True)
+            except Exception as e:
+                logger.error(f"Error rotando claves JWT: {e}")
+
+    def get_stats(self):
+        """Estado del llavero para /api/metrics"""
+        return {
+            'algorithm': self.algorithm,
+            'rotation_interval': self.rotation_interval,
+            'signing_kid': self._kid(self.current_slot) if self.current_slot is not None else None,
+            'kids': sorted(self.keys),
+            **self.metrics
+        }
+
+
+# Solo se usa cuando JWT_ALGORITHM es asimétrico; con HS256 firma JWT_SECRET_KEY
+keyring = KeyRing(
+    Config.JWT_ALGORITHM,
+    Config.JWT_KEYS_DIR,
+    Config.JWT_KEY_ROTATION_INTERVAL,
+    Config.JWT_KEY_RETIRE_AFTER
+) if Config.JWT_ALGORITHM in SUPPORTED_ALGORITHMS else None
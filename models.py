@@ -7,6 +7,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+class BlocklistUnavailableError(Exception):
+    """Ningún nivel fiable pudo resolver la revocación (se responde 503, nunca se acepta el token)"""
+
 class User:
     def __init__(self, username, email, password_hash=None, is_active=True, user_id=None):
         self.id = user_id
@@ -72,11 +75,16 @@ class User:
     
     @staticmethod
     def find_by_id(user_id):
-        """Buscar usuario por ID"""
-        query = "SELECT * FROM users WHERE id = %s"
-        result = db.execute_query(query, (user_id,))
-        if result:
-            user_data = result[0]
+        """Buscar usuario por ID (caché local invalidada por eventos user_change)"""
+        user_data = redis_manager.user_cache.get(str(user_id))
+        if user_data is None:
+            generation = redis_manager.user_cache.generation
+            query = "SELECT * FROM users WHERE id = %s"
+            result = db.execute_query(query, (user_id,))
+            if result:
+                user_data = result[0]
+                redis_manager.user_cache.put(str(user_id), user_data, generation=generation)
+        if user_data:
             return User(
                 user_id=user_data['id'],
                 username=user_data['username'],
@@ -86,6 +94,16 @@ class User:
             )
         return None
     
+    @staticmethod
+    def set_active(user_id, is_active):
+        """Activar o desactivar un usuario y avisar a todos los workers"""
+        query = "UPDATE users SET is_active = %s WHERE id = %s"
+        # rowcount es 0 si el valor no cambió: solo None indica error
+        if db.execute_update(query, (is_active, user_id)) is None:
+            return False
+        redis_manager.publish_user_change(user_id)
+        return True
+    
     def to_dict(self):
         """Convertir usuario a diccionario (sin password_hash)"""
         return {
@@ -103,14 +121,14 @@ class RevokedToken:
         self.expires_at = expires_at
         self.revoked_at = revoked_at
     
-    def save(self):
-        """Guardar token revocado en la blocklist (SQL)"""
+    def save(self, database=None):
+        """Guardar token revocado en la blocklist (SQL); database permite usar otra conexión"""
         query = """
         INSERT INTO revoked_tokens (jti, token_type, user_id, expires_at)
         VALUES (%s, %s, %s, %s)
         """
         params = (self.jti, self.token_type, self.user_id, self.expires_at)
-        return db.execute_insert(query, params) is not None
+        return (database or db).execute_insert(query, params) is not None
     
     def save_redis(self):
         """Guardar token revocado en Redis"""
@@ -123,12 +141,36 @@ class RevokedToken:
         """Verificar si un token está revocado (SQL)"""
         query = "SELECT id FROM revoked_tokens WHERE jti = %s"
         result = db.execute_query(query, (jti,))
+        # None es un error de SQL, no "sin filas": nunca se trata como no revocado
+        if result is None:
+            raise BlocklistUnavailableError("Error consultando revoked_tokens")
         return len(result) > 0
     
     @staticmethod
-    def is_revoked_redis(jti):
+    def revoked_among(jtis):
+        """Subconjunto de jtis revocados con una sola consulta IN (SQL)"""
+        if not jtis:
+            return set()
+        placeholders = ', '.join(['%s'] * len(jtis))
+        query = f"SELECT jti FROM revoked_tokens WHERE jti IN ({placeholders})"
+        result = db.execute_query(query, tuple(jtis))
+        if result is None:
+            raise BlocklistUnavailableError("Error consultando revoked_tokens")
+        return {row['jti'] for row in result}
+    
+    @staticmethod
+    def get_active(database=None):
+        """Obtener los tokens revocados que aún no expiran (SQL)"""
+        query = """
+        SELECT jti, token_type, user_id, expires_at FROM revoked_tokens
+        WHERE expires_at > %s
+        """
+        return (database or db).execute_query(query, (datetime.now(),))
+    
+    @staticmethod
+    def is_revoked_redis(jti, user_id, token_exp=None):
         """Verificar si un token está revocado (Redis)"""
-        return redis_manager.is_token_revoked(jti)
+        return redis_manager.is_token_revoked(jti, user_id, token_exp)
     
     @staticmethod
     def revoke_all_user_tokens(user_id):
@@ -140,30 +182,32 @@ class RevokedToken:
     
     @staticmethod
     def revoke_all_user_tokens_redis(user_id):
-        """Revocar todos los tokens de un usuario (Redis)"""
+        """Revocar todos los tokens de un usuario (Redis); devuelve los tokens revocados"""
         return redis_manager.revoke_all_user_tokens(user_id)
 
 class TokenAudit:
-    def __init__(self, user_id, action, token_jti=None, ip_address=None, user_agent=None):
+    def __init__(self, user_id, action, token_jti=None, ip_address=None, user_agent=None, details=None):
         self.user_id = user_id
         self.action = action
         self.token_jti = token_jti
         self.ip_address = ip_address
         self.user_agent = user_agent
+        # Texto libre (JSON) con el detalle de la acción, p.ej. las identidades de un lote
+        self.details = details
     
     def save(self):
         """Guardar entrada de auditoría (SQL)"""
         query = """
-        INSERT INTO token_audit (user_id, action, token_jti, ip_address, user_agent)
-        VALUES (%s, %s, %s, %s, %s)
+        INSERT INTO token_audit (user_id, action, token_jti, ip_address, user_agent, details)
+        VALUES (%s, %s, %s, %s, %s, %s)
         """
-        params = (self.user_id, self.action, self.token_jti, self.ip_address, self.user_agent)
+        params = (self.user_id, self.action, self.token_jti, self.ip_address, self.user_agent, self.details)
         return db.execute_insert(query, params) is not None
     
     def save_redis(self):
         """Guardar entrada de auditoría (Redis)"""
         return redis_manager.log_audit_action(
-            self.user_id, self.action, self.token_jti, self.ip_address, self.user_agent
+            self.user_id, self.action, self.token_jti, self.ip_address, self.user_agent, self.details
         )
     
     @staticmethod
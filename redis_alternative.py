@@ -4,102 +4,1696 @@ Alternativa a Redis usando diccionarios en memoria
 Para desarrollo y pruebas cuando Redis no está disponible
 """
 
+import bisect
+import builtins
+import fnmatch
+import hashlib
+import heapq
 import json
+import math
+import queue
+import random
+import re
 import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
 from datetime import datetime, timedelta
-from threading import Lock
+from threading import Condition, Event, RLock, Thread
 import logging
 
+from redis_scripts import PYTHON_IMPLEMENTATIONS
+from redis_sharding import hash_tag, SINGLE_KEY_COMMANDS
+
 logger = logging.getLogger(__name__)
 
-class InMemoryRedis:
-    """Simulador de Redis usando diccionarios en memoria"""
+# Caracteres especiales de los patrones glob de KEYS/SCAN
+GLOB_CHARS = '*?[\\'
+
+def literal_prefix(pattern):
+    """Parte literal inicial de un patrón glob (hasta el primer comodín)"""
+    for position, char in enumerate(pattern):
+        if char in GLOB_CHARS:
+            return pattern[:position]
+    return pattern
+
+def compile_pattern(pattern):
+    """Función que indica si una clave coincide con un patrón glob (None = todas coinciden)"""
+    if pattern is None or pattern == '*':
+        return None
+    prefix = literal_prefix(pattern)
+    if pattern == prefix + '*':
+        return lambda key: key.startswith(prefix)
+    return re.compile(fnmatch.translate(pattern)).match
+
+class ResponseError(Exception):
+    """Error devuelto por un comando (equivalente a redis.ResponseError)"""
+
+class NoScriptError(ResponseError):
+    """Script no cargado (equivalente a redis.exceptions.NoScriptError)"""
+
+class InMemoryPubSub:
+    """Suscripción a canales del simulador (interfaz compatible con redis-py)"""
+    
+    def __init__(self, server, ignore_subscribe_messages=False):
+        self.server = server
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+        self.channels = set()
+        self.messages = queue.Queue()
+    
+    def subscribe(self, *channels):
+        """Suscribirse a uno o varios canales"""
+        for channel in channels:
+            self.server._add_subscriber(channel, self)
+            self.channels.add(channel)
+            if not self.ignore_subscribe_messages:
+                self.messages.put({'type': 'subscribe', 'pattern': None,
+                                   'channel': channel, 'data': len(self.channels)})
+    
+    def unsubscribe(self, *channels):
+        """Cancelar la suscripción (a todos los canales si no se indican)"""
+        for channel in list(channels or self.channels):
+            self.server._remove_subscriber(channel, self)
+            self.channels.discard(channel)
+    
+    def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        """Obtener el siguiente mensaje o None si no llega a tiempo"""
+        try:
+            if timeout:
+                return self.messages.get(timeout=timeout)
+            return self.messages.get_nowait()
+        except queue.Empty:
+            return None
+    
+    def _deliver(self, channel, message):
+        self.messages.put({'type': 'message', 'pattern': None,
+                           'channel': channel, 'data': message})
+    
+    def close(self):
+        self.unsubscribe()
+
+class InMemoryPipeline:
+    """Pipeline del simulador (interfaz compatible con redis-py)
+    
+    Los comandos se encolan y execute() los ejecuta con una sola adquisición de
+    los locks de los shards implicados, así que el lote también es atómico
+    """
+    
+    def __init__(self, server):
+        self.server = server
+        self.commands = []
+    
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(self.server, name, None)):
+            raise AttributeError(name)
+        
+        def queue_command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        # Se guarda en la instancia para no volver a pasar por __getattr__
+        self.__dict__[name] = queue_command
+        return queue_command
+    
+    def __len__(self):
+        return len(self.commands)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.reset()
+    
+    def reset(self):
+        self.commands = []
+    
+    def execute(self, raise_on_error=True):
+        """Ejecutar los comandos encolados; devuelve sus resultados en orden"""
+        commands, self.commands = self.commands, []
+        keys = set()
+        for name, args, kwargs in commands:
+            command_keys = self.server._command_keys(name, args, kwargs)
+            if command_keys is None:
+                # Comando sin claves conocidas (p.ej. KEYS): bloquear todos los shards
+                keys = None
+                break
+            keys.update(command_keys)
+        
+        results = []
+        with self.server._locked(keys):
+            for name, args, kwargs in commands:
+                try:
+                    results.append(getattr(self.server, name)(*args, **kwargs))
+                except Exception as e:
+                    results.append(e)
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+class _SkipNode:
+    """Nodo de la skiplist: por nivel, el siguiente nodo y cuántas posiciones salta"""
+    
+    __slots__ = ('score', 'member', 'forward', 'span')
+    
+    def __init__(self, level, score=None, member=None):
+        self.score = score
+        self.member = member
+        self.forward = [None] * level
+        self.span = [0] * level
+
+class _SkipList:
+    """Skiplist con spans ordenada por (score, miembro), como zskiplist de Redis:
+    inserción, borrado y acceso por posición en O(log n)"""
+    
+    MAX_LEVEL = 32
+    P = 0.25
+    
+    def __init__(self, items=()):
+        self.head = _SkipNode(self.MAX_LEVEL)
+        self.level = 1
+        self.length = 0
+        for score, member in items:
+            self.insert(score, member)
+    
+    def __len__(self):
+        return self.length
+    
+    def __iter__(self):
+        """Pares (score, miembro) de menor a mayor"""
+        node = self.head.forward[0]
+        while node is not None:
+            yield node.score, node.member
+            node = node.forward[0]
+    
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+    
+    def _find(self, score, member):
+        """Predecesores por nivel de (score, miembro) y su posición"""
+        update = [self.head] * self.level
+        node = self.head
+        traversed = 0
+        rank = [0] * self.level
+        for i in range(self.level - 1, -1, -1):
+            following = node.forward[i]
+            while following is not None and (following.score < score or
+                                             following.score == score and following.member < member):
+                traversed += node.span[i]
+                node = following
+                following = node.forward[i]
+            update[i] = node
+            rank[i] = traversed
+        return update, rank
+    
+    def _predecessors(self, position):
+        """Predecesores por nivel de la posición dada (0 = primer elemento)"""
+        update = [self.head] * self.level
+        node = self.head
+        traversed = 0
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and traversed + node.span[i] <= position:
+                traversed += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+        return update
+    
+    def _unlink(self, node, update):
+        """Quitar node; update[i] es su predecesor en el nivel i"""
+        for i in range(self.level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+    
+    def insert(self, score, member):
+        update, rank = self._find(score, member)
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                update.append(self.head)
+                rank.append(0)
+                self.head.span[i] = self.length
+            self.level = level
+        node = _SkipNode(level, score, member)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.length += 1
+    
+    def delete(self, score, member):
+        update, _ = self._find(score, member)
+        self._unlink(update[0].forward[0], update)
+    
+    def count_below(self, bound, inclusive):
+        """Número de elementos con score < bound (<= si inclusive)"""
+        node = self.head
+        traversed = 0
+        for i in range(self.level - 1, -1, -1):
+            following = node.forward[i]
+            while following is not None and (following.score < bound or inclusive and following.score == bound):
+                traversed += node.span[i]
+                node = following
+                following = node.forward[i]
+        return traversed
+    
+    def slice(self, first, last):
+        """Pares (score, miembro) en las posiciones [first, last), ya acotadas"""
+        node = self._predecessors(first)[0].forward[0]
+        items = []
+        for _ in range(last - first):
+            items.append((node.score, node.member))
+            node = node.forward[0]
+        return items
+    
+    def remove_slice(self, first, last):
+        """Quitar y devolver las posiciones [first, last), ya acotadas"""
+        update = self._predecessors(first)
+        node = update[0].forward[0]
+        removed = []
+        for _ in range(last - first):
+            following = node.forward[0]
+            self._unlink(node, update)
+            removed.append((node.score, node.member))
+            node = following
+        return removed
+
+class _SortedList:
+    """Lista ordenada de (score, miembro) para conjuntos pequeños (el listpack de Redis)"""
+    
+    def __init__(self):
+        self.items = []
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def insert(self, score, member):
+        bisect.insort(self.items, (score, member))
+    
+    def delete(self, score, member):
+        self.items.pop(bisect.bisect_left(self.items, (score, member)))
+    
+    def count_below(self, bound, inclusive):
+        return (bisect.bisect_right if inclusive else bisect.bisect_left)(self.items, bound, key=lambda item: item[0])
+    
+    def slice(self, first, last):
+        return self.items[first:last]
+    
+    def remove_slice(self, first, last):
+        removed = self.items[first:last]
+        del self.items[first:last]
+        return removed
+
+class SortedSet:
+    """Conjunto ordenado: diccionario miembro -> score e índice ordenado por (score, miembro)
+    
+    Como Redis, hasta MAX_LISTPACK_ENTRIES miembros el índice es una lista
+    ordenada (O(n), pero más rápida con pocos elementos) y al superarlos pasa
+    a una skiplist: ZADD/ZREM en O(log n), ZPOPMIN en O(log n) por elemento y
+    rangos por posición o score en O(log n + m)
+    """
+    
+    # zset-max-listpack-entries de Redis
+    MAX_LISTPACK_ENTRIES = 128
+    
+    def __init__(self):
+        self.scores = {}
+        self.index = _SortedList()
+    
+    def __len__(self):
+        return len(self.scores)
+    
+    def _insert(self, score, member):
+        self.index.insert(score, member)
+        if isinstance(self.index, _SortedList) and len(self.index) > self.MAX_LISTPACK_ENTRIES:
+            # Conversión definitiva, como en Redis
+            self.index = _SkipList(self.index)
+    
+    def add(self, member, score):
+        """Agregar o actualizar un miembro; devuelve 1 si es nuevo"""
+        previous = self.scores.get(member)
+        if previous is not None:
+            if previous == score:
+                return 0
+            self.index.delete(previous, member)
+        self.scores[member] = score
+        self._insert(score, member)
+        return 0 if previous is not None else 1
+    
+    def remove(self, member):
+        """Eliminar un miembro; devuelve 1 si existía"""
+        score = self.scores.pop(member, None)
+        if score is None:
+            return 0
+        self.index.delete(score, member)
+        return 1
+    
+    def _bounds(self, first, last):
+        return max(first, 0), min(last, len(self.scores))
+    
+    def slice(self, first, last):
+        """Pares (miembro, score) en las posiciones [first, last)"""
+        first, last = self._bounds(first, last)
+        if first >= last:
+            return []
+        return [(member, score) for score, member in self.index.slice(first, last)]
+    
+    def _remove_slice(self, first, last):
+        first, last = self._bounds(first, last)
+        if first >= last:
+            return []
+        removed = self.index.remove_slice(first, last)
+        for _, member in removed:
+            del self.scores[member]
+        return removed
+    
+    def pop_min(self, count=1):
+        """Extraer los miembros de menor score"""
+        return [(member, score) for score, member in self._remove_slice(0, count)]
+    
+    def range(self, start, end):
+        """Rango por posición con índices inclusivos (admite negativos)"""
+        length = len(self.scores)
+        if start < 0:
+            start = max(length + start, 0)
+        if end < 0:
+            end = length + end
+        return self.slice(start, end + 1)
+    
+    @staticmethod
+    def parse_bound(value):
+        """Límite de score de ZRANGEBYSCORE: número, '-inf', '+inf' o '(número' exclusivo"""
+        value = str(value)
+        exclusive = value.startswith('(')
+        if exclusive:
+            value = value[1:]
+        try:
+            return float(value), exclusive
+        except ValueError:
+            raise ResponseError("min or max is not a float")
+    
+    def score_bounds(self, low, high):
+        """Posiciones [inicio, fin) de los miembros con score entre low y high"""
+        low, low_exclusive = self.parse_bound(low)
+        high, high_exclusive = self.parse_bound(high)
+        first = self.index.count_below(low, low_exclusive)
+        last = self.index.count_below(high, not high_exclusive)
+        return first, max(first, last)
+    
+    def remove_range(self, first, last):
+        """Eliminar los miembros en las posiciones [first, last)"""
+        return len(self._remove_slice(first, last))
+
+class Stream:
+    """Stream: entradas en orden de ID (ms, seq); XTRIM y XDEL marcan y compactan después"""
+    
+    MAX_ID = (2 ** 64 - 1, 2 ** 64 - 1)
+    
+    def __init__(self):
+        self.ids = []
+        self.entries = []
+        # Entradas ya recortadas por la cabeza y borradas (None) más allá de ella
+        self.start = 0
+        self.deleted = 0
+        self.length = 0
+        self.last_id = (0, 0)
+    
+    def __len__(self):
+        return self.length
+    
+    @staticmethod
+    def format_id(entry_id):
+        return f"{entry_id[0]}-{entry_id[1]}"
+    
+    @staticmethod
+    def parse_id(value, default_seq=0):
+        """'ms-seq' o 'ms' -> (ms, seq)"""
+        ms, _, seq = str(value).partition('-')
+        try:
+            return int(ms), int(seq) if seq else default_seq
+        except ValueError:
+            raise ResponseError("Invalid stream ID specified as stream command argument")
+    
+    def next_id(self, requested='*'):
+        """ID de la siguiente entrada ('*' automático, 'ms-*' o explícito)"""
+        if requested == '*':
+            ms = int(time.time() * 1000)
+            if ms > self.last_id[0]:
+                return ms, 0
+            return self.last_id[0], self.last_id[1] + 1
+        ms, _, seq = str(requested).partition('-')
+        if seq == '*':
+            entry_id = self.parse_id(ms)
+            if entry_id[0] == self.last_id[0]:
+                entry_id = (entry_id[0], self.last_id[1] + 1)
+        else:
+            entry_id = self.parse_id(requested)
+        if entry_id <= self.last_id:
+            raise ResponseError("The ID specified in XADD is equal or smaller than the target stream top item")
+        return entry_id
+    
+    def add(self, entry_id, fields):
+        self.ids.append(entry_id)
+        self.entries.append(fields)
+        self.length += 1
+        self.last_id = entry_id
+    
+    def _bound(self, value, low):
+        """Límite de XRANGE: '-', '+', '(id' exclusivo o id"""
+        value = str(value)
+        if value == '-':
+            return (0, 0), False
+        if value == '+':
+            return self.MAX_ID, False
+        exclusive = value.startswith('(')
+        if exclusive:
+            value = value[1:]
+        return self.parse_id(value, 0 if low else self.MAX_ID[1]), exclusive
+    
+    def range(self, low, high, count=None, reverse=False):
+        """Entradas entre low y high como (id, campos); O(log N + M)"""
+        low, low_exclusive = self._bound(low, True)
+        high, high_exclusive = self._bound(high, False)
+        first = (bisect.bisect_right if low_exclusive else bisect.bisect_left)(self.ids, low, self.start)
+        last = (bisect.bisect_left if high_exclusive else bisect.bisect_right)(self.ids, high, self.start)
+        positions = range(last - 1, first - 1, -1) if reverse else range(first, last)
+        result = []
+        for position in positions:
+            if count is not None and len(result) >= count:
+                break
+            fields = self.entries[position]
+            if fields is not None:
+                result.append((self.format_id(self.ids[position]), dict(fields)))
+        return result
+    
+    def after(self, entry_id, count=None):
+        """Entradas con ID mayor que entry_id (XREAD)"""
+        return self.range('(' + self.format_id(entry_id), '+', count)
+    
+    def trim(self, maxlen):
+        """Recortar las entradas más antiguas hasta maxlen; devuelve cuántas se eliminaron"""
+        removed = 0
+        while self.length > maxlen:
+            if self.entries[self.start] is None:
+                self.deleted -= 1
+            else:
+                self.entries[self.start] = None
+                self.length -= 1
+                removed += 1
+            self.start += 1
+        self._compact()
+        return removed
+    
+    def delete(self, entry_ids):
+        """Eliminar entradas por ID; devuelve cuántas existían"""
+        removed = 0
+        for entry_id in entry_ids:
+            entry_id = self.parse_id(entry_id)
+            position = bisect.bisect_left(self.ids, entry_id, self.start)
+            if position < len(self.ids) and self.ids[position] == entry_id and self.entries[position] is not None:
+                self.entries[position] = None
+                self.deleted += 1
+                self.length -= 1
+                removed += 1
+        self._compact()
+        return removed
+    
+    def _compact(self):
+        # Coste amortizado O(1): solo cuando lo descartado supera a lo vivo
+        if self.start + self.deleted > max(self.length, 64):
+            live = [(entry_id, fields) for entry_id, fields in zip(self.ids[self.start:], self.entries[self.start:]) if fields is not None]
+            self.ids = [entry_id for entry_id, _ in live]
+            self.entries = [fields for _, fields in live]
+            self.start = 0
+            self.deleted = 0
+    
+    def items(self):
+        """Entradas vivas como (id, campos)"""
+        return self.range('-', '+')
+    
+    @classmethod
+    def restore(cls, entries, last_id):
+        """Reconstruir un stream volcado con items()"""
+        stream = cls()
+        for entry_id, fields in entries:
+            stream.add(cls.parse_id(entry_id), dict(fields))
+        stream.last_id = cls.parse_id(last_id)
+        return stream
+
+class ExpiryIndex:
+    """Vencimientos agrupados por segundo: cubetas {segundo: claves} y heap de segundos"""
+    
+    # Entradas obsoletas toleradas en el heap antes de compactarlo
+    COMPACT_MIN = 64
+    
+    def __init__(self):
+        self.buckets = {}
+        self.heap = []
+    
+    def __len__(self):
+        return len(self.buckets)
+    
+    def add(self, key, expires_at):
+        slot = math.ceil(expires_at)
+        bucket = self.buckets.get(slot)
+        if bucket is None:
+            bucket = self.buckets[slot] = set()
+            heapq.heappush(self.heap, slot)
+        bucket.add(key)
+    
+    def remove(self, key, expires_at):
+        """Quitar una clave en O(1) amortizado; el segundo vacío queda obsoleto en el heap"""
+        slot = math.ceil(expires_at)
+        bucket = self.buckets.get(slot)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[slot]
+                # Con TTL deslizantes los segundos abandonados se acumulan (y se repiten
+                # si otra clave vuelve a ocuparlos): se reconstruye el heap cuando las
+                # entradas obsoletas superan a las vigentes
+                if len(self.heap) > 2 * len(self.buckets) + self.COMPACT_MIN:
+                    self.heap = list(self.buckets)
+                    heapq.heapify(self.heap)
+    
+    def pop_due(self, now, limit):
+        """Extraer hasta limit claves cuyo segundo ya venció"""
+        due = []
+        while self.heap and self.heap[0] <= now and len(due) < limit:
+            slot = self.heap[0]
+            bucket = self.buckets.get(slot)
+            while bucket and len(due) < limit:
+                due.append(bucket.pop())
+            if not bucket:
+                heapq.heappop(self.heap)
+                self.buckets.pop(slot, None)
+        return due
+
+# Políticas de desalojo al superar maxmemory (como maxmemory-policy de Redis)
+EVICTION_POLICIES = ('noeviction', 'volatile-lru', 'allkeys-lru', 'volatile-lfu', 'allkeys-lfu', 'volatile-ttl')
+
+# Contabilidad aproximada de memoria: cabecera por clave y por elemento de un
+# contenedor; el tamaño de los contenedores se extrapola de unos pocos elementos
+KEY_OVERHEAD = 64
+ELEMENT_OVERHEAD = 16
+SIZE_SAMPLES = 5
+
+# Contador LFU logarítmico de 8 bits (lfu-log-factor y lfu-decay-time de Redis)
+LFU_INIT_VAL = 5
+LFU_LOG_FACTOR = 10
+LFU_DECAY_SECONDS = 60
+
+def _item_size(item):
+    if type(item) is str or isinstance(item, bytes):
+        return len(item)
+    if isinstance(item, (tuple, list)):
+        return sum(map(_item_size, item))
+    if isinstance(item, dict):
+        return sum(_item_size(field) + _item_size(value) for field, value in item.items())
+    return 8
+
+def estimate_size(key, value):
+    """Bytes aproximados que ocupa una clave (O(1): los contenedores se muestrean)"""
+    size = KEY_OVERHEAD + len(key)
+    if isinstance(value, (str, bytes)):
+        return size + len(value)
+    if isinstance(value, deque):
+        sample = islice(value, SIZE_SAMPLES)
+    elif isinstance(value, dict):
+        sample = islice(value.items(), SIZE_SAMPLES)
+    elif isinstance(value, SortedSet):
+        sample = islice(value.scores.items(), SIZE_SAMPLES)
+    elif isinstance(value, Stream):
+        sample = value.range('-', '+', SIZE_SAMPLES)
+    else:
+        return size + _item_size(value)
+    total = count = 0
+    for item in sample:
+        total += _item_size(item)
+        count += 1
+    return size + len(value) * (ELEMENT_OVERHEAD + total // count) if count else size
+
+class KeyPool:
+    """Claves candidatas a desalojo con muestreo aleatorio en O(1)"""
+    
+    def __init__(self, keys=()):
+        self.keys = []
+        self.positions = {}
+        for key in keys:
+            self.add(key)
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def add(self, key):
+        if key not in self.positions:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+    
+    def discard(self, key):
+        """Quitar una clave en O(1) moviendo la última a su posición"""
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        last = self.keys.pop()
+        if position < len(self.keys):
+            self.keys[position] = last
+            self.positions[last] = position
+    
+    def sample(self, count):
+        return random.choices(self.keys, k=count) if self.keys else []
+
+def _expiry_loop(server_ref, stop, interval):
+    """Ciclo de expiración activa; termina cuando el simulador deja de existir"""
+    while not stop.wait(interval):
+        server = server_ref()
+        if server is None:
+            return
+        server.expire_cycle()
+        del server
+
+class Shard:
+    """Parte del espacio de claves con su propio lock (instrumentado)"""
+    
+    # Cubetas de SCAN: una clave siempre cae en la misma, así el cursor sigue
+    # siendo válido aunque otras claves se creen o eliminen
+    SCAN_BUCKETS = 1024
     
     def __init__(self):
         self.data = {}
         self.expiry = {}
-        self.lock = Lock()
+        self.expiry_index = ExpiryIndex()
+        # Índices de claves: espacio de nombres (hasta el primer ':') y cubeta de SCAN
+        self.namespaces = {}
+        self.buckets = {}
+        # Reentrante para que los scripts puedan usar los comandos públicos
+        self.lock = RLock()
+        self.stats = {'acquisitions': 0, 'contended': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        # Registro de escrituras (AOF) y carga en curso (expiración suspendida)
+        self.persistence = None
+        self.loading = False
+        # Memoria: tamaño aproximado por clave y límite de este shard (0 = sin límite)
+        self.sizes = {}
+        self.used_memory = 0
+        self.maxmemory = 0
+        self.policy = 'noeviction'
+        self.samples = 5
+        self.evicted = 0
+        self.oom_rejections = 0
+        # Con una política LRU/LFU: [último acceso, contador LFU] por clave
+        self.tracking = False
+        self.usage = {}
+        # Claves entre las que se muestrea al desalojar (todas o solo las volátiles)
+        self.candidates = None
+        # Espacios de nombres (prefijo hasta ':') que nunca se desalojan
+        self.protected = frozenset()
+    
+    def __enter__(self):
+        # Intento sin bloqueo primero: solo se mide el tiempo cuando hay contención
+        if not self.lock.acquire(blocking=False):
+            start = time.perf_counter()
+            self.lock.acquire()
+            waited = time.perf_counter() - start
+            self.stats['contended'] += 1
+            self.stats['wait_seconds'] += waited
+            if waited > self.stats['max_wait_seconds']:
+                self.stats['max_wait_seconds'] = waited
+        self.stats['acquisitions'] += 1
+        return self
+    
+    def __exit__(self, *exc):
+        self.lock.release()
+    
+    def log(self, *command):
+        """Registrar una escritura: tamaño de la clave y AOF (con el lock del shard tomado)"""
+        if command[0] != 'delete':
+            self.account(command[1])
+        if self.persistence is not None:
+            self.persistence.append(command)
+    
+    def configure_memory(self, maxmemory, policy, samples, protected=frozenset()):
+        """Cambiar el límite y la política, reconstruyendo las candidatas a desalojo"""
+        self.maxmemory = maxmemory
+        self.policy = policy
+        self.samples = samples
+        self.protected = frozenset(protected)
+        self.tracking = policy.endswith(('-lru', '-lfu'))
+        now = time.monotonic()
+        self.usage = {key: self.usage.get(key, [now, LFU_INIT_VAL]) for key in self.data} if self.tracking else {}
+        if policy == 'noeviction':
+            self.candidates = None
+        else:
+            keys = self.data if policy.startswith('allkeys') else self.expiry
+            self.candidates = KeyPool(key for key in keys if self.evictable(key))
+    
+    def evictable(self, key):
+        """La clave puede ser candidata a desalojo (no está en un espacio protegido)"""
+        return key.partition(':')[0] not in self.protected
+    
+    def account(self, key):
+        """Actualizar el tamaño de una clave escrita y desalojar si se supera el límite"""
+        value = self.data.get(key)
+        if value is None:
+            return
+        size = estimate_size(key, value)
+        self.used_memory += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        if self.maxmemory and self.used_memory > self.maxmemory and not self.loading:
+            # La clave recién escrita no se desaloja en su propio comando
+            self.evict(exclude=key)
+    
+    def touch(self, key):
+        """Registrar un acceso (LRU: hora; LFU: contador logarítmico con decaimiento)"""
+        now = time.monotonic()
+        usage = self.usage.get(key)
+        if usage is None:
+            self.usage[key] = [now, LFU_INIT_VAL]
+            return
+        counter = self._lfu_counter(usage, now)
+        if counter < 255 and random.random() < 1 / (max(counter - LFU_INIT_VAL, 0) * LFU_LOG_FACTOR + 1):
+            counter += 1
+        usage[0] = now
+        usage[1] = counter
+    
+    @staticmethod
+    def _lfu_counter(usage, now):
+        return max(usage[1] - int((now - usage[0]) / LFU_DECAY_SECONDS), 0)
+    
+    def _eviction_score(self, now):
+        """Puntuación de desalojo según la política (menor = mejor candidata)"""
+        if self.policy == 'volatile-ttl':
+            return lambda key: self.expiry.get(key, math.inf)
+        default = (now, LFU_INIT_VAL)
+        if self.policy.endswith('-lfu'):
+            def lfu_score(key):
+                usage = self.usage.get(key, default)
+                return (self._lfu_counter(usage, now), usage[0])
+            return lfu_score
+        return lambda key: self.usage.get(key, default)[0]
+    
+    def evict(self, exclude=None):
+        """Desalojar claves muestreadas hasta volver bajo maxmemory; False si no se pudo"""
+        if self.candidates is None:
+            return False
+        score = self._eviction_score(time.monotonic())
+        while self.used_memory > self.maxmemory:
+            sample = [key for key in self.candidates.sample(self.samples) if key != exclude]
+            if not sample:
+                return False
+            key = min(sample, key=score)
+            self.drop(key)
+            # Como Redis, el desalojo se propaga al AOF como un borrado
+            self.log('delete', key)
+            self.evicted += 1
+        return True
+    
+    def set_expiry(self, key, expires_at):
+        """Cambiar (o quitar con None) el vencimiento de una clave"""
+        previous = self.expiry.pop(key, None)
+        if previous is not None:
+            self.expiry_index.remove(key, previous)
+        if expires_at is not None:
+            self.expiry[key] = expires_at
+            self.expiry_index.add(key, expires_at)
+        if self.candidates is not None and self.policy.startswith('volatile') and self.evictable(key):
+            if expires_at is None:
+                self.candidates.discard(key)
+            else:
+                self.candidates.add(key)
+    
+    def put(self, key, value):
+        """Guardar el valor de una clave, indexándola si es nueva"""
+        if key not in self.data:
+            if self.maxmemory and self.used_memory > self.maxmemory and not self.loading and not self.evict():
+                self.oom_rejections += 1
+                raise ResponseError("OOM command not allowed when used memory > 'maxmemory'.")
+            self.namespaces.setdefault(key.partition(':')[0], set()).add(key)
+            self.buckets.setdefault(hash(key) % self.SCAN_BUCKETS, set()).add(key)
+            if self.tracking:
+                self.touch(key)
+            if self.candidates is not None and self.policy.startswith('allkeys') and self.evictable(key):
+                self.candidates.add(key)
+        self.data[key] = value
+        return value
+    
+    def _unindex(self, key):
+        """Quitar una clave eliminada de los índices y de la contabilidad de memoria"""
+        for index, name in ((self.namespaces, key.partition(':')[0]), (self.buckets, hash(key) % self.SCAN_BUCKETS)):
+            keys = index[name]
+            keys.discard(key)
+            if not keys:
+                del index[name]
+        self.used_memory -= self.sizes.pop(key, 0)
+        self.usage.pop(key, None)
+        if self.candidates is not None:
+            self.candidates.discard(key)
+    
+    def drop(self, key):
+        """Eliminar una clave y su vencimiento; devuelve True si existía"""
+        self.set_expiry(key, None)
+        if self.data.pop(key, None) is None:
+            return False
+        self._unindex(key)
+        return True
+    
+    def keys_with_prefix(self, prefix):
+        """Claves que empiezan por prefix, visitando solo sus espacios de nombres"""
+        name, separator, _ = prefix.partition(':')
+        if separator:
+            candidates = self.namespaces.get(name, ())
+        elif prefix:
+            candidates = [key for namespace, keys in self.namespaces.items() if namespace.startswith(prefix) for key in keys]
+        else:
+            return list(self.data)
+        return [key for key in candidates if key.startswith(prefix)]
+    
+    def scan(self, position, count):
+        """Claves desde la cubeta position; devuelve (siguiente cubeta o None al terminar, claves)"""
+        keys = []
+        # Como Redis, acotar también las cubetas vacías visitadas por llamada
+        limit = position + count * 10
+        while position < self.SCAN_BUCKETS and position < limit and len(keys) < count:
+            keys.extend(self.buckets.get(position, ()))
+            position += 1
+        return (position if position < self.SCAN_BUCKETS else None), keys
+    
+    def is_expired(self, key, now=None):
+        # Durante la carga se reproduce el estado tal como era al escribirse
+        if self.loading:
+            return False
+        expires_at = self.expiry.get(key)
+        return expires_at is not None and (now or time.time()) > expires_at
+    
+    def get(self, key):
+        """Valor vigente de una clave (expiración perezosa)"""
+        if self.is_expired(key):
+            self.drop(key)
+            # Como Redis, el vencimiento se propaga al AOF como un borrado
+            self.log('delete', key)
+            return None
+        value = self.data.get(key)
+        if self.tracking and value is not None:
+            self.touch(key)
+        return value
+    
+    def expire_batch(self, now, limit):
+        """Eliminar hasta limit claves vencidas; devuelve (revisadas, eliminadas)"""
+        due = self.expiry_index.pop_due(now, limit)
+        expired = 0
+        for key in due:
+            expires_at = self.expiry.get(key)
+            if expires_at is None:
+                continue
+            if expires_at < now:
+                del self.expiry[key]
+                if self.data.pop(key, None) is not None:
+                    self._unindex(key)
+                self.log('delete', key)
+                expired += 1
+            else:
+                # Mismo segundo pero aún no vence: se reprograma
+                self.expiry_index.add(key, expires_at)
+        return len(due), expired
+
+class InMemoryRedis:
+    """Simulador de Redis usando diccionarios en memoria"""
+    
+    # El espacio de claves se reparte en shards por hash tag, cada uno con su
+    # lock: las claves de un script (mismo hash tag) caen en el mismo shard
+    SHARDS = 16
+    
+    # Expiración activa: cada tick elimina lotes de claves vencidas soltando el
+    # lock entre lotes, sin superar el presupuesto de tiempo del tick
+    EXPIRE_INTERVAL = 0.1  # segundos entre ticks
+    EXPIRE_BATCH = 20  # claves por lote (por adquisición del lock)
+    EXPIRE_BUDGET = 0.005  # segundos máximos de trabajo por tick
+    
+    STREAM_POLL_INTERVAL = 0.05  # segundos entre comprobaciones de XREAD con block
+    
+    def __init__(self, shards=None, maxmemory=0, maxmemory_policy='noeviction', maxmemory_samples=5,
+                 maxmemory_protected=()):
+        self.shards = self._create_shards(shards or self.SHARDS)
+        self.scripts = {}
+        self.subscribers = {}
+        self.stats = {'expired_keys': 0, 'expire_cycles': 0}
+        # Protege scripts y suscriptores (no el espacio de claves)
+        self.lock = RLock()
+        # XADD despierta a los XREAD bloqueados
+        self.stream_condition = Condition()
+        self.maxmemory = 0
+        self.maxmemory_policy = 'noeviction'
+        # Espacios de nombres que el desalojo no toca (p.ej. revocaciones y sesiones)
+        self.maxmemory_protected = frozenset(maxmemory_protected)
+        if maxmemory:
+            self.set_maxmemory(maxmemory, maxmemory_policy, maxmemory_samples)
+        self._expiry_stop = Event()
+        self._expiry_cursor = 0
+        # Referencia débil: el hilo no mantiene vivo al simulador
+        Thread(
+            target=_expiry_loop,
+            args=(weakref.ref(self), self._expiry_stop, self.EXPIRE_INTERVAL),
+            name='inmemory-redis-expiry',
+            daemon=True
+        ).start()
         logger.info("Iniciando simulador Redis en memoria")
     
+    def _create_shards(self, count):
+        return [Shard() for _ in range(count)]
+    
+    def _shard_index(self, key):
+        return hash(hash_tag(key)) % len(self.shards)
+    
+    def _shard(self, key):
+        """Shard responsable de una clave"""
+        return self.shards[self._shard_index(key)]
+    
+    @contextmanager
+    def _locked(self, keys=None):
+        """Bloquear los shards de varias claves (todos si no se indican) en orden fijo"""
+        if keys is None:
+            indexes = range(len(self.shards))
+        else:
+            indexes = sorted({self._shard_index(key) for key in keys}) or [0]
+        acquired = []
+        try:
+            for index in indexes:
+                acquired.append(self.shards[index].__enter__())
+            yield
+        finally:
+            for shard in reversed(acquired):
+                shard.__exit__()
+    
+    def expire_cycle(self):
+        """Eliminar claves vencidas en lotes acotados; devuelve cuántas se eliminaron"""
+        deadline = time.perf_counter() + self.EXPIRE_BUDGET
+        expired = 0
+        pending = len(self.shards)
+        # Recorrer los shards en rueda, continuando donde terminó el tick anterior
+        while pending and time.perf_counter() < deadline:
+            shard = self.shards[self._expiry_cursor]
+            with shard:
+                checked, removed = shard.expire_batch(time.time(), self.EXPIRE_BATCH)
+            expired += removed
+            if checked < self.EXPIRE_BATCH:
+                # Shard sin más vencidas: pasar al siguiente
+                self._expiry_cursor = (self._expiry_cursor + 1) % len(self.shards)
+                pending -= 1
+        self.stats['expired_keys'] += expired
+        self.stats['expire_cycles'] += 1
+        return expired
+    
+    def get_lock_stats(self):
+        """Contención agregada de los locks de los shards"""
+        totals = {'acquisitions': 0, 'contended': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        for shard in self.shards:
+            for name, value in shard.stats.items():
+                if name == 'max_wait_seconds':
+                    totals[name] = max(totals[name], value)
+                else:
+                    totals[name] += value
+        totals['shards'] = len(self.shards)
+        totals['contention_rate'] = round(totals['contended'] / totals['acquisitions'], 4) if totals['acquisitions'] else 0.0
+        return totals
+    
+    def set_maxmemory(self, maxmemory, policy=None, samples=None):
+        """Limitar la memoria (bytes, 0 = sin límite) y elegir la política de desalojo
+        
+        El límite se reparte entre los shards: cada uno desaloja por su cuenta
+        bajo su propio lock, sin coordinarse con los demás. Las claves de
+        maxmemory_protected nunca se desalojan: si solo quedan esas, las
+        escrituras nuevas fallan con OOM como en noeviction
+        """
+        policy = policy or self.maxmemory_policy
+        if policy not in EVICTION_POLICIES:
+            raise ResponseError(f"Política de desalojo desconocida: {policy}")
+        with self._locked():
+            for shard in self.shards:
+                shard.configure_memory(maxmemory // len(self.shards), policy, samples or shard.samples,
+                                       self.maxmemory_protected)
+        self.maxmemory = maxmemory
+        self.maxmemory_policy = policy
+        logger.info(f"Simulador en memoria: maxmemory={maxmemory} bytes, política {policy}")
+    
+    def get_memory_stats(self):
+        """Memoria aproximada en uso y claves desalojadas"""
+        return {
+            'used_memory': sum(shard.used_memory for shard in self.shards),
+            'maxmemory': self.maxmemory,
+            'maxmemory_policy': self.maxmemory_policy,
+            'maxmemory_protected': sorted(self.maxmemory_protected),
+            'evicted_keys': sum(shard.evicted for shard in self.shards),
+            'oom_rejections': sum(shard.oom_rejections for shard in self.shards)
+        }
+    
+    def attach_persistence(self, persistence):
+        """Registrar cada escritura en persistence (None para dejar de registrar)"""
+        with self._locked():
+            for shard in self.shards:
+                shard.persistence = persistence
+    
+    def dump(self, on_locked=None):
+        """Copia consistente de todas las claves como (clave, tipo, valor, vencimiento)
+        
+        on_locked se ejecuta con todos los shards bloqueados (p.ej. para rotar el AOF
+        exactamente en el punto de la copia)
+        """
+        entries = []
+        with self._locked():
+            for shard in self.shards:
+                for key, value in shard.data.items():
+                    if isinstance(value, deque):
+                        entry = (key, 'list', list(value))
+                    elif isinstance(value, dict):
+                        entry = (key, 'hash', dict(value))
+                    elif isinstance(value, SortedSet):
+                        entry = (key, 'zset', list(value.scores.items()))
+                    elif isinstance(value, Stream):
+                        entry = (key, 'stream', (value.items(), Stream.format_id(value.last_id)))
+                    else:
+                        entry = (key, 'string', value)
+                    entries.append(entry + (shard.expiry.get(key),))
+            if on_locked is not None:
+                on_locked()
+        return entries
+    
+    def restore(self, entries):
+        """Cargar claves volcadas por dump()"""
+        with self._locked():
+            for key, kind, value, expires_at in entries:
+                if kind == 'list':
+                    value = deque(value)
+                elif kind == 'hash':
+                    value = dict(value)
+                elif kind == 'zset':
+                    zset = SortedSet()
+                    for member, score in value:
+                        zset.add(member, score)
+                    value = zset
+                elif kind == 'stream':
+                    value = Stream.restore(*value)
+                shard = self._shard(key)
+                shard.put(key, value)
+                shard.set_expiry(key, expires_at)
+                shard.account(key)
+    
+    @contextmanager
+    def loading(self):
+        """Suspender la expiración mientras se carga un volcado o se reproduce el AOF"""
+        for shard in self.shards:
+            shard.loading = True
+        try:
+            yield
+        finally:
+            for shard in self.shards:
+                shard.loading = False
+            # Eliminar de una vez lo que venció mientras el proceso estaba detenido
+            now = time.time()
+            for shard in self.shards:
+                with shard:
+                    while shard.expire_batch(now, 1000)[0] == 1000:
+                        pass
+    
+    def dbsize(self):
+        """Número de claves (incluye vencidas aún no eliminadas, como Redis)"""
+        return sum(len(shard.data) for shard in self.shards)
+    
+    def set(self, key, value, exat=None):
+        """Establecer clave; exat es el vencimiento absoluto (timestamp Unix), None = sin TTL"""
+        with self._shard(key) as shard:
+            shard.put(key, value)
+            shard.set_expiry(key, exat)
+            if exat is None:
+                shard.log('set', key, value)
+            else:
+                shard.log('set', key, value, exat)
+            return True
+    
+    def incr(self, key, amount=1):
+        """Incrementar un contador entero"""
+        with self._shard(key) as shard:
+            value = int(shard.get(key) or 0) + amount
+            shard.put(key, str(value))
+            shard.log('incr', key, amount)
+            return value
+    
     def setex(self, key, ttl, value):
         """Establecer clave con TTL"""
-        with self.lock:
-            self.data[key] = value
-            if ttl > 0:
-                self.expiry[key] = time.time() + ttl
+        with self._shard(key) as shard:
+            expires_at = time.time() + ttl if ttl > 0 else None
+            shard.put(key, value)
+            shard.set_expiry(key, expires_at)
+            # Un solo registro con el vencimiento absoluto (como SET ... PXAT de Redis):
+            # una caída no puede dejar la clave en el AOF sin su TTL
+            if expires_at is None:
+                shard.log('set', key, value)
             else:
-                self.expiry.pop(key, None)
+                shard.log('set', key, value, expires_at)
             return True
     
     def get(self, key):
         """Obtener valor de clave"""
-        with self.lock:
-            # Verificar si la clave ha expirado
-            if key in self.expiry and time.time() > self.expiry[key]:
-                self.data.pop(key, None)
-                self.expiry.pop(key, None)
-                return None
-            
-            return self.data.get(key)
+        with self._shard(key) as shard:
+            return shard.get(key)
     
-    def delete(self, key):
-        """Eliminar clave"""
-        with self.lock:
-            self.data.pop(key, None)
-            self.expiry.pop(key, None)
-            return True
+    def exists(self, key):
+        """Verificar si una clave existe (1 o 0, como Redis)"""
+        return 1 if self.get(key) is not None else 0
+    
+    def mget(self, keys, *args):
+        """Obtener varios valores (None si la clave no existe o no es un string)"""
+        keys = [*keys, *args] if isinstance(keys, (list, tuple)) else [keys, *args]
+        with self._locked(keys):
+            values = [self._shard(key).get(key) for key in keys]
+        return [None if isinstance(value, (deque, dict, SortedSet, Stream)) else value for value in values]
+    
+    def mset(self, mapping):
+        """Establecer varias claves sin TTL de forma atómica"""
+        with self._locked(list(mapping)):
+            for key, value in mapping.items():
+                shard = self._shard(key)
+                shard.put(key, value)
+                shard.set_expiry(key, None)
+                shard.log('set', key, value)
+        return True
+    
+    def ttl(self, key):
+        """TTL restante en segundos (-2 si no existe, -1 si no expira)"""
+        with self._shard(key) as shard:
+            if shard.get(key) is None:
+                return -2
+            if key not in shard.expiry:
+                return -1
+            return max(0, int(round(shard.expiry[key] - time.time())))
+    
+    def delete(self, *keys):
+        """Eliminar claves; devuelve cuántas existían"""
+        with self._locked(keys):
+            deleted = 0
+            for key in keys:
+                shard = self._shard(key)
+                expired = shard.is_expired(key)
+                if shard.drop(key) and not expired:
+                    deleted += 1
+                shard.log('delete', key)
+            return deleted
     
     def keys(self, pattern="*"):
         """Obtener claves que coincidan con el patrón"""
-        with self.lock:
-            # Limpiar claves expiradas primero
-            current_time = time.time()
-            expired_keys = [k for k, exp_time in self.expiry.items() if current_time > exp_time]
-            for key in expired_keys:
-                self.data.pop(key, None)
-                self.expiry.pop(key, None)
-            
-            if pattern == "*":
-                return list(self.data.keys())
-            
-            # Filtro simple para patrones
-            import fnmatch
-            return [k for k in self.data.keys() if fnmatch.fnmatch(k, pattern)]
+        prefix = literal_prefix(pattern)
+        matches = compile_pattern(pattern)
+        result = []
+        # Shard a shard: nunca se bloquea todo el espacio de claves a la vez
+        for shard in self.shards:
+            with shard:
+                # Con prefijo (p.ej. 'audit_log:*') solo se visita su espacio de nombres
+                candidates = shard.keys_with_prefix(prefix)
+                # Omitir claves vencidas; su eliminación es tarea de la expiración activa
+                current_time = time.time()
+                result.extend(
+                    key for key in candidates
+                    if not shard.is_expired(key, current_time) and (matches is None or matches(key))
+                )
+        return result
+    
+    def scan(self, cursor=0, match=None, count=None):
+        """Recorrer las claves por partes; devuelve (siguiente cursor, claves), 0 al terminar
+        
+        El cursor codifica shard y cubeta, así que cada llamada solo bloquea un shard
+        y las claves presentes durante todo el recorrido se devuelven una vez
+        """
+        count = count or 10
+        matches = compile_pattern(match)
+        span = self.shards[0].SCAN_BUCKETS
+        index, position = divmod(int(cursor), span)
+        result = []
+        visited = 0
+        while index < len(self.shards) and visited < count:
+            shard = self.shards[index]
+            with shard:
+                position, keys = shard.scan(position, count - visited)
+                current_time = time.time()
+                result.extend(
+                    key for key in keys
+                    if not shard.is_expired(key, current_time) and (matches is None or matches(key))
+                )
+            visited += len(keys)
+            if position is not None:
+                break
+            index, position = index + 1, 0
+        return (index * span + position if index < len(self.shards) else 0), result
+    
+    def scan_iter(self, match=None, count=None):
+        """Iterar todas las claves con SCAN"""
+        cursor = 0
+        while True:
+            cursor, keys = self.scan(cursor, match=match, count=count)
+            yield from keys
+            if cursor == 0:
+                return
+    
+    @staticmethod
+    def _get_list(shard, key, create=False):
+        """Obtener la lista (deque) de una clave, creándola si se pide"""
+        current = shard.get(key)
+        if isinstance(current, deque):
+            return current
+        if not create:
+            return None
+        current = shard.put(key, deque())
+        return current
+    
+    @staticmethod
+    def _list_bounds(length, start, end):
+        """Normalizar índices inclusivos (admite negativos) como Redis; None si el rango es vacío"""
+        if start < 0:
+            start = max(length + start, 0)
+        if end < 0:
+            end = length + end
+        end = min(end, length - 1)
+        if start > end:
+            return None
+        return start, end
+    
+    def _pop_list(self, command, key, count, pop):
+        with self._shard(key) as shard:
+            lst = self._get_list(shard, key)
+            if lst is None:
+                return None
+            items = [pop(lst) for _ in range(min(count or 1, len(lst)))]
+            if not lst:
+                shard.drop(key)
+            shard.log(command, key, count)
+            return items if count is not None else items[0]
     
     def lpush(self, key, *values):
-        """Agregar valores al inicio de una lista"""
-        with self.lock:
-            if key not in self.data:
-                self.data[key] = []
-            elif not isinstance(self.data[key], list):
-                self.data[key] = []
-            
-            for value in values:
-                self.data[key].insert(0, value)
-            return len(self.data[key])
+        """Agregar valores al inicio de una lista (O(1) por valor)"""
+        with self._shard(key) as shard:
+            lst = self._get_list(shard, key, create=True)
+            lst.extendleft(values)
+            shard.log('lpush', key, *values)
+            return len(lst)
+    
+    def rpush(self, key, *values):
+        """Agregar valores al final de una lista (O(1) por valor)"""
+        with self._shard(key) as shard:
+            lst = self._get_list(shard, key, create=True)
+            lst.extend(values)
+            shard.log('rpush', key, *values)
+            return len(lst)
+    
+    def lpop(self, key, count=None):
+        """Extraer del inicio de una lista (un valor, o una lista si se indica count)"""
+        return self._pop_list('lpop', key, count, deque.popleft)
+    
+    def rpop(self, key, count=None):
+        """Extraer del final de una lista (un valor, o una lista si se indica count)"""
+        return self._pop_list('rpop', key, count, deque.pop)
+    
+    def llen(self, key):
+        """Longitud de una lista"""
+        with self._shard(key) as shard:
+            lst = self._get_list(shard, key)
+            return len(lst) if lst is not None else 0
     
     def lrange(self, key, start, end):
         """Obtener rango de elementos de una lista"""
-        with self.lock:
-            if key not in self.data or not isinstance(self.data[key], list):
+        with self._shard(key) as shard:
+            lst = self._get_list(shard, key)
+            if lst is None:
                 return []
             
-            lst = self.data[key]
-            if end == -1:
-                end = len(lst) - 1
+            bounds = self._list_bounds(len(lst), start, end)
+            if bounds is None:
+                return []
+            start, end = bounds
+            # Recorrer desde el extremo más cercano al rango
+            if start > len(lst) - 1 - end:
+                return list(islice(reversed(lst), len(lst) - 1 - end, len(lst) - start))[::-1]
+            return list(islice(lst, start, end + 1))
+    
+    def ltrim(self, key, start, end):
+        """Conservar solo el rango indicado; el coste es proporcional a lo eliminado"""
+        with self._shard(key) as shard:
+            lst = self._get_list(shard, key)
+            if lst is None:
+                return True
             
-            return lst[start:end+1]
+            shard.log('ltrim', key, start, end)
+            bounds = self._list_bounds(len(lst), start, end)
+            if bounds is None:
+                shard.drop(key)
+                return True
+            start, end = bounds
+            for _ in range(len(lst) - 1 - end):
+                lst.pop()
+            for _ in range(start):
+                lst.popleft()
+            return True
     
     def expire(self, key, ttl):
         """Establecer TTL para una clave existente"""
+        if ttl <= 0:
+            return self.delete(key) > 0
+        return self.expireat(key, time.time() + ttl)
+    
+    def expireat(self, key, timestamp):
+        """Establecer el vencimiento absoluto (epoch en segundos) de una clave existente"""
+        with self._shard(key) as shard:
+            if shard.get(key) is None:
+                return False
+            if timestamp > time.time() or shard.loading:
+                shard.set_expiry(key, timestamp)
+                shard.log('expireat', key, timestamp)
+            else:
+                shard.drop(key)
+                shard.log('delete', key)
+            return True
+    
+    def hset(self, key, field=None, value=None, mapping=None):
+        """Establecer campos de un hash; devuelve cuántos campos son nuevos"""
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, dict):
+                current = shard.put(key, {})
+            added = 0
+            for item_field, item_value in items.items():
+                if item_field not in current:
+                    added += 1
+                current[str(item_field)] = str(item_value)
+            shard.log('hset', key, None, None, items)
+            return added
+    
+    def hget(self, key, field):
+        """Obtener un campo de un hash"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, dict):
+                return None
+            return current.get(field)
+    
+    def hmget(self, key, *fields):
+        """Obtener varios campos de un hash"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, dict):
+                return [None] * len(fields)
+            return [current.get(field) for field in fields]
+    
+    def hgetall(self, key):
+        """Obtener todos los campos de un hash"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, dict):
+                return {}
+            return dict(current)
+    
+    def hlen(self, key):
+        """Número de campos de un hash"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            return len(current) if isinstance(current, dict) else 0
+    
+    def hexists(self, key, field):
+        """Verificar si un hash tiene un campo"""
+        return self.hget(key, field) is not None
+    
+    def hincrby(self, key, field, amount=1):
+        """Incrementar un campo entero de un hash"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, dict):
+                current = shard.put(key, {})
+            value = int(current.get(str(field), 0)) + amount
+            current[str(field)] = str(value)
+            shard.log('hincrby', key, field, amount)
+            return value
+    
+    def hdel(self, key, *fields):
+        """Eliminar campos de un hash"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, dict):
+                return 0
+            removed = sum(1 for field in fields if current.pop(field, None) is not None)
+            if not current:
+                shard.drop(key)
+            shard.log('hdel', key, *fields)
+            return removed
+    
+    def zadd(self, key, mapping):
+        """Agregar miembros a un conjunto ordenado"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, SortedSet):
+                current = shard.put(key, SortedSet())
+            shard.log('zadd', key, mapping)
+            return sum(current.add(str(member), float(score)) for member, score in mapping.items())
+    
+    def zrem(self, key, *members):
+        """Eliminar miembros de un conjunto ordenado"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, SortedSet):
+                return 0
+            removed = sum(current.remove(member) for member in members)
+            if not current:
+                shard.drop(key)
+            shard.log('zrem', key, *members)
+            return removed
+    
+    def zcard(self, key):
+        """Número de miembros de un conjunto ordenado"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            return len(current) if isinstance(current, SortedSet) else 0
+    
+    def zrange(self, key, start, end, withscores=False):
+        """Miembros por posición, de menor a mayor score"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, SortedSet):
+                return []
+            items = current.range(start, end)
+            return items if withscores else [member for member, _ in items]
+    
+    def zpopmin(self, key, count=None):
+        """Extraer los miembros de menor score"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, SortedSet):
+                return []
+            popped = current.pop_min(count or 1)
+            if not current:
+                shard.drop(key)
+            shard.log('zpopmin', key, count)
+            return popped
+    
+    def zscore(self, key, member):
+        """Score de un miembro (None si no existe)"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            return current.scores.get(member) if isinstance(current, SortedSet) else None
+    
+    def zrangebyscore(self, key, min, max, start=None, num=None, withscores=False):
+        """Miembros con score entre min y max (admite '-inf', '+inf' y '(' exclusivo)"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, SortedSet):
+                return []
+            first, last = current.score_bounds(min, max)
+            if start is not None:
+                first = first + start
+                if num is not None and num >= 0:
+                    last = builtins.min(last, first + num)
+            items = current.slice(first, last)
+            return items if withscores else [member for member, _ in items]
+    
+    def zremrangebyscore(self, key, min, max):
+        """Eliminar los miembros con score entre min y max"""
+        with self._shard(key) as shard:
+            current = shard.get(key)
+            if not isinstance(current, SortedSet):
+                return 0
+            removed = current.remove_range(*current.score_bounds(min, max))
+            if not current:
+                shard.drop(key)
+            shard.log('zremrangebyscore', key, min, max)
+            return removed
+    
+    @staticmethod
+    def _get_stream(shard, key):
+        current = shard.get(key)
+        return current if isinstance(current, Stream) else None
+    
+    def xadd(self, name, fields, id='*', maxlen=None, approximate=True):
+        """Agregar una entrada a un stream; devuelve su ID
+        
+        Con maxlen el recorte es siempre exacto (Redis permite recortar de más
+        con approximate, nunca de menos)
+        """
+        with self._shard(name) as shard:
+            stream = self._get_stream(shard, name) or Stream()
+            entry_id = stream.next_id(id)
+            stream.add(entry_id, {str(field): str(value) for field, value in fields.items()})
+            if maxlen is not None:
+                stream.trim(maxlen)
+            shard.put(name, stream)
+            entry_id = Stream.format_id(entry_id)
+            # El ID generado se registra para que la reproducción sea idéntica
+            shard.log('xadd', name, fields, entry_id, maxlen)
+        with self.stream_condition:
+            self.stream_condition.notify_all()
+        return entry_id
+    
+    def xlen(self, name):
+        """Número de entradas de un stream"""
+        with self._shard(name) as shard:
+            stream = self._get_stream(shard, name)
+            return len(stream) if stream is not None else 0
+    
+    def xrange(self, name, min='-', max='+', count=None):
+        """Entradas de un stream entre dos IDs, de la más antigua a la más nueva"""
+        with self._shard(name) as shard:
+            stream = self._get_stream(shard, name)
+            return stream.range(min, max, count) if stream is not None else []
+    
+    def xrevrange(self, name, max='+', min='-', count=None):
+        """Entradas de un stream entre dos IDs, de la más nueva a la más antigua"""
+        with self._shard(name) as shard:
+            stream = self._get_stream(shard, name)
+            return stream.range(min, max, count, reverse=True) if stream is not None else []
+    
+    def xdel(self, name, *ids):
+        """Eliminar entradas de un stream por ID"""
+        with self._shard(name) as shard:
+            stream = self._get_stream(shard, name)
+            if stream is None:
+                return 0
+            removed = stream.delete(ids)
+            shard.log('xdel', name, *ids)
+            return removed
+    
+    def xtrim(self, name, maxlen, approximate=True):
+        """Recortar un stream a sus maxlen entradas más recientes"""
+        with self._shard(name) as shard:
+            stream = self._get_stream(shard, name)
+            if stream is None:
+                return 0
+            removed = stream.trim(maxlen)
+            shard.log('xtrim', name, maxlen)
+            return removed
+    
+    def xread(self, streams, count=None, block=None):
+        """Leer entradas posteriores a los IDs indicados ('$' = solo las nuevas)
+        
+        Con block (milisegundos, 0 = sin límite) espera a que llegue alguna entrada
+        """
+        positions = {}
+        for name, last_id in streams.items():
+            if last_id == '$':
+                with self._shard(name) as shard:
+                    stream = self._get_stream(shard, name)
+                    positions[name] = stream.last_id if stream is not None else (0, 0)
+            else:
+                positions[name] = Stream.parse_id(last_id)
+        deadline = time.time() + block / 1000 if block else None
+        while True:
+            result = []
+            for name, last_id in positions.items():
+                with self._shard(name) as shard:
+                    stream = self._get_stream(shard, name)
+                    entries = stream.after(last_id, count) if stream is not None else []
+                if entries:
+                    result.append([name, entries])
+            if result or block is None:
+                return result
+            remaining = deadline - time.time() if deadline is not None else self.STREAM_POLL_INTERVAL
+            if remaining <= 0:
+                return []
+            # El aviso de XADD despierta antes; el sondeo cubre a otros procesos
+            with self.stream_condition:
+                self.stream_condition.wait(min(remaining, self.STREAM_POLL_INTERVAL))
+    
+    def pipeline(self, transaction=True):
+        """Crear un pipeline: los comandos se ejecutan juntos bajo los mismos locks"""
+        return InMemoryPipeline(self)
+    
+    @staticmethod
+    def _command_keys(name, args, kwargs):
+        """Claves de un comando encolado en un pipeline (None si no se conocen)"""
+        if name in ('ping', 'publish'):
+            return []
+        if name == 'delete':
+            return list(args)
+        if name in SINGLE_KEY_COMMANDS:
+            return [args[0] if args else kwargs.get('key', kwargs.get('name'))]
+        if name == 'mget':
+            keys = args[0] if args else kwargs['keys']
+            return [*keys, *args[1:]] if isinstance(keys, (list, tuple)) else list(args)
+        if name == 'mset':
+            return list(args[0] if args else kwargs['mapping'])
+        if name == 'evalsha':
+            return list(args[2:2 + int(args[1])])
+        return None
+    
+    def script_load(self, script):
+        """Registrar un script Lua usando su equivalente en Python"""
+        sha = hashlib.sha1(script.encode('utf-8')).hexdigest()
+        if sha not in PYTHON_IMPLEMENTATIONS:
+            raise ResponseError("Script sin implementación equivalente en Python")
         with self.lock:
-            if key in self.data:
-                if ttl > 0:
-                    self.expiry[key] = time.time() + ttl
-                else:
-                    self.expiry.pop(key, None)
-                return True
-            return False
+            self.scripts[sha] = PYTHON_IMPLEMENTATIONS[sha]
+        return sha
+    
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        """Ejecutar un script registrado de forma atómica sobre los shards de sus claves"""
+        impl = self.scripts.get(sha)
+        if impl is None:
+            raise NoScriptError("No matching script. Please use EVAL.")
+        keys = list(keys_and_args[:numkeys])
+        args = [str(arg) for arg in keys_and_args[numkeys:]]
+        # Como en Redis Cluster, las claves que el script construya deben
+        # compartir hash tag con KEYS (mismo shard, ya bloqueado)
+        with self._locked(keys):
+            return impl(self, keys, args)
+    
+    def pubsub(self, ignore_subscribe_messages=False):
+        """Crear un objeto de suscripción a canales"""
+        return InMemoryPubSub(self, ignore_subscribe_messages)
+    
+    def publish(self, channel, message):
+        """Publicar un mensaje; devuelve el número de suscriptores que lo reciben"""
+        with self.lock:
+            receivers = list(self.subscribers.get(channel, ()))
+        for subscriber in receivers:
+            subscriber._deliver(channel, str(message))
+        return len(receivers)
+    
+    def _add_subscriber(self, channel, subscriber):
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(subscriber)
+    
+    def _remove_subscriber(self, channel, subscriber):
+        with self.lock:
+            self.subscribers.get(channel, set()).discard(subscriber)
     
     def ping(self):
         """Simular comando ping"""
@@ -150,6 +1744,8 @@ if __name__ == "__main__":
     redis_client.lpush("test:list", "item1", "item2", "item3")
     items = redis_client.lrange("test:list", 0, -1)
     print(f"Lista: {items}")
+    redis_client.ltrim("test:list", 0, 1)
+    print(f"Lista recortada: {redis_client.lrange('test:list', -2, -1)}")
     
     print("Simulador Redis funcionando correctamente!")
 
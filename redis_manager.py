@@ -1,7 +1,14 @@
 import json
 import logging
+import time
+import uuid
 from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
 from config import Config
+from redis_alternative import NoScriptError as InMemoryNoScriptError
+from redis_scripts import SCRIPTS
+from revocation_cache import RevocationCache, UserCache
+from redis_sharding import PUBSUB_TAG, ShardedRedis, create_cluster_client, parse_nodes
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -10,172 +17,680 @@ logger = logging.getLogger(__name__)
 # Intentar importar Redis, si no está disponible usar simulador
 try:
     import redis
+    from redis.backoff import ExponentialBackoff
+    from redis.retry import Retry
     REDIS_AVAILABLE = True
+    REDIS_CONNECTION_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+    NO_SCRIPT_ERRORS = (redis.exceptions.NoScriptError, InMemoryNoScriptError)
 except ImportError:
     REDIS_AVAILABLE = False
+    REDIS_CONNECTION_ERRORS = ()
+    NO_SCRIPT_ERRORS = (InMemoryNoScriptError,)
     logger.warning("Redis no está instalado, usando simulador en memoria")
 
+# Estados posibles del backend
+STATE_CONNECTED = 'connected'   # Redis real respondiendo
+STATE_DEGRADED = 'degraded'     # Redis real con errores, sonda en curso
+STATE_FALLBACK = 'fallback'     # Usando el simulador en memoria
+
+AUDIT_TTL = 2592000  # 30 días
+
+# Eventos publicados en REVOCATION_CHANNEL como "<seq>:<json>"
+EVENT_REVOKE = 'revoke'            # {jti}
+EVENT_LOGOUT_ALL = 'logout_all'    # {user_id, jtis}
+EVENT_USER_CHANGE = 'user_change'  # {user_id}
+EVENT_RESYNC = 'resync'            # {} descartar todas las cachés locales
+
+# Contador de secuencia de eventos (comparte nodo con el canal en modo sharded)
+EVENTS_SEQ_KEY = f"revocation_events_seq:{PUBSUB_TAG}"
+
+# Diseño de claves: todas las claves de un usuario llevan el hash tag {u:<id>}
+# para que sesión, índice de JTIs, tokens revocados y auditoría compartan
+# nodo (sharding) o slot (Redis Cluster) y los scripts multi-clave funcionen
+def user_tag(user_id):
+    return f"{{u:{user_id}}}"
+
+def revoked_token_prefix(user_id):
+    return f"revoked_token:{user_tag(user_id)}:"
+
+def revoked_token_key(user_id, jti):
+    return f"{revoked_token_prefix(user_id)}{jti}"
+
+def user_revoked_tokens_key(user_id):
+    return f"user_revoked_tokens:{user_tag(user_id)}"
+
+def user_session_prefix(user_id):
+    return f"session:{user_tag(user_id)}:"
+
+def user_session_key(user_id, session_id):
+    return f"{user_session_prefix(user_id)}{session_id}"
+
+def user_sessions_index_key(user_id):
+    # Conjunto ordenado sid -> instante de login (la sesión más antigua primero)
+    return f"user_sessions:{user_tag(user_id)}"
+
+def audit_log_key(user_id, timestamp):
+    # Sufijo aleatorio para que dos acciones en el mismo milisegundo no colisionen
+    return f"audit_log:{user_tag(user_id)}:{timestamp}:{uuid.uuid4().hex[:8]}"
+
+def user_audit_keys_key(user_id):
+    return f"user_audit_keys:{user_tag(user_id)}"
+
 class RedisManager:
     def __init__(self):
         self.redis_client = None
+        self.connection_pools = []
+        self.fallback_client = None
+        self.fallback_persistence = None
+        self.state = None
+        self.state_since = None
+        # Tras usar un Redis real, el simulador ya no tiene todas las revocaciones
+        self.real_redis_seen = False
+        self.last_error = None
+        self.metrics = {
+            'connection_errors': 0,
+            'reconnects': 0,
+            'fallbacks': 0,
+            'probe_failures': 0,
+            'events_received': 0,
+            'event_gaps': 0,
+            'resyncs': 0
+        }
+        self.revocation_cache = RevocationCache(Config.REVOCATION_CACHE_SIZE, Config.REVOCATION_CACHE_NEGATIVE_TTL)
+        self.user_cache = UserCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+        # Último número de secuencia aplicado (None tras (re)suscribirse)
+        self.last_event_seq = None
+        self._state_lock = Lock()
+        self._probe_wakeup = Event()
+        self._stop = Event()
+        self._probe_thread = None
+        self._subscriber_thread = None
+        # Callbacks state -> None invocados tras cada cambio de estado
+        self.state_listeners = []
         self.connect()
+        self._start_health_probe()
+        self._start_invalidation_subscriber()
+    
+    def _create_pool(self, host, port):
+        """Crear un pool de conexiones hacia un nodo Redis"""
+        return redis.ConnectionPool(
+            host=host,
+            port=port,
+            password=Config.REDIS_PASSWORD,
+            db=Config.REDIS_DB,
+            decode_responses=Config.REDIS_DECODE_RESPONSES,
+            protocol=Config.REDIS_PROTOCOL,
+            max_connections=Config.REDIS_MAX_CONNECTIONS,
+            socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=Config.REDIS_SOCKET_TIMEOUT,
+            # Un reintento por comando: el pool reabre la conexión de forma perezosa
+            retry=Retry(ExponentialBackoff(cap=Config.REDIS_BACKOFF_MAX, base=Config.REDIS_BACKOFF_BASE), 1),
+            retry_on_error=list(REDIS_CONNECTION_ERRORS)
+        )
+    
+    def _create_real_client(self):
+        """Crear cliente Redis según REDIS_MODE; devuelve (pools, cliente)"""
+        if Config.REDIS_MODE == 'cluster':
+            # RedisCluster gestiona sus propios pools por nodo
+            client = create_cluster_client(
+                Config.REDIS_NODES,
+                password=Config.REDIS_PASSWORD,
+                decode_responses=Config.REDIS_DECODE_RESPONSES,
+                max_connections=Config.REDIS_MAX_CONNECTIONS,
+                socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=Config.REDIS_SOCKET_TIMEOUT
+            )
+            return [], client
+        
+        if Config.REDIS_MODE == 'sharded':
+            pools = [self._create_pool(host, port) for host, port in parse_nodes(Config.REDIS_NODES)]
+            clients = [redis.Redis(connection_pool=pool) for pool in pools]
+            return pools, ShardedRedis(clients)
+        
+        pool = self._create_pool(Config.REDIS_HOST, Config.REDIS_PORT)
+        return [pool], redis.Redis(connection_pool=pool)
+    
+    def _get_fallback_client(self):
+        """Obtener el simulador en memoria (se reutiliza entre caídas)"""
+        if self.fallback_client is None and Config.INMEMORY_BACKEND == 'shared':
+            try:
+                from redis_shared_memory import SharedMemoryRedis
+                # Un único almacén para todos los workers del host
+                self.fallback_client = SharedMemoryRedis(
+                    Config.INMEMORY_SHARED_PATH or None,
+                    slots=Config.INMEMORY_SHARED_SLOTS,
+                    slot_size=Config.INMEMORY_SHARED_SLOT_SIZE
+                )
+            except Exception as e:
+                logger.error(f"No se pudo abrir el simulador compartido, usando uno por proceso: {e}")
+        if self.fallback_client is None:
+            from redis_alternative import InMemoryRedis
+            from redis_persistence import enable_persistence
+            self.fallback_client = InMemoryRedis(
+                maxmemory=Config.INMEMORY_MAXMEMORY,
+                maxmemory_policy=Config.INMEMORY_MAXMEMORY_POLICY,
+                maxmemory_samples=Config.INMEMORY_MAXMEMORY_SAMPLES,
+                maxmemory_protected=Config.INMEMORY_MAXMEMORY_PROTECTED
+            )
+            # Recuperar revocaciones y sesiones guardadas antes de un reinicio
+            self.fallback_persistence = enable_persistence(self.fallback_client)
+        return self.fallback_client
+    
+    def _set_state(self, state, error=None):
+        """Cambiar el estado del backend y registrarlo"""
+        with self._state_lock:
+            if error is not None:
+                self.last_error = str(error)
+            if self.state == state:
+                return
+            previous = self.state
+            self.state = state
+            self.state_since = time.time()
+        if state == STATE_FALLBACK:
+            self.metrics['fallbacks'] += 1
+        elif state == STATE_CONNECTED and previous is not None:
+            self.metrics['reconnects'] += 1
+        logger.info(f"Estado de Redis: {previous} -> {state}")
+        for listener in self.state_listeners:
+            try:
+                listener(state)
+            except Exception as e:
+                logger.error(f"Error notificando cambio de estado de Redis: {e}")
+    
+    def _use_real_client(self, pools, client):
+        """Activar el cliente Redis real"""
+        old_pools = self.connection_pools
+        # Las invalidaciones del backend anterior ya no llegan
+        self._disable_local_caches()
+        self.connection_pools = pools
+        self.redis_client = client
+        self.real_redis_seen = True
+        for pool in old_pools:
+            pool.disconnect()
+        self._preload_scripts()
+        self._set_state(STATE_CONNECTED)
+    
+    def _use_fallback(self, error):
+        """Activar el simulador en memoria"""
+        self._disable_local_caches()
+        self.redis_client = self._get_fallback_client()
+        self._preload_scripts()
+        self._set_state(STATE_FALLBACK, error)
+    
+    def _preload_scripts(self):
+        """Cargar los scripts al activar un backend (si falla se cargan bajo demanda)"""
+        try:
+            self._load_scripts(self.redis_client)
+        except Exception as e:
+            logger.warning(f"No se pudieron precargar los scripts Lua: {e}")
     
     def connect(self):
         """Establecer conexión con Redis o usar simulador"""
         if not REDIS_AVAILABLE:
             # Usar simulador en memoria
-            from redis_alternative import InMemoryRedis
-            self.redis_client = InMemoryRedis()
+            self._use_fallback("redis no instalado")
             logger.info("Usando simulador Redis en memoria")
             return True
         
+        pools = []
         try:
             # Intentar conectar a Redis real
-            self.redis_client = redis.Redis(
-                host=Config.REDIS_HOST,
-                port=Config.REDIS_PORT,
-                password=Config.REDIS_PASSWORD,
-                db=Config.REDIS_DB,
-                decode_responses=Config.REDIS_DECODE_RESPONSES
-            )
-            # Probar la conexión
-            self.redis_client.ping()
-            logger.info("Conexión a Redis establecida exitosamente")
+            pools, client = self._create_real_client()
+            # Única verificación activa: al arrancar o al reconectar desde la sonda
+            client.ping()
+            self._use_real_client(pools, client)
+            logger.info(f"Conexión a Redis establecida exitosamente (modo {Config.REDIS_MODE})")
+            self._migrate_legacy_revoked_tokens(client)
             return True
         except Exception as e:
             logger.warning(f"Redis no disponible ({e}), usando simulador en memoria")
+            for pool in pools:
+                pool.disconnect()
             # Usar simulador como fallback
-            from redis_alternative import InMemoryRedis
-            self.redis_client = InMemoryRedis()
+            self._use_fallback(e)
             return True
     
+    def _migrate_legacy_revoked_tokens(self, client):
+        """Mover las revocaciones guardadas como revoked_token:<jti> (antes de los hash tags) a su clave actual"""
+        try:
+            migrated = 0
+            for key in client.keys('revoked_token:*'):
+                if '{' in key:
+                    continue
+                data, ttl = client.get(key), client.ttl(key)
+                if data is None:
+                    continue
+                user_id = json.loads(data)['user_id']
+                jti = key[len('revoked_token:'):]
+                if ttl > 0:
+                    client.setex(revoked_token_key(user_id, jti), ttl, data)
+                else:
+                    client.set(revoked_token_key(user_id, jti), data)
+                index_key = user_revoked_tokens_key(user_id)
+                client.lpush(index_key, jti)
+                if ttl > 0 and client.ttl(index_key) < ttl:
+                    client.expire(index_key, ttl)
+                client.delete(key)
+                migrated += 1
+            if migrated:
+                logger.info(f"{migrated} tokens revocados migrados al formato de clave con hash tag")
+        except Exception as e:
+            logger.error(f"Error migrando tokens revocados con el formato de clave anterior: {e}")
+    
     def disconnect(self):
         """Cerrar conexión con Redis"""
+        self._stop.set()
+        self._probe_wakeup.set()
         if self.redis_client:
             self.redis_client.close()
-            logger.info("Conexión a Redis cerrada")
+        for pool in self.connection_pools:
+            pool.disconnect()
+        logger.info("Conexión a Redis cerrada")
     
     def is_connected(self):
-        """Verificar si Redis está conectado"""
+        """Verificar si hay un backend utilizable (sin enviar PING)"""
+        return self.state in (STATE_CONNECTED, STATE_FALLBACK)
+    
+    def get_metrics(self):
+        """Obtener estado y contadores de la conexión"""
+        in_memory = None
+        if self.fallback_client is not None:
+            in_memory = {
+                'keys': self.fallback_client.dbsize(),
+                **self.fallback_client.stats,
+                'memory': self.fallback_client.get_memory_stats(),
+                'locks': self.fallback_client.get_lock_stats(),
+                'persistence': self.fallback_persistence.get_metrics() if self.fallback_persistence else None
+            }
+        return {
+            'state': self.state,
+            'backend': 'in_memory' if self.state == STATE_FALLBACK else 'redis',
+            'mode': Config.REDIS_MODE,
+            'state_since': datetime.utcfromtimestamp(self.state_since).isoformat() if self.state_since else None,
+            'last_error': self.last_error,
+            **self.metrics,
+            'last_event_seq': self.last_event_seq,
+            'revocation_cache': self.revocation_cache.get_metrics(),
+            'user_cache': self.user_cache.get_metrics(),
+            'in_memory': in_memory
+        }
+    
+    def _handle_command_error(self, error):
+        """Registrar un error de comando; los de conexión degradan el estado"""
+        if not isinstance(error, REDIS_CONNECTION_ERRORS):
+            return
+        self.metrics['connection_errors'] += 1
+        if self.state == STATE_CONNECTED:
+            self._set_state(STATE_DEGRADED, error)
+            # Despertar la sonda para decidir cuanto antes
+            self._probe_wakeup.set()
+    
+    def _start_health_probe(self):
+        """Iniciar la sonda de salud en segundo plano"""
+        if not REDIS_AVAILABLE or self._probe_thread is not None:
+            return
+        self._probe_thread = Thread(target=self._health_probe_loop, name='redis-health-probe', daemon=True)
+        self._probe_thread.start()
+    
+    def _start_invalidation_subscriber(self):
+        """Iniciar el suscriptor de eventos que invalida las cachés locales"""
+        if self._subscriber_thread is not None:
+            return
+        self._subscriber_thread = Thread(target=self._invalidation_loop, name='redis-revocation-subscriber', daemon=True)
+        self._subscriber_thread.start()
+    
+    def _invalidation_loop(self):
+        """Escuchar el canal de eventos y aplicarlos a las cachés locales"""
+        failures = 0
+        while not self._stop.is_set():
+            client = self.redis_client
+            pubsub = None
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(Config.REVOCATION_CHANNEL)
+                # Solo se confía en las cachés mientras la suscripción está activa
+                self.last_event_seq = None
+                self.revocation_cache.enable()
+                self.user_cache.enable()
+                failures = 0
+                while not self._stop.is_set() and self.redis_client is client:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        self._handle_event_message(message['data'])
+            except Exception as e:
+                self._disable_local_caches()
+                failures += 1
+                logger.warning(f"Suscripción de invalidaciones interrumpida ({e})")
+                self._stop.wait(min(Config.REDIS_BACKOFF_BASE * (2 ** failures), Config.REDIS_BACKOFF_MAX))
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+    
+    def _disable_local_caches(self):
+        self.revocation_cache.disable()
+        self.user_cache.disable()
+    
+    def _resync_local_caches(self):
+        """Descartar todo el estado local; se vuelve a leer del backend bajo demanda"""
+        self.revocation_cache.clear()
+        self.user_cache.clear()
+        self.metrics['resyncs'] += 1
+    
+    def _handle_event_message(self, data):
+        """Aplicar un evento "<seq>:<json>" detectando huecos en la secuencia"""
+        self.metrics['events_received'] += 1
         try:
-            if self.redis_client:
-                self.redis_client.ping()
-                return True
-        except:
-            pass
-        return False
+            seq, _, payload = data.partition(':')
+            seq = int(seq)
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Evento de revocación ilegible, resincronizando: {data!r}")
+            self._resync_local_caches()
+            return
+        
+        if self.last_event_seq is not None and seq != self.last_event_seq + 1:
+            # Se perdieron eventos (o Redis reinició el contador)
+            self.metrics['event_gaps'] += 1
+            logger.warning(f"Hueco en eventos de revocación ({self.last_event_seq} -> {seq}), resincronizando")
+            self._resync_local_caches()
+        self.last_event_seq = seq
+        self._apply_event(event)
     
-    def set_token_revoked(self, jti, token_type, user_id, expires_at):
-        """Marcar token como revocado en Redis"""
+    def _apply_event(self, event):
+        event_type = event.get('type')
+        if event_type == EVENT_REVOKE:
+            self.revocation_cache.invalidate(event['jti'])
+        elif event_type == EVENT_LOGOUT_ALL:
+            for jti in event.get('jtis', []):
+                self.revocation_cache.invalidate(jti)
+            self.user_cache.invalidate(str(event['user_id']))
+        elif event_type == EVENT_USER_CHANGE:
+            self.user_cache.invalidate(str(event['user_id']))
+        elif event_type == EVENT_RESYNC:
+            self._resync_local_caches()
+    
+    def publish_event(self, event_type, **data):
+        """Publicar un evento numerado para todos los workers; devuelve su secuencia"""
         try:
-            if not self.is_connected():
-                self.connect()
+            payload = json.dumps({'type': event_type, **data})
+            return self._run_script('publish_event', [EVENTS_SEQ_KEY], [Config.REVOCATION_CHANNEL, payload])
+        except Exception as e:
+            self._handle_command_error(e)
+            logger.error(f"Error publicando evento {event_type}: {e}")
+            return None
+    
+    def _publish_revocation(self, jti):
+        """Avisar a todos los workers de que un jti fue revocado"""
+        self.publish_event(EVENT_REVOKE, jti=jti)
+    
+    def publish_user_change(self, user_id):
+        """Avisar a todos los workers de que los datos de un usuario cambiaron"""
+        self.publish_event(EVENT_USER_CHANGE, user_id=user_id)
+    
+    def request_resync(self):
+        """Pedir a todos los workers que descarten sus cachés locales"""
+        self.publish_event(EVENT_RESYNC)
+    
+    def _health_probe_loop(self):
+        """Sondear Redis periódicamente con backoff exponencial tras fallos"""
+        failures = 0
+        while not self._stop.is_set():
+            if self.state == STATE_CONNECTED:
+                delay = Config.REDIS_HEALTH_CHECK_INTERVAL
+            else:
+                delay = min(Config.REDIS_BACKOFF_BASE * (2 ** failures), Config.REDIS_BACKOFF_MAX)
+            self._probe_wakeup.wait(delay)
+            self._probe_wakeup.clear()
+            if self._stop.is_set():
+                break
             
-            # Calcular TTL basado en la expiración del token
-            now = datetime.utcnow()
-            if isinstance(expires_at, datetime):
-                ttl = int((expires_at - now).total_seconds())
+            if self._probe_once():
+                failures = 0
             else:
-                ttl = 3600  # 1 hora por defecto
+                failures += 1
+                self.metrics['probe_failures'] += 1
+    
+    def _probe_once(self):
+        """Ejecutar una verificación de salud; devuelve True si Redis responde"""
+        if self.state == STATE_FALLBACK:
+            # Intentar volver a Redis real
+            pools = []
+            try:
+                pools, client = self._create_real_client()
+                client.ping()
+                self._use_real_client(pools, client)
+                logger.info("Conexión a Redis restablecida")
+                return True
+            except Exception as e:
+                for pool in pools:
+                    pool.disconnect()
+                self.last_error = str(e)
+                return False
+        
+        try:
+            self.redis_client.ping()
+            self._set_state(STATE_CONNECTED)
+            return True
+        except Exception as e:
+            logger.warning(f"Sonda de salud de Redis falló ({e}), usando simulador en memoria")
+            self._use_fallback(e)
+            return False
+    
+    def _build_revoked_token(self, jti, token_type, user_id, expires_at):
+        """Construir TTL y datos (JSON) de un token revocado"""
+        # Calcular TTL basado en la expiración del token
+        now = int(time.time())
+        if isinstance(expires_at, datetime):
+            expires_at = int(expires_at.timestamp())
+            ttl = expires_at - now
+        else:
+            ttl = 3600  # 1 hora por defecto
+        
+        # Mismo formato que escriben los scripts Lua (epoch en segundos)
+        token_data = {
+            'jti': jti,
+            'token_type': token_type,
+            'user_id': user_id,
+            'revoked_at': now,
+            'expires_at': expires_at
+        }
+        return ttl, json.dumps(token_data)
+    
+    def _build_audit_entry(self, user_id, action, token_jti=None, ip_address=None, user_agent=None, details=None):
+        """Construir clave y datos (JSON) de una entrada de auditoría"""
+        audit_data = {
+            'user_id': user_id,
+            'action': action,
+            'token_jti': token_jti,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        if details is not None:
+            audit_data['details'] = details
+        
+        # Usar timestamp como parte de la clave para ordenamiento
+        timestamp = int(datetime.utcnow().timestamp() * 1000)  # milisegundos
+        key = audit_log_key(user_id, timestamp)
+        return key, json.dumps(audit_data)
+    
+    def _load_scripts(self, client):
+        """Cargar los scripts Lua en el backend (SCRIPT LOAD)"""
+        for script in SCRIPTS.values():
+            client.script_load(script.lua)
+    
+    def _run_script(self, name, keys, args):
+        """Ejecutar un script con EVALSHA, recargándolo si el backend no lo tiene"""
+        script = SCRIPTS[name]
+        client = self.redis_client
+        try:
+            return client.evalsha(script.sha, len(keys), *keys, *args)
+        except NO_SCRIPT_ERRORS:
+            self._load_scripts(client)
+            return client.evalsha(script.sha, len(keys), *keys, *args)
+    
+    def set_token_revoked(self, jti, token_type, user_id, expires_at, publish=True):
+        """Marcar token como revocado en Redis"""
+        try:
+            ttl, token_data = self._build_revoked_token(jti, token_type, user_id, expires_at)
             
             # Solo almacenar si el token no ha expirado
             if ttl > 0:
-                token_data = {
-                    'jti': jti,
-                    'token_type': token_type,
-                    'user_id': user_id,
-                    'revoked_at': now.isoformat(),
-                    'expires_at': expires_at.isoformat() if isinstance(expires_at, datetime) else expires_at
-                }
+                key = revoked_token_key(user_id, jti)
+                self.redis_client.setex(key, ttl, token_data)
+                
+                # Índice de JTIs revocados del usuario (usado por revoke_all_user_tokens)
+                index_key = user_revoked_tokens_key(user_id)
+                self.redis_client.lpush(index_key, jti)
+                if self.redis_client.ttl(index_key) < ttl:
+                    self.redis_client.expire(index_key, ttl)
                 
-                key = f"revoked_token:{jti}"
-                self.redis_client.setex(key, ttl, json.dumps(token_data))
+                if publish:
+                    self._publish_revocation(jti)
                 logger.info(f"Token {jti} marcado como revocado en Redis")
                 return True
             return False
         except Exception as e:
+            self._handle_command_error(e)
             logger.error(f"Error marcando token como revocado en Redis: {e}")
             return False
     
-    def is_token_revoked(self, jti):
-        """Verificar si un token está revocado en Redis"""
+    def logout_token(self, jti, token_type, user_id, expires_at, session_id=None, ip_address=None, user_agent=None):
+        """Revocar token, eliminar su sesión y auditar en un solo paso atómico"""
         try:
-            if not self.is_connected():
-                self.connect()
+            ttl, token_data = self._build_revoked_token(jti, token_type, user_id, expires_at)
+            audit_key, audit_data = self._build_audit_entry(user_id, 'logout', jti, ip_address, user_agent)
             
-            key = f"revoked_token:{jti}"
-            result = self.redis_client.get(key)
-            return result is not None
+            keys = [
+                revoked_token_key(user_id, jti),
+                user_session_key(user_id, session_id or ''),
+                user_revoked_tokens_key(user_id),
+                audit_key,
+                user_audit_keys_key(user_id),
+                user_sessions_index_key(user_id)
+            ]
+            args = [token_data, ttl, jti, audit_data, AUDIT_TTL, session_id or '', Config.AUDIT_LOG_MAX_ENTRIES]
+            revoked = self._run_script('logout', keys, args)
+            if revoked:
+                self._publish_revocation(jti)
+            
+            logger.info(f"Logout atómico del token {jti} del usuario {user_id} en Redis")
+            return bool(revoked)
         except Exception as e:
-            logger.error(f"Error verificando token revocado en Redis: {e}")
+            self._handle_command_error(e)
+            logger.error(f"Error en logout atómico en Redis: {e}")
             return False
     
-    def revoke_all_user_tokens(self, user_id):
-        """Revocar todos los tokens de un usuario en Redis"""
+    def is_token_revoked(self, jti, user_id, token_exp=None):
+        """Verificar si un token está revocado (caché local y luego Redis)"""
+        cached = self.revocation_cache.get(jti)
+        if cached is not None:
+            return cached
+        
+        generation = self.revocation_cache.generation
+        revoked = self.lookup_token_revoked(jti, user_id)
+        if revoked is None:
+            # Sin respuesta fiable no se puede descartar la revocación
+            return True
+        self.revocation_cache.set(jti, revoked, token_exp, generation)
+        return revoked
+    
+    def revocations_available(self):
+        """El backend actual tiene todas las revocaciones: no es el simulador que
+        sustituye a un Redis real caído (las revocaciones de Redis no están en él)"""
+        return not (self.state == STATE_FALLBACK and self.real_redis_seen)
+    
+    def lookup_token_revoked(self, jti, user_id):
+        """Consultar la revocación directamente en Redis (True/False, None si falla)"""
+        if not self.revocations_available():
+            return None
         try:
-            if not self.is_connected():
-                self.connect()
-            
-            # Buscar todos los tokens del usuario
-            pattern = f"revoked_token:*"
-            keys = self.redis_client.keys(pattern)
+            return self.redis_client.get(revoked_token_key(user_id, jti)) is not None
+        except Exception as e:
+            self._handle_command_error(e)
+            logger.error(f"Error verificando token revocado en Redis: {e}")
+            return None
+    
+    def lookup_tokens_revoked(self, tokens):
+        """Consultar la revocación de varios (jti, user_id) con un MGET (lista True/False, None si falla)"""
+        if not tokens:
+            return []
+        if not self.revocations_available():
+            return None
+        try:
+            keys = [revoked_token_key(user_id, jti) for jti, user_id in tokens]
+            client = self.redis_client
+            # En Redis Cluster los usuarios caen en slots distintos: un MGET por nodo
+            mget = getattr(client, 'mget_nonatomic', client.mget)
+            return [value is not None for value in mget(keys)]
+        except Exception as e:
+            self._handle_command_error(e)
+            logger.error(f"Error verificando tokens revocados en Redis: {e}")
+            return None
+    
+    def revoke_all_user_tokens(self, user_id, ip_address=None, user_agent=None):
+        """Revocar los tokens de todas las sesiones de un usuario, eliminarlas y auditar (atómico)"""
+        try:
+            audit_key, audit_data = self._build_audit_entry(user_id, 'revoke', None, ip_address, user_agent)
             
-            revoked_count = 0
-            for key in keys:
-                token_data = self.redis_client.get(key)
-                if token_data:
-                    data = json.loads(token_data)
-                    if data.get('user_id') == user_id:
-                        # Marcar como revocado masivamente
-                        self.redis_client.setex(key, 3600, token_data)  # 1 hora TTL
-                        revoked_count += 1
+            keys = [
+                user_revoked_tokens_key(user_id),
+                user_sessions_index_key(user_id),
+                audit_key,
+                user_audit_keys_key(user_id)
+            ]
+            args = [
+                revoked_token_prefix(user_id),
+                user_session_prefix(user_id),
+                user_id,
+                int(time.time()),
+                audit_data,
+                AUDIT_TTL,
+                Config.AUDIT_LOG_MAX_ENTRIES
+            ]
+            revoked = self._run_script('revoke_all', keys, args)
+            revoked_tokens = [
+                {'jti': jti, 'token_type': token_type, 'exp': int(exp)}
+                for jti, token_type, exp in revoked
+            ]
+            self.publish_event(EVENT_LOGOUT_ALL, user_id=user_id, jtis=[token['jti'] for token in revoked_tokens])
             
-            logger.info(f"Revocados {revoked_count} tokens del usuario {user_id} en Redis")
-            return True
+            logger.info(f"Revocados {len(revoked_tokens)} tokens del usuario {user_id} en Redis")
+            return revoked_tokens
         except Exception as e:
+            self._handle_command_error(e)
             logger.error(f"Error revocando tokens del usuario en Redis: {e}")
-            return False
+            return None
     
-    def log_audit_action(self, user_id, action, token_jti=None, ip_address=None, user_agent=None):
+    def log_audit_action(self, user_id, action, token_jti=None, ip_address=None, user_agent=None, details=None):
         """Registrar acción de auditoría en Redis"""
         try:
-            if not self.is_connected():
-                self.connect()
-            
-            audit_data = {
-                'user_id': user_id,
-                'action': action,
-                'token_jti': token_jti,
-                'ip_address': ip_address,
-                'user_agent': user_agent,
-                'created_at': datetime.utcnow().isoformat()
-            }
-            
-            # Usar timestamp como parte de la clave para ordenamiento
-            timestamp = int(datetime.utcnow().timestamp() * 1000)  # milisegundos
-            key = f"audit_log:{user_id}:{timestamp}"
+            key, audit_data = self._build_audit_entry(user_id, action, token_jti, ip_address, user_agent, details)
             
             # Almacenar con TTL de 30 días
-            self.redis_client.setex(key, 2592000, json.dumps(audit_data))
+            self.redis_client.setex(key, AUDIT_TTL, audit_data)
             
             # También mantener una lista de claves de auditoría por usuario para consultas rápidas
-            list_key = f"user_audit_keys:{user_id}"
+            list_key = user_audit_keys_key(user_id)
             self.redis_client.lpush(list_key, key)
-            self.redis_client.expire(list_key, 2592000)  # 30 días
+            # Acotar la lista; las entradas descartadas expiran con su propio TTL
+            self.redis_client.ltrim(list_key, 0, Config.AUDIT_LOG_MAX_ENTRIES - 1)
+            self.redis_client.expire(list_key, AUDIT_TTL)
             
             logger.info(f"Acción de auditoría registrada en Redis: {action} para usuario {user_id}")
             return True
         except Exception as e:
+            self._handle_command_error(e)
             logger.error(f"Error registrando auditoría en Redis: {e}")
             return False
     
     def get_user_audit_log(self, user_id, limit=50):
         """Obtener bitácora de auditoría de un usuario desde Redis"""
         try:
-            if not self.is_connected():
-                self.connect()
-            
-            list_key = f"user_audit_keys:{user_id}"
+            list_key = user_audit_keys_key(user_id)
             audit_keys = self.redis_client.lrange(list_key, 0, limit - 1)
             
             audit_log = []
@@ -186,21 +701,19 @@ class RedisManager:
             
             return audit_log
         except Exception as e:
+            self._handle_command_error(e)
             logger.error(f"Error obteniendo auditoría del usuario desde Redis: {e}")
             return []
     
     def get_all_audit_log(self, limit=100):
         """Obtener bitácora de auditoría general desde Redis"""
         try:
-            if not self.is_connected():
-                self.connect()
-            
             # Buscar todas las claves de auditoría
             pattern = f"audit_log:*"
             keys = self.redis_client.keys(pattern)
             
-            # Ordenar por timestamp (las claves incluyen timestamp)
-            keys.sort(reverse=True)
+            # Ordenar por timestamp (penúltimo segmento de la clave)
+            keys.sort(key=lambda k: int(k.rsplit(':', 2)[1]), reverse=True)
             keys = keys[:limit]
             
             audit_log = []
@@ -211,47 +724,100 @@ class RedisManager:
             
             return audit_log
         except Exception as e:
+            self._handle_command_error(e)
             logger.error(f"Error obteniendo auditoría general desde Redis: {e}")
             return []
     
-    def store_user_session(self, user_id, session_data, ttl=3600):
-        """Almacenar datos de sesión del usuario en Redis"""
+    @staticmethod
+    def _flatten_fields(fields):
+        """Convertir un diccionario en [campo, valor, ...] para los scripts"""
+        flat = []
+        for field, value in fields.items():
+            flat.extend([field, '' if value is None else value])
+        return flat
+    
+    def create_user_session(self, user_id, session_id, session_data, ttl=None):
+        """Crear la sesión de un dispositivo; expulsa las más antiguas si se supera el límite
+        y revoca sus tokens. Devuelve los tokens revocados (None si falla)"""
         try:
-            if not self.is_connected():
-                self.connect()
-            
-            key = f"user_session:{user_id}"
-            self.redis_client.setex(key, ttl, json.dumps(session_data))
-            return True
+            ttl = ttl or Config.SESSION_TTL
+            keys = [
+                user_session_key(user_id, session_id),
+                user_sessions_index_key(user_id),
+                user_revoked_tokens_key(user_id)
+            ]
+            args = [
+                session_id,
+                time.time(),
+                ttl,
+                Config.MAX_SESSIONS_PER_USER,
+                user_session_prefix(user_id),
+                revoked_token_prefix(user_id),
+                user_id,
+                *self._flatten_fields(session_data)
+            ]
+            evicted, revoked = self._run_script('create_session', keys, args)
+            revoked_tokens = [
+                {'jti': jti, 'token_type': token_type, 'exp': int(exp)}
+                for jti, token_type, exp in revoked
+            ]
+            if evicted:
+                logger.info(f"Sesiones expulsadas del usuario {user_id} por límite: {evicted}")
+                for token in revoked_tokens:
+                    self._publish_revocation(token['jti'])
+            return revoked_tokens
         except Exception as e:
-            logger.error(f"Error almacenando sesión del usuario en Redis: {e}")
+            self._handle_command_error(e)
+            logger.error(f"Error creando sesión del usuario en Redis: {e}")
+            return None
+    
+    def touch_user_session(self, user_id, session_id, fields=None, ttl=None):
+        """Actualizar campos de una sesión y renovar su TTL; False si ya no existe"""
+        try:
+            ttl = ttl or Config.SESSION_TTL
+            keys = [user_session_key(user_id, session_id), user_sessions_index_key(user_id)]
+            args = [session_id, ttl, *self._flatten_fields(fields or {})]
+            return bool(self._run_script('touch_session', keys, args))
+        except Exception as e:
+            self._handle_command_error(e)
+            logger.error(f"Error renovando sesión del usuario en Redis: {e}")
             return False
     
-    def get_user_session(self, user_id):
-        """Obtener datos de sesión del usuario desde Redis"""
+    def list_user_sessions(self, user_id):
+        """Listar las sesiones vivas de un usuario (de la más antigua a la más reciente)"""
         try:
-            if not self.is_connected():
-                self.connect()
-            
-            key = f"user_session:{user_id}"
-            session_data = self.redis_client.get(key)
-            if session_data:
-                return json.loads(session_data)
-            return None
+            keys = [user_sessions_index_key(user_id)]
+            sessions = self._run_script('list_sessions', keys, [user_session_prefix(user_id)])
+            return [dict(zip(fields[0::2], fields[1::2])) for fields in sessions]
         except Exception as e:
+            self._handle_command_error(e)
+            logger.error(f"Error listando sesiones del usuario en Redis: {e}")
+            return []
+    
+    def get_user_session(self, user_id, session_id):
+        """Obtener datos de una sesión del usuario desde Redis"""
+        try:
+            session_data = self.redis_client.hgetall(user_session_key(user_id, session_id))
+            return session_data or None
+        except Exception as e:
+            self._handle_command_error(e)
             logger.error(f"Error obteniendo sesión del usuario desde Redis: {e}")
             return None
     
-    def delete_user_session(self, user_id):
-        """Eliminar sesión del usuario de Redis"""
+    def delete_user_session(self, user_id, session_id=None):
+        """Eliminar una sesión del usuario, o todas si no se indica session_id"""
         try:
-            if not self.is_connected():
-                self.connect()
-            
-            key = f"user_session:{user_id}"
-            self.redis_client.delete(key)
+            index_key = user_sessions_index_key(user_id)
+            if session_id is None:
+                session_ids = self.redis_client.zrange(index_key, 0, -1)
+                keys = [user_session_key(user_id, sid) for sid in session_ids]
+                self.redis_client.delete(index_key, *keys)
+            else:
+                self.redis_client.delete(user_session_key(user_id, session_id))
+                self.redis_client.zrem(index_key, session_id)
             return True
         except Exception as e:
+            self._handle_command_error(e)
             logger.error(f"Error eliminando sesión del usuario de Redis: {e}")
             return False
 
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Persistencia del simulador Redis en memoria (InMemoryRedis)
+- Snapshot (estilo RDB): volcado consistente de todas las claves con su
+  vencimiento absoluto (cabecera JSON + cuerpo JSON, formato estable entre
+  versiones de Python), escrito en un archivo temporal y renombrado
+- AOF: cada escritura se registra como una línea JSON; un hilo en segundo
+  plano escribe el registro con la política de fsync configurada
+  (always | everysec | no)
+- Compactación: cada snapshot inicia una nueva generación del AOF y elimina
+  las anteriores; se dispara por intervalo o cuando el AOF crece demasiado
+Al arrancar se carga el snapshot mapeado en memoria y se reproducen las
+generaciones del AOF posteriores. Un snapshot ilegible se aparta (no se
+borra) y se reproduce el AOF disponible en lugar de desactivar la persistencia
+Un directorio tiene un único escritor: el proceso que lo usa mantiene un lock
+de fcntl sobre persistence.lock y los demás arrancan sin persistencia
+"""
+
+import atexit
+import glob
+import json
+import logging
+import marshal
+import mmap
+import os
+import time
+from queue import Empty, Queue
+from threading import Event, Lock, Thread, current_thread
+from config import Config
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin lock entre procesos, un solo proceso debe usar el directorio
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = 'dump.snapshot'
+LOCK_FILE = 'persistence.lock'
+AOF_PATTERN = 'appendonly.{}.aof'
+# 1: cuerpo marshal (depende de la versión de Python), 2: cuerpo JSON
+SNAPSHOT_VERSION = 2
+
+FSYNC_POLICIES = ('always', 'everysec', 'no')
+
+# Comandos que se pueden reproducir desde el AOF
+REPLAYABLE = {
+    'set', 'incr', 'expireat', 'delete', 'lpush', 'rpush', 'lpop', 'rpop', 'ltrim',
+    'hset', 'hincrby', 'hdel', 'zadd', 'zrem', 'zpopmin', 'zremrangebyscore',
+    'xadd', 'xdel', 'xtrim'
+}
+
+# Marcador en la cola del escritor: (_ROTATE, generación) cambia de archivo AOF
+_ROTATE = object()
+
+WRITE_BATCH = 1000
+
+# Los locks de fcntl son por proceso: los directorios tomados dentro de este
+# proceso se registran aparte
+_active_directories = set()
+_active_directories_lock = Lock()
+
+
+class Persistence:
+    """Snapshot + AOF de un InMemoryRedis en un directorio"""
+
+    def __init__(self, server, directory, fsync='everysec', snapshot_interval=300, rewrite_size=64 * 1024 * 1024):
+        if fsync not in FSYNC_POLICIES:
+            logger.warning(f"Política de fsync desconocida '{fsync}', usando 'everysec'")
+            fsync = 'everysec'
+        self.server = server
+        self.directory = directory
+        self.fsync = fsync
+        self.snapshot_interval = snapshot_interval
+        self.rewrite_size = rewrite_size
+        # Última generación del AOF asignada (el escritor puede ir por detrás)
+        self.generation = 0
+        self.aof = None
+        self.aof_size = 0
+        self.queue = Queue()
+        # Con fsync=always los llamadores escriben directamente en el AOF
+        self.file_lock = Lock()
+        self.snapshot_lock = Lock()
+        # Se activa cuando el escritor ya cambió a la generación del último snapshot
+        self._rotated = Event()
+        self.last_fsync = time.time()
+        self.last_snapshot = None
+        self.metrics = {
+            'aof_writes': 0,
+            'aof_fsyncs': 0,
+            'aof_errors': 0,
+            'snapshots': 0,
+            'loaded_keys': 0,
+            'replayed_commands': 0,
+            'load_seconds': 0.0
+        }
+        self._stop = Event()
+        self._snapshot_wakeup = Event()
+        self._writer_thread = None
+        self._snapshot_thread = None
+        self._lock_fd = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _acquire_directory(self):
+        """Tomar el directorio en exclusiva: dos escritores mezclarían sus AOF y snapshots"""
+        directory = os.path.realpath(self.directory)
+        with _active_directories_lock:
+            if directory in _active_directories:
+                raise RuntimeError(f"{self.directory} ya lo usa otro InMemoryRedis de este proceso")
+            fd = os.open(self._path(LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+            if fcntl is not None:
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    owner = os.read(fd, 32).decode('ascii', 'replace').strip() or '?'
+                    os.close(fd)
+                    raise RuntimeError(f"{self.directory} ya lo usa el proceso {owner} (persistencia de un solo escritor)")
+                os.ftruncate(fd, 0)
+                os.write(fd, str(os.getpid()).encode('ascii'))
+            _active_directories.add(directory)
+            self._lock_fd = fd
+
+    def _release_directory(self):
+        if self._lock_fd is not None:
+            with _active_directories_lock:
+                # Cerrar el descriptor libera el lock de fcntl
+                os.close(self._lock_fd)
+                self._lock_fd = None
+                _active_directories.discard(os.path.realpath(self.directory))
+
+    def start(self):
+        """Cargar el estado guardado y empezar a registrar las escrituras"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._acquire_directory()
+        try:
+            self.load()
+        except Exception:
+            self._release_directory()
+            raise
+        # Siempre una generación nueva: la anterior pudo quedar con una línea truncada
+        self.generation += 1
+        self._open_aof(self.generation)
+        self.server.attach_persistence(self)
+        if self.fsync != 'always':
+            self._writer_thread = Thread(target=self._writer_loop, name='inmemory-aof-writer', daemon=True)
+            self._writer_thread.start()
+        self._snapshot_thread = Thread(target=self._snapshot_loop, name='inmemory-snapshot', daemon=True)
+        self._snapshot_thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Dejar de registrar y volcar a disco lo pendiente"""
+        if self._stop.is_set():
+            return
+        self.server.attach_persistence(None)
+        self._stop.set()
+        self._snapshot_wakeup.set()
+        if self._writer_thread is not None:
+            self.queue.put(None)
+            self._writer_thread.join(timeout=5)
+        if self._snapshot_thread is not None and self._snapshot_thread is not current_thread():
+            # Un snapshot en curso debe terminar antes de soltar el directorio
+            self._snapshot_thread.join(timeout=30)
+        with self.file_lock:
+            if self.aof is not None:
+                self._sync_aof()
+                self.aof.close()
+                self.aof = None
+        self._release_directory()
+
+    def load(self):
+        """Cargar el snapshot (vía mmap) y reproducir las generaciones del AOF"""
+        start_time = time.time()
+        snapshot_generation = 0
+        with self.server.loading():
+            path = self._path(SNAPSHOT_FILE)
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                try:
+                    snapshot_generation = self._load_snapshot(path)
+                except Exception as e:
+                    # Se conserva para recuperarlo a mano; el próximo snapshot no lo pisa
+                    unreadable_path = f"{path}.unreadable-{int(time.time())}"
+                    os.replace(path, unreadable_path)
+                    logger.error(f"Snapshot ilegible ({e}), movido a {unreadable_path}; "
+                                 f"se reproduce solo el AOF disponible")
+            self.generation = snapshot_generation
+            for generation, aof_path in self._aof_files():
+                if generation >= snapshot_generation:
+                    self._replay_aof(aof_path)
+                    self.generation = max(self.generation, generation)
+        self.metrics['load_seconds'] = round(time.time() - start_time, 4)
+        logger.info(f"Persistencia en memoria: {self.metrics['loaded_keys']} claves del snapshot y "
+                    f"{self.metrics['replayed_commands']} comandos del AOF cargados "
+                    f"({self.metrics['load_seconds'] * 1000:.2f}ms)")
+
+    def _load_snapshot(self, path):
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header = json.loads(data.readline())
+            version = header.get('version')
+            if version == SNAPSHOT_VERSION:
+                entries = json.loads(data[data.tell():])
+            elif version == 1:
+                # Formato anterior: marshal solo es legible con la misma versión de Python
+                with memoryview(data) as view:
+                    entries = marshal.loads(view[data.tell():])
+            else:
+                raise ValueError(f"versión de snapshot no soportada: {version}")
+        self.server.restore(entries)
+        self.metrics['loaded_keys'] += len(entries)
+        return header['aof_generation']
+
+    def _aof_files(self):
+        """Generaciones del AOF presentes, en orden"""
+        files = []
+        for path in glob.glob(self._path(AOF_PATTERN.format('*'))):
+            try:
+                files.append((int(os.path.basename(path).split('.')[1]), path))
+            except ValueError:
+                continue
+        return sorted(files)
+
+    def _replay_aof(self, path):
+        with open(path, 'rb') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    command, *args = json.loads(line)
+                except ValueError:
+                    # Última escritura interrumpida por una caída: se descarta
+                    logger.warning(f"Línea {number} truncada en {path}, se ignora")
+                    continue
+                if command not in REPLAYABLE:
+                    logger.warning(f"Comando desconocido en {path}: {command}")
+                    continue
+                getattr(self.server, command)(*args)
+                self.metrics['replayed_commands'] += 1
+
+    def append(self, command):
+        """Registrar una escritura (se llama con el lock del shard tomado)"""
+        if self.fsync == 'always':
+            with self.file_lock:
+                self._write_lines([command])
+                self._sync_aof()
+        else:
+            self.queue.put(command)
+
+    def _open_aof(self, generation):
+        path = self._path(AOF_PATTERN.format(generation))
+        self.aof = open(path, 'ab')
+        self.aof_size = self.aof.tell()
+
+    def _rotate_aof(self, generation):
+        """Cerrar la generación actual del AOF y continuar en otra"""
+        if self.aof is not None:
+            self._sync_aof()
+            self.aof.close()
+        self._open_aof(generation)
+
+    def _write_lines(self, commands):
+        if self.aof is None:
+            return
+        try:
+            data = b''.join(
+                json.dumps(command, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+                for command in commands
+            )
+            self.aof.write(data)
+            self.aof.flush()
+            self.aof_size += len(data)
+            self.metrics['aof_writes'] += len(commands)
+        except Exception as e:
+            self.metrics['aof_errors'] += 1
+            logger.error(f"Error escribiendo el AOF: {e}")
+            return
+        if self.rewrite_size and self.aof_size > self.rewrite_size:
+            # Compactar: el snapshot sustituye a las generaciones anteriores
+            self._snapshot_wakeup.set()
+
+    def _sync_aof(self):
+        try:
+            self.aof.flush()
+            os.fsync(self.aof.fileno())
+            self.last_fsync = time.time()
+            self.metrics['aof_fsyncs'] += 1
+        except Exception as e:
+            self.metrics['aof_errors'] += 1
+            logger.error(f"Error en fsync del AOF: {e}")
+
+    def _writer_loop(self):
+        """Escribir en lotes las escrituras encoladas y aplicar la política de fsync"""
+        dirty = False
+        while True:
+            try:
+                commands = [self.queue.get(timeout=1)]
+            except Empty:
+                commands = []
+            while commands and len(commands) < WRITE_BATCH:
+                try:
+                    commands.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            batch = []
+            for command in commands:
+                if command is None:
+                    self._write_lines(batch)
+                    return
+                if command[0] is _ROTATE:
+                    self._write_lines(batch)
+                    batch = []
+                    self._rotate_aof(command[1])
+                    self._rotated.set()
+                    dirty = False
+                else:
+                    batch.append(command)
+            if batch:
+                self._write_lines(batch)
+                dirty = True
+            if dirty and self.fsync == 'everysec' and time.time() - self.last_fsync >= 1:
+                self._sync_aof()
+                dirty = False
+
+    def _snapshot_loop(self):
+        while not self._stop.is_set():
+            self._snapshot_wakeup.wait(self.snapshot_interval or None)
+            self._snapshot_wakeup.clear()
+            if self._stop.is_set():
+                return
+            self.snapshot()
+
+    def _start_next_generation(self):
+        # Se ejecuta con todos los shards bloqueados: lo anterior al marcador
+        # está en el snapshot y lo posterior irá a la nueva generación
+        self.generation += 1
+        if self.fsync == 'always':
+            with self.file_lock:
+                self._rotate_aof(self.generation)
+            self._rotated.set()
+        else:
+            self._rotated.clear()
+            self.queue.put((_ROTATE, self.generation))
+
+    def snapshot(self):
+        """Volcar todas las claves a disco y compactar el AOF"""
+        with self.snapshot_lock:
+            start_time = time.time()
+            try:
+                entries = self.server.dump(on_locked=self._start_next_generation)
+                generation = self.generation
+                path = self._path(SNAPSHOT_FILE)
+                temp_path = path + '.tmp'
+                with open(temp_path, 'wb') as f:
+                    header = {
+                        'version': SNAPSHOT_VERSION,
+                        'aof_generation': generation,
+                        'created_at': start_time,
+                        'keys': len(entries)
+                    }
+                    f.write(json.dumps(header).encode('utf-8') + b'\n')
+                    f.write(json.dumps(entries, separators=(',', ':')).encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, path)
+            except Exception as e:
+                logger.error(f"Error guardando el snapshot en memoria: {e}")
+                return False
+
+            # Las generaciones anteriores ya están contenidas en el snapshot;
+            # se borran cuando el escritor ya no puede volver a crearlas
+            self._rotated.wait(5)
+            for aof_generation, aof_path in self._aof_files():
+                if aof_generation < generation:
+                    try:
+                        os.remove(aof_path)
+                    except OSError:
+                        pass
+            self.last_snapshot = time.time()
+            self.metrics['snapshots'] += 1
+            logger.info(f"Snapshot en memoria guardado: {len(entries)} claves "
+                        f"({(self.last_snapshot - start_time) * 1000:.2f}ms)")
+            return True
+
+    def get_metrics(self):
+        return {
+            'fsync': self.fsync,
+            'aof_generation': self.generation,
+            'aof_size': self.aof_size,
+            'queue_size': self.queue.qsize(),
+            'last_snapshot': self.last_snapshot,
+            **self.metrics
+        }
+
+
+def enable_persistence(server):
+    """Activar la persistencia configurada (INMEMORY_PERSISTENCE_DIR) en un InMemoryRedis"""
+    if not Config.INMEMORY_PERSISTENCE_DIR:
+        return None
+    try:
+        return Persistence(
+            server,
+            Config.INMEMORY_PERSISTENCE_DIR,
+            fsync=Config.INMEMORY_AOF_FSYNC,
+            snapshot_interval=Config.INMEMORY_SNAPSHOT_INTERVAL,
+            rewrite_size=Config.INMEMORY_AOF_REWRITE_SIZE
+        ).start()
+    except Exception as e:
+        logger.error(f"No se pudo activar la persistencia en memoria: {e}")
+        return None
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Scripts Lua atómicos para los flujos de logout, revocación y sesiones en Redis
+Cada script tiene una implementación equivalente en Python que usa el
+simulador en memoria (InMemoryRedis) para que las pruebas sigan siendo locales
+"""
+
+import hashlib
+import json
+
+
+class RedisScript:
+    """Script Lua con su equivalente en Python"""
+
+    def __init__(self, name, lua, python_impl):
+        self.name = name
+        self.lua = lua
+        self.python_impl = python_impl
+        # Redis identifica los scripts por el SHA1 de su código fuente
+        self.sha = hashlib.sha1(lua.encode('utf-8')).hexdigest()
+
+
+def _extend_ttl(client, key, ttl):
+    """Extender el TTL de una clave sin acortarlo nunca"""
+    if client.ttl(key) < ttl:
+        client.expire(key, ttl)
+
+
+def _pairs(values):
+    """Convertir [campo, valor, campo, valor, ...] en diccionario"""
+    return dict(zip(values[0::2], values[1::2]))
+
+
+def _user_id(value):
+    """Id de usuario numérico si lo es, igual que tonumber() en los scripts Lua"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+# Función Lua compartida por REVOKE_ALL y CREATE_SESSION: revoca los tokens de
+# acceso y refresh de una sesión con el mismo formato que
+# RedisManager._build_revoked_token (epoch en segundos, user_id numérico).
+# Añade [jti, tipo, exp] a revoked y devuelve el mayor TTL escrito
+REVOKE_SESSION_TOKENS_LUA = """
+local function revoke_session_tokens(session_key, revoked_prefix, index_key, user_id, now, revoked)
+    local tokens = redis.call('HMGET', session_key, 'access_jti', 'access_exp', 'refresh_jti', 'refresh_exp')
+    local max_ttl = 0
+    for i = 1, 3, 2 do
+        local jti = tokens[i]
+        local exp = tonumber(tokens[i + 1])
+        if jti and exp and exp > now and redis.call('EXISTS', revoked_prefix .. jti) == 0 then
+            local ttl = exp - now
+            local token_type = 'access'
+            if i == 3 then
+                token_type = 'refresh'
+            end
+            local token_data = {
+                jti = jti,
+                token_type = token_type,
+                user_id = tonumber(user_id) or user_id,
+                revoked_at = now,
+                expires_at = exp
+            }
+            redis.call('SETEX', revoked_prefix .. jti, ttl, cjson.encode(token_data))
+            redis.call('LPUSH', index_key, jti)
+            table.insert(revoked, {jti, token_type, tokens[i + 1]})
+            if ttl > max_ttl then
+                max_ttl = ttl
+            end
+        end
+    end
+    return max_ttl
+end
+"""
+
+
+def _revoke_session_tokens(client, session_key, revoked_prefix, index_key, user_id, now, revoked):
+    """Equivalente en Python de revoke_session_tokens"""
+    session = client.hgetall(session_key)
+    max_ttl = 0
+    for token_type in ('access', 'refresh'):
+        jti = session.get(f'{token_type}_jti')
+        exp = session.get(f'{token_type}_exp')
+        if jti and exp and int(exp) > now and not client.exists(revoked_prefix + jti):
+            ttl = int(exp) - now
+            token_data = {
+                'jti': jti,
+                'token_type': token_type,
+                'user_id': _user_id(user_id),
+                'revoked_at': now,
+                'expires_at': int(exp)
+            }
+            client.setex(revoked_prefix + jti, ttl, json.dumps(token_data))
+            client.lpush(index_key, jti)
+            revoked.append([jti, token_type, exp])
+            max_ttl = max(max_ttl, ttl)
+    return max_ttl
+
+
+# KEYS[1] = revoked_token:{u:<id>}:<jti>
+# KEYS[2] = session:{u:<id>}:<sid>
+# KEYS[3] = user_revoked_tokens:{u:<id>} (índice de JTIs revocados)
+# KEYS[4] = audit_log:{u:<id>}:<timestamp>:<sufijo>
+# KEYS[5] = user_audit_keys:{u:<id>}
+# KEYS[6] = user_sessions:{u:<id>} (índice de sesiones por fecha de login)
+# ARGV[1] = datos del token revocado (JSON)
+# ARGV[2] = TTL del token revocado (segundos)
+# ARGV[3] = jti
+# ARGV[4] = datos de auditoría (JSON)
+# ARGV[5] = TTL de auditoría (segundos)
+# ARGV[6] = id de la sesión a cerrar
+# ARGV[7] = máximo de entradas en la lista de auditoría del usuario
+LOGOUT_LUA = """
+local token_ttl = tonumber(ARGV[2])
+if token_ttl > 0 then
+    redis.call('SETEX', KEYS[1], token_ttl, ARGV[1])
+    redis.call('LPUSH', KEYS[3], ARGV[3])
+    if redis.call('TTL', KEYS[3]) < token_ttl then
+        redis.call('EXPIRE', KEYS[3], token_ttl)
+    end
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[6], ARGV[6])
+local audit_ttl = tonumber(ARGV[5])
+redis.call('SETEX', KEYS[4], audit_ttl, ARGV[4])
+redis.call('LPUSH', KEYS[5], KEYS[4])
+redis.call('LTRIM', KEYS[5], 0, tonumber(ARGV[7]) - 1)
+redis.call('EXPIRE', KEYS[5], audit_ttl)
+if token_ttl > 0 then
+    return 1
+end
+return 0
+"""
+
+
+def _logout_python(client, keys, args):
+    """Equivalente en Python de LOGOUT_LUA"""
+    token_ttl = int(args[1])
+    if token_ttl > 0:
+        client.setex(keys[0], token_ttl, args[0])
+        client.lpush(keys[2], args[2])
+        _extend_ttl(client, keys[2], token_ttl)
+    client.delete(keys[1])
+    client.zrem(keys[5], args[5])
+    audit_ttl = int(args[4])
+    client.setex(keys[3], audit_ttl, args[3])
+    client.lpush(keys[4], keys[3])
+    client.ltrim(keys[4], 0, int(args[6]) - 1)
+    client.expire(keys[4], audit_ttl)
+    return 1 if token_ttl > 0 else 0
+
+
+# KEYS[1] = user_revoked_tokens:{u:<id>}
+# KEYS[2] = user_sessions:{u:<id>}
+# KEYS[3] = audit_log:{u:<id>}:<timestamp>:<sufijo>
+# KEYS[4] = user_audit_keys:{u:<id>}
+# ARGV[1] = prefijo de las claves de tokens revocados del usuario
+# ARGV[2] = prefijo de las claves de sesión del usuario
+# ARGV[3] = id del usuario
+# ARGV[4] = instante actual (segundos epoch)
+# ARGV[5] = datos de auditoría (JSON)
+# ARGV[6] = TTL de auditoría (segundos)
+# ARGV[7] = máximo de entradas en la lista de auditoría del usuario
+# Revoca los tokens de acceso y refresh de todas las sesiones, elimina las
+# sesiones y poda el índice de JTIs. Devuelve los tokens revocados ahora
+# como listas [jti, tipo, exp]
+REVOKE_ALL_LUA = REVOKE_SESSION_TOKENS_LUA + """
+local now = tonumber(ARGV[4])
+local revoked = {}
+local max_ttl = 0
+local sids = redis.call('ZRANGE', KEYS[2], 0, -1)
+for _, sid in ipairs(sids) do
+    local session_key = ARGV[2] .. sid
+    local ttl = revoke_session_tokens(session_key, ARGV[1], KEYS[1], ARGV[3], now, revoked)
+    if ttl > max_ttl then
+        max_ttl = ttl
+    end
+    redis.call('DEL', session_key)
+end
+redis.call('DEL', KEYS[2])
+local jtis = redis.call('LRANGE', KEYS[1], 0, -1)
+local alive = {}
+for _, jti in ipairs(jtis) do
+    if redis.call('EXISTS', ARGV[1] .. jti) == 1 then
+        table.insert(alive, jti)
+    end
+end
+if #alive < #jtis then
+    local ttl = redis.call('TTL', KEYS[1])
+    redis.call('DEL', KEYS[1])
+    for i = #alive, 1, -1 do
+        redis.call('LPUSH', KEYS[1], alive[i])
+    end
+    if #alive > 0 and ttl > 0 then
+        redis.call('EXPIRE', KEYS[1], ttl)
+    end
+end
+if max_ttl > 0 and redis.call('TTL', KEYS[1]) < max_ttl then
+    redis.call('EXPIRE', KEYS[1], max_ttl)
+end
+local audit_ttl = tonumber(ARGV[6])
+redis.call('SETEX', KEYS[3], audit_ttl, ARGV[5])
+redis.call('LPUSH', KEYS[4], KEYS[3])
+redis.call('LTRIM', KEYS[4], 0, tonumber(ARGV[7]) - 1)
+redis.call('EXPIRE', KEYS[4], audit_ttl)
+return revoked
+"""
+
+
+def _revoke_all_python(client, keys, args):
+    """Equivalente en Python de REVOKE_ALL_LUA"""
+    now = int(args[3])
+    revoked = []
+    max_ttl = 0
+    for sid in client.zrange(keys[1], 0, -1):
+        session_key = args[1] + sid
+        max_ttl = max(max_ttl, _revoke_session_tokens(client, session_key, args[0], keys[0], args[2], now, revoked))
+        client.delete(session_key)
+    client.delete(keys[1])
+    jtis = client.lrange(keys[0], 0, -1)
+    alive = [jti for jti in jtis if client.exists(args[0] + jti)]
+    if len(alive) < len(jtis):
+        ttl = client.ttl(keys[0])
+        client.delete(keys[0])
+        for jti in reversed(alive):
+            client.lpush(keys[0], jti)
+        if alive and ttl > 0:
+            client.expire(keys[0], ttl)
+    if max_ttl > 0:
+        _extend_ttl(client, keys[0], max_ttl)
+    audit_ttl = int(args[5])
+    client.setex(keys[2], audit_ttl, args[4])
+    client.lpush(keys[3], keys[2])
+    client.ltrim(keys[3], 0, int(args[6]) - 1)
+    client.expire(keys[3], audit_ttl)
+    return revoked
+
+
+# KEYS[1] = session:{u:<id>}:<sid>
+# KEYS[2] = user_sessions:{u:<id>}
+# KEYS[3] = user_revoked_tokens:{u:<id>} (índice de JTIs revocados)
+# ARGV[1] = id de la sesión
+# ARGV[2] = score (instante de login)
+# ARGV[3] = TTL de la sesión (segundos)
+# ARGV[4] = máximo de sesiones por usuario (0 = sin límite)
+# ARGV[5] = prefijo de las claves de sesión del usuario
+# ARGV[6] = prefijo de las claves de tokens revocados del usuario
+# ARGV[7] = id del usuario
+# ARGV[8..] = pares campo, valor
+# Las sesiones expulsadas por superar el límite revocan sus tokens, así el
+# dispositivo expulsado queda deslogueado. Devuelve {ids expulsados, tokens
+# revocados como listas [jti, tipo, exp]}
+CREATE_SESSION_LUA = REVOKE_SESSION_TOKENS_LUA + """
+redis.call('HSET', KEYS[1], unpack(ARGV, 8))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+local cap = tonumber(ARGV[4])
+local now = math.floor(tonumber(ARGV[2]))
+local evicted = {}
+local revoked = {}
+local max_ttl = 0
+if cap > 0 and redis.call('ZCARD', KEYS[2]) > cap then
+    for _, sid in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+        if redis.call('EXISTS', ARGV[5] .. sid) == 0 then
+            redis.call('ZREM', KEYS[2], sid)
+        end
+    end
+    while redis.call('ZCARD', KEYS[2]) > cap do
+        local oldest = redis.call('ZPOPMIN', KEYS[2])
+        local ttl = revoke_session_tokens(ARGV[5] .. oldest[1], ARGV[6], KEYS[3], ARGV[7], now, revoked)
+        if ttl > max_ttl then
+            max_ttl = ttl
+        end
+        redis.call('DEL', ARGV[5] .. oldest[1])
+        table.insert(evicted, oldest[1])
+    end
+end
+if max_ttl > 0 and redis.call('TTL', KEYS[3]) < max_ttl then
+    redis.call('EXPIRE', KEYS[3], max_ttl)
+end
+return {evicted, revoked}
+"""
+
+
+def _create_session_python(client, keys, args):
+    """Equivalente en Python de CREATE_SESSION_LUA"""
+    client.hset(keys[0], mapping=_pairs(args[7:]))
+    client.expire(keys[0], int(args[2]))
+    client.zadd(keys[1], {args[0]: float(args[1])})
+    client.expire(keys[1], int(args[2]))
+    cap = int(args[3])
+    now = int(float(args[1]))
+    evicted = []
+    revoked = []
+    max_ttl = 0
+    if cap > 0 and client.zcard(keys[1]) > cap:
+        for sid in client.zrange(keys[1], 0, -1):
+            if not client.exists(args[4] + sid):
+                client.zrem(keys[1], sid)
+        while client.zcard(keys[1]) > cap:
+            oldest, _ = client.zpopmin(keys[1])[0]
+            ttl = _revoke_session_tokens(client, args[4] + oldest, args[5], keys[2], args[6], now, revoked)
+            max_ttl = max(max_ttl, ttl)
+            client.delete(args[4] + oldest)
+            evicted.append(oldest)
+    if max_ttl > 0:
+        _extend_ttl(client, keys[2], max_ttl)
+    return [evicted, revoked]
+
+
+# KEYS[1] = session:{u:<id>}:<sid>
+# KEYS[2] = user_sessions:{u:<id>}
+# ARGV[1] = id de la sesión
+# ARGV[2] = TTL de la sesión (segundos)
+# ARGV[3..] = pares campo, valor a actualizar (opcional)
+# Renueva el TTL (ventana deslizante); devuelve 0 si la sesión ya no existe
+TOUCH_SESSION_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    return 0
+end
+if #ARGV > 2 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+def _touch_session_python(client, keys, args):
+    """Equivalente en Python de TOUCH_SESSION_LUA"""
+    if not client.exists(keys[0]):
+        client.zrem(keys[1], args[0])
+        return 0
+    if len(args) > 2:
+        client.hset(keys[0], mapping=_pairs(args[2:]))
+    client.expire(keys[0], int(args[1]))
+    client.expire(keys[1], int(args[1]))
+    return 1
+
+
+# KEYS[1] = user_sessions:{u:<id>}
+# ARGV[1] = prefijo de las claves de sesión del usuario
+# Devuelve los campos de cada sesión viva (lista plana por sesión, como HGETALL)
+# y poda del índice las sesiones que ya expiraron
+LIST_SESSIONS_LUA = """
+local sessions = {}
+for _, sid in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    local fields = redis.call('HGETALL', ARGV[1] .. sid)
+    if #fields == 0 then
+        redis.call('ZREM', KEYS[1], sid)
+    else
+        table.insert(sessions, fields)
+    end
+end
+return sessions
+"""
+
+
+def _list_sessions_python(client, keys, args):
+    """Equivalente en Python de LIST_SESSIONS_LUA"""
+    sessions = []
+    for sid in client.zrange(keys[0], 0, -1):
+        fields = client.hgetall(args[0] + sid)
+        if not fields:
+            client.zrem(keys[0], sid)
+        else:
+            sessions.append([item for pair in fields.items() for item in pair])
+    return sessions
+
+
+# KEYS[1] = revocation_events_seq:{pubsub}
+# ARGV[1] = canal de eventos
+# ARGV[2] = evento (JSON)
+# Numera y publica el evento en un solo paso: el orden de los números de
+# secuencia coincide con el orden de publicación
+PUBLISH_EVENT_LUA = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('PUBLISH', ARGV[1], seq .. ':' .. ARGV[2])
+return seq
+"""
+
+
+def _publish_event_python(client, keys, args):
+    """Equivalente en Python de PUBLISH_EVENT_LUA"""
+    seq = client.incr(keys[0])
+    client.publish(args[0], f"{seq}:{args[1]}")
+    return seq
+
+
+LOGOUT = RedisScript('logout', LOGOUT_LUA, _logout_python)
+REVOKE_ALL = RedisScript('revoke_all', REVOKE_ALL_LUA, _revoke_all_python)
+CREATE_SESSION = RedisScript('create_session', CREATE_SESSION_LUA, _create_session_python)
+TOUCH_SESSION = RedisScript('touch_session', TOUCH_SESSION_LUA, _touch_session_python)
+LIST_SESSIONS = RedisScript('list_sessions', LIST_SESSIONS_LUA, _list_sessions_python)
+PUBLISH_EVENT = RedisScript('publish_event', PUBLISH_EVENT_LUA, _publish_event_python)
+
+SCRIPTS = {
+    script.name: script
+    for script in (LOGOUT, REVOKE_ALL, CREATE_SESSION, TOUCH_SESSION, LIST_SESSIONS, PUBLISH_EVENT)
+}
+
+# Implementaciones en Python indexadas por SHA1 (usadas por InMemoryRedis)
+PYTHON_IMPLEMENTATIONS = {script.sha: script.python_impl for script in SCRIPTS.values()}
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Reparto de claves entre varios nodos Redis
+- ShardedRedis: hashing consistente del lado del cliente sobre varios nodos
+- ClusterRedis: Redis Cluster nativo (redis.cluster.RedisCluster)
+Ambos respetan los hash tags de Redis ({...}) para que las claves de un
+mismo usuario vivan en el mismo nodo/slot
+"""
+
+import bisect
+import hashlib
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Hash tag del nodo que atiende pub/sub; las claves ligadas a la publicación
+# (p.ej. la secuencia de eventos) lo usan para compartir nodo con el canal
+PUBSUB_TAG = '{pubsub}'
+
+# Comandos cuyo primer argumento es la única clave (se enrutan por ella)
+SINGLE_KEY_COMMANDS = {
+    'get', 'set', 'setex', 'exists', 'ttl', 'expire', 'incr',
+    'lpush', 'rpush', 'lpop', 'rpop', 'llen', 'lrange', 'ltrim',
+    'hset', 'hget', 'hmget', 'hgetall', 'hdel', 'hlen', 'hexists', 'hincrby',
+    'zadd', 'zrem', 'zcard', 'zrange', 'zpopmin', 'zscore', 'zrangebyscore', 'zremrangebyscore',
+    'xadd', 'xlen', 'xrange', 'xrevrange', 'xdel', 'xtrim'
+}
+
+
+def hash_tag(key):
+    """Parte de la clave usada para el hashing (contenido del primer {...} no vacío)"""
+    start = key.find('{')
+    if start != -1:
+        end = key.find('}', start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def parse_nodes(nodes):
+    """Convertir 'host:port,host:port' en [(host, port), ...]"""
+    result = []
+    for node in nodes.split(','):
+        node = node.strip()
+        if not node:
+            continue
+        host, _, port = node.rpartition(':')
+        result.append((host, int(port)))
+    return result
+
+
+class ShardedRedis:
+    """Cliente que reparte las claves entre varios nodos con hashing consistente"""
+
+    def __init__(self, clients, vnodes=160):
+        if not clients:
+            raise ValueError("Se requiere al menos un nodo")
+        self.clients = list(clients)
+        # Anillo de hashing con nodos virtuales para repartir la carga
+        self.ring = []
+        for index in range(len(self.clients)):
+            for vnode in range(vnodes):
+                self.ring.append((self._hash(f"{index}#{vnode}"), index))
+        self.ring.sort()
+        self.ring_hashes = [point for point, _ in self.ring]
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+    def node_index(self, key):
+        """Índice del nodo responsable de una clave"""
+        position = bisect.bisect(self.ring_hashes, self._hash(hash_tag(key)))
+        if position == len(self.ring):
+            position = 0
+        return self.ring[position][1]
+
+    def node_for(self, key):
+        """Cliente responsable de una clave"""
+        return self.clients[self.node_index(key)]
+
+    def __getattr__(self, name):
+        if name in SINGLE_KEY_COMMANDS:
+            def command(key, *args, **kwargs):
+                return getattr(self.node_for(key), name)(key, *args, **kwargs)
+            command.__name__ = name
+            return command
+        raise AttributeError(name)
+
+    def delete(self, *keys):
+        """Eliminar claves agrupándolas por nodo"""
+        by_node = defaultdict(list)
+        for key in keys:
+            by_node[self.node_index(key)].append(key)
+        deleted = 0
+        for index, node_keys in by_node.items():
+            deleted += self.clients[index].delete(*node_keys) or 0
+        return deleted
+
+    def mget(self, keys, *args):
+        """Obtener varios valores con un MGET por nodo, en el orden pedido"""
+        keys = [*keys, *args] if isinstance(keys, (list, tuple)) else [keys, *args]
+        by_node = defaultdict(list)
+        for key in keys:
+            by_node[self.node_index(key)].append(key)
+        values = {}
+        for index, node_keys in by_node.items():
+            values.update(zip(node_keys, self.clients[index].mget(node_keys)))
+        return [values[key] for key in keys]
+
+    def keys(self, pattern="*"):
+        """Consultar el patrón en todos los nodos"""
+        result = []
+        for client in self.clients:
+            result.extend(client.keys(pattern))
+        return result
+
+    def script_load(self, script):
+        """Cargar el script en todos los nodos"""
+        sha = None
+        for client in self.clients:
+            sha = client.script_load(script)
+        return sha
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        """Ejecutar un script en el nodo de sus claves (deben compartir nodo)"""
+        keys = keys_and_args[:numkeys]
+        nodes = {self.node_index(key) for key in keys}
+        if len(nodes) > 1:
+            raise ValueError("Las claves de un script deben compartir hash tag")
+        index = nodes.pop() if nodes else 0
+        return self.clients[index].evalsha(sha, numkeys, *keys_and_args)
+
+    def publish(self, channel, message):
+        """Publicar en el nodo de pub/sub (los suscriptores escuchan en el mismo)"""
+        return self.node_for(PUBSUB_TAG).publish(channel, message)
+
+    def pubsub(self, **kwargs):
+        """Suscripción a canales en el nodo de pub/sub"""
+        return self.node_for(PUBSUB_TAG).pubsub(**kwargs)
+
+    def ping(self):
+        """Verificar todos los nodos (falla si alguno no responde)"""
+        for client in self.clients:
+            client.ping()
+        return True
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+
+try:
+    from redis.cluster import ClusterNode, RedisCluster
+
+    class ClusterRedis(RedisCluster):
+        """RedisCluster cuyo KEYS recorre todos los nodos primarios"""
+
+        def keys(self, pattern="*", **kwargs):
+            # KEYS solo consulta un nodo en modo cluster; SCAN recorre todos
+            return list(self.scan_iter(match=pattern, count=1000))
+
+    def create_cluster_client(nodes, **kwargs):
+        """Crear cliente Redis Cluster a partir de 'host:port,host:port'"""
+        startup_nodes = [ClusterNode(host, port) for host, port in parse_nodes(nodes)]
+        return ClusterRedis(startup_nodes=startup_nodes, **kwargs)
+except ImportError:
+    ClusterRedis = None
+    create_cluster_client = None
+
+
+if __name__ == "__main__":
+    # Prueba local con varios simuladores en memoria actuando como shards
+    from redis_alternative import InMemoryRedis
+    from redis_scripts import LOGOUT
+
+    shards = [InMemoryRedis() for _ in range(3)]
+    client = ShardedRedis(shards)
+
+    print("Probando reparto de claves...")
+    for user_id in range(300):
+        client.setex(f"session:{{u:{user_id}}}:s1", 60, "session")
+    print(f"Claves por shard: {[shard.dbsize() for shard in shards]}")
+
+    # Las claves de un mismo usuario comparten nodo gracias al hash tag
+    user_keys = ["session:{u:42}:s1", "user_sessions:{u:42}", "user_revoked_tokens:{u:42}", "audit_log:{u:42}:1"]
+    print(f"Nodos para las claves del usuario 42: {[client.node_index(k) for k in user_keys]}")
+
+    # Scripts multi-clave sobre un shard
+    sha = client.script_load(LOGOUT.lua)
+    client.evalsha(sha, 6, "revoked_token:{u:42}:abc", "session:{u:42}:s1",
+                   "user_revoked_tokens:{u:42}", "audit_log:{u:42}:1",
+                   "user_audit_keys:{u:42}", "user_sessions:{u:42}",
+                   "{}", 60, "abc", "{}", 60, "s1", 1000)
+    print(f"Token revocado: {client.exists('revoked_token:{u:42}:abc') == 1}")
+    print(f"Claves de auditoría: {client.keys('audit_log:*')}")
+
+    print("Sharding funcionando correctamente!")
@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+"""
+Simulador Redis compartido entre procesos (SharedMemoryRedis)
+- El espacio de claves vive en un archivo mapeado en memoria (por defecto en
+  /dev/shm): todos los workers de un host ven el mismo almacén sin Redis
+- Cada shard es una tabla hash de slots de tamaño fijo con direccionamiento
+  abierto; los valores que no caben en un slot continúan en slots libres
+  encadenados
+- Bloqueo entre procesos con fcntl (un byte del archivo por shard), además
+  del RLock de cada shard dentro del proceso
+- Pub/sub entre procesos con un buffer circular en el mismo archivo
+Los comandos son los de InMemoryRedis: cada shard carga los valores que toca
+un comando y los escribe de vuelta al soltar el lock
+"""
+
+import logging
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+import time
+import weakref
+import zlib
+from collections import deque
+from threading import Event, Lock, RLock, Thread
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: solo está disponible el simulador por proceso
+    fcntl = None
+
+from redis_alternative import InMemoryRedis, ResponseError, Shard, SortedSet, Stream
+from redis_sharding import hash_tag
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'JWTSHM01'
+# magic, shards, slots por shard, tamaño de slot, entradas del ring, tamaño de entrada
+HEADER = struct.Struct('<8sIIIII')
+HEADER_SIZE = 64
+# Contadores de cada shard: claves, slots borrados y slots de continuación
+SHARD_HEADER = struct.Struct('<qqq')
+# Slot: estado, siguiente slot de la cadena, vencimiento, longitud de la clave,
+# longitud del valor (en el slot principal, la total)
+SLOT_HEADER = struct.Struct('<BxxxidHxxI')
+KEY_LENGTH = struct.Struct('<H')
+KEY_LENGTH_OFFSET = 16
+# Último número de secuencia publicado y, por entrada, secuencia y longitud
+RING_HEADER = struct.Struct('<q')
+RING_ENTRY = struct.Struct('<qI')
+
+EMPTY, USED, DELETED, CONTINUATION = 0, 1, 2, 3
+
+# Ocupación máxima de una tabla; por encima se responde OOM como Redis
+MAX_LOAD = 0.9
+
+
+def default_path():
+    """Archivo compartido por defecto (memoria en /dev/shm si existe)"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'jwt_inmemory_redis')
+
+
+def encode(value):
+    if isinstance(value, deque):
+        item = ('l', list(value))
+    elif isinstance(value, dict):
+        item = ('h', value)
+    elif isinstance(value, SortedSet):
+        item = ('z', list(value.scores.items()))
+    elif isinstance(value, Stream):
+        item = ('x', (value.items(), Stream.format_id(value.last_id)))
+    else:
+        item = ('s', value)
+    return marshal.dumps(item)
+
+
+def decode(raw):
+    kind, value = marshal.loads(raw)
+    if kind == 'l':
+        return deque(value)
+    if kind == 'z':
+        zset = SortedSet()
+        for member, score in value:
+            zset.add(member, score)
+        return zset
+    if kind == 'x':
+        return Stream.restore(*value)
+    return value
+
+
+class SlotTable:
+    """Tabla hash de un shard dentro del archivo compartido"""
+
+    def __init__(self, mm, offset, slots, slot_size):
+        self.mm = mm
+        self.offset = offset
+        self.slots_offset = offset + SHARD_HEADER.size
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT_HEADER.size
+        self.alloc_cursor = 0
+
+    def counters(self):
+        """(claves, slots borrados, slots de continuación)"""
+        return SHARD_HEADER.unpack_from(self.mm, self.offset)
+
+    def _add_counters(self, live=0, deleted=0, continuation=0):
+        current = SHARD_HEADER.unpack_from(self.mm, self.offset)
+        SHARD_HEADER.pack_into(self.mm, self.offset, current[0] + live, current[1] + deleted, current[2] + continuation)
+
+    def _at(self, index):
+        return self.slots_offset + index * self.slot_size
+
+    def _find(self, key):
+        """Slot de la clave (None si no está) y slot libre donde insertarla"""
+        mm = self.mm
+        start = zlib.crc32(key) % self.slots
+        free = None
+        for probe in range(self.slots):
+            index = (start + probe) % self.slots
+            position = self._at(index)
+            state = mm[position]
+            if state == EMPTY:
+                return None, index if free is None else free
+            if state == USED:
+                key_length = KEY_LENGTH.unpack_from(mm, position + KEY_LENGTH_OFFSET)[0]
+                body = position + SLOT_HEADER.size
+                if key_length == len(key) and mm[body:body + key_length] == key:
+                    return index, None
+            elif state == DELETED and free is None:
+                free = index
+        return None, free
+
+    def _chain(self, index):
+        """Slots de continuación a partir de index"""
+        chain = []
+        while index >= 0:
+            chain.append(index)
+            index = SLOT_HEADER.unpack_from(self.mm, self._at(index))[1]
+        return chain
+
+    def _value(self, index):
+        """(clave, valor, vencimiento) del slot principal index"""
+        position = self._at(index)
+        _, following, expires, key_length, total = SLOT_HEADER.unpack_from(self.mm, position)
+        body = position + SLOT_HEADER.size
+        key = self.mm[body:body + key_length]
+        first = min(total, self.capacity - key_length)
+        chunks = [self.mm[body + key_length:body + key_length + first]]
+        while following >= 0:
+            position = self._at(following)
+            _, following, _, _, length = SLOT_HEADER.unpack_from(self.mm, position)
+            body = position + SLOT_HEADER.size
+            chunks.append(self.mm[body:body + length])
+        return key, b''.join(chunks), expires or None
+
+    def read(self, key):
+        """(valor, vencimiento) de una clave o None si no existe"""
+        index, _ = self._find(key)
+        if index is None:
+            return None
+        _, value, expires = self._value(index)
+        return value, expires
+
+    def expires(self, key):
+        """Vencimiento de una clave sin leer su valor (None si no tiene o no existe)"""
+        index, _ = self._find(key)
+        if index is None:
+            return None
+        return SLOT_HEADER.unpack_from(self.mm, self._at(index))[2] or None
+
+    def _allocate(self, count):
+        """Reservar count slots libres para continuación; devuelve (índices, borrados reutilizados)"""
+        indexes = []
+        reused = 0
+        position = self.alloc_cursor
+        while len(indexes) < count:
+            state = self.mm[self._at(position)]
+            if state in (EMPTY, DELETED):
+                indexes.append(position)
+                reused += state == DELETED
+            position = (position + 1) % self.slots
+        self.alloc_cursor = position
+        return indexes, reused
+
+    def write(self, key, value, expires=None):
+        """Guardar una clave (sobrescribe la anterior)"""
+        if self.counters()[1] > self.slots // 4:
+            self._rebuild()
+        key_length = len(key)
+        if key_length > self.capacity // 2:
+            raise ResponseError("Clave demasiado larga para el backend compartido")
+        first = self.capacity - key_length
+        needed = max(0, -(-(len(value) - first) // self.capacity))
+
+        index, free = self._find(key)
+        old_chain = self._chain(SLOT_HEADER.unpack_from(self.mm, self._at(index))[1]) if index is not None else []
+        live, _, continuation = self.counters()
+        used = live + continuation - len(old_chain) + (index is None) + needed
+        if (index is None and free is None) or used > self.slots * MAX_LOAD:
+            raise ResponseError("OOM command not allowed: backend compartido lleno")
+
+        for slot in old_chain:
+            self.mm[self._at(slot)] = DELETED
+        self._add_counters(deleted=len(old_chain), continuation=-len(old_chain))
+        if index is None:
+            index = free
+            self._add_counters(live=1, deleted=-(self.mm[self._at(index)] == DELETED))
+        # Marcar el slot principal antes de reservar la continuación
+        self.mm[self._at(index)] = USED
+
+        chain, reused = self._allocate(needed)
+        self._add_counters(deleted=-reused, continuation=needed)
+        for position, slot in enumerate(chain):
+            chunk = value[first + position * self.capacity:first + (position + 1) * self.capacity]
+            following = chain[position + 1] if position + 1 < len(chain) else -1
+            at = self._at(slot)
+            SLOT_HEADER.pack_into(self.mm, at, CONTINUATION, following, 0.0, 0, len(chunk))
+            self.mm[at + SLOT_HEADER.size:at + SLOT_HEADER.size + len(chunk)] = chunk
+
+        at = self._at(index)
+        head = key + value[:first]
+        SLOT_HEADER.pack_into(self.mm, at, USED, chain[0] if chain else -1, expires or 0.0, key_length, len(value))
+        self.mm[at + SLOT_HEADER.size:at + SLOT_HEADER.size + len(head)] = head
+
+    def delete(self, key):
+        """Eliminar una clave; devuelve True si existía"""
+        index, _ = self._find(key)
+        if index is None:
+            return False
+        chain = self._chain(SLOT_HEADER.unpack_from(self.mm, self._at(index))[1])
+        for slot in [index] + chain:
+            self.mm[self._at(slot)] = DELETED
+        self._add_counters(live=-1, deleted=1 + len(chain), continuation=-len(chain))
+        return True
+
+    def scan_keys(self, start=0, stop=None):
+        """Claves (bytes) de los slots [start, stop)"""
+        mm = self.mm
+        keys = []
+        for index in range(start, self.slots if stop is None else min(stop, self.slots)):
+            position = self._at(index)
+            if mm[position] == USED:
+                key_length = KEY_LENGTH.unpack_from(mm, position + KEY_LENGTH_OFFSET)[0]
+                keys.append(mm[position + SLOT_HEADER.size:position + SLOT_HEADER.size + key_length])
+        return keys
+
+    def scan(self):
+        """(clave, valor, vencimiento) de todas las claves de la tabla"""
+        return [self._value(index) for index in range(self.slots) if self.mm[self._at(index)] == USED]
+
+    def expired(self, now, start, window, limit):
+        """Hasta limit claves vencidas en los slots [start, start + window); devuelve (claves, siguiente inicio)"""
+        keys = []
+        index = start
+        for _ in range(min(window, self.slots)):
+            position = self._at(index)
+            index = (index + 1) % self.slots
+            if self.mm[position] != USED:
+                continue
+            expires = SLOT_HEADER.unpack_from(self.mm, position)[2]
+            if expires and expires < now:
+                key_length = KEY_LENGTH.unpack_from(self.mm, position + KEY_LENGTH_OFFSET)[0]
+                keys.append(self.mm[position + SLOT_HEADER.size:position + SLOT_HEADER.size + key_length])
+                if len(keys) >= limit:
+                    break
+        return keys, index
+
+    def _rebuild(self):
+        """Reinsertar las claves vivas para eliminar los slots borrados"""
+        entries = self.scan()
+        start = self.slots_offset
+        end = start + self.slots * self.slot_size
+        self.mm[start:end] = bytes(end - start)
+        SHARD_HEADER.pack_into(self.mm, self.offset, 0, 0, 0)
+        self.alloc_cursor = 0
+        for key, value, expires in entries:
+            self.write(key, value, expires)
+
+
+class SharedData:
+    """Vista tipo diccionario de las claves de un SharedShard"""
+
+    def __init__(self, shard):
+        self.shard = shard
+
+    def get(self, key, default=None):
+        value = self.shard._entry(key)[0]
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.shard._entry(key)[0] = value
+
+    def pop(self, key, default=None):
+        entry = self.shard._entry(key)
+        value = entry[0]
+        entry[0] = entry[1] = None
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        live = self.shard.table.counters()[0]
+        for value, _, raw, _ in self.shard.entries.values():
+            live += (value is not None) - (raw is not None)
+        return live
+
+    def __iter__(self):
+        entries = self.shard.entries
+        keys = [key for key in (raw.decode('utf-8') for raw in self.shard.table.scan_keys()) if key not in entries]
+        keys.extend(key for key, entry in entries.items() if entry[0] is not None)
+        return iter(keys)
+
+    def items(self):
+        # Sin pasar por la caché del comando: un volcado no debe reescribir nada
+        entries = self.shard.entries
+        items = []
+        for raw_key, raw, _ in self.shard.table.scan():
+            key = raw_key.decode('utf-8')
+            if key not in entries:
+                items.append((key, decode(raw)))
+        items.extend((key, entry[0]) for key, entry in entries.items() if entry[0] is not None)
+        return items
+
+
+class SharedExpiry:
+    """Vista tipo diccionario de los vencimientos de un SharedShard"""
+
+    def __init__(self, shard):
+        self.shard = shard
+
+    def get(self, key, default=None):
+        entry = self.shard.entries.get(key)
+        if entry is not None:
+            expires = entry[1] if entry[0] is not None else None
+        else:
+            expires = self.shard.table.expires(key.encode('utf-8'))
+        return default if expires is None else expires
+
+    def __getitem__(self, key):
+        expires = self.get(key)
+        if expires is None:
+            raise KeyError(key)
+        return expires
+
+    def __setitem__(self, key, expires_at):
+        self.shard._entry(key)[1] = expires_at
+
+    def pop(self, key, default=None):
+        entry = self.shard._entry(key)
+        expires = entry[1]
+        entry[1] = None
+        return default if expires is None else expires
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+class SharedShard(Shard):
+    """Shard respaldado por una SlotTable y bloqueado también entre procesos"""
+
+    def __init__(self, table, fd, index):
+        self.table = table
+        self.fd = fd
+        self.index = index
+        self.lock = RLock()
+        self.depth = 0
+        # clave -> [valor, vencimiento, valor leído (bytes), vencimiento leído]
+        # de las claves que toca el comando en curso
+        self.entries = {}
+        self.data = SharedData(self)
+        self.expiry = SharedExpiry(self)
+        self.stats = {'acquisitions': 0, 'contended': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        self.persistence = None
+        self.loading = False
+        # La capacidad la fija la geometría del archivo (sin desalojo)
+        self.tracking = False
+        self.scan_cursor = 0
+        # SCAN recorre directamente los slots de la tabla
+        self.SCAN_BUCKETS = table.slots
+
+    def __enter__(self):
+        start = None
+        if not self.lock.acquire(blocking=False):
+            start = time.perf_counter()
+            self.lock.acquire()
+        if self.depth == 0:
+            # El lock de fcntl es por proceso: solo se toma en el nivel exterior
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, self.index)
+            except OSError:
+                if start is None:
+                    start = time.perf_counter()
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.index)
+        self.depth += 1
+        if start is not None:
+            waited = time.perf_counter() - start
+            self.stats['contended'] += 1
+            self.stats['wait_seconds'] += waited
+            if waited > self.stats['max_wait_seconds']:
+                self.stats['max_wait_seconds'] = waited
+        self.stats['acquisitions'] += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        try:
+            if self.depth == 0:
+                try:
+                    self._flush()
+                finally:
+                    self.entries.clear()
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.index)
+        finally:
+            self.lock.release()
+
+    def _entry(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            found = self.table.read(key.encode('utf-8'))
+            if found is None:
+                entry = [None, None, None, None]
+            else:
+                raw, expires = found
+                entry = [decode(raw), expires, raw, expires]
+            self.entries[key] = entry
+        return entry
+
+    def _flush(self):
+        """Escribir en la tabla las claves que cambió el comando"""
+        for key, (value, expires, raw, raw_expires) in self.entries.items():
+            if value is None:
+                if raw is not None:
+                    self.table.delete(key.encode('utf-8'))
+                continue
+            encoded = encode(value)
+            if encoded != raw or expires != raw_expires:
+                self.table.write(key.encode('utf-8'), encoded, expires)
+
+    def set_expiry(self, key, expires_at):
+        self._entry(key)[1] = expires_at
+
+    def account(self, key):
+        pass
+
+    # Sin índices locales: otros procesos también escriben en la tabla
+
+    def put(self, key, value):
+        self.data[key] = value
+        return value
+
+    def _unindex(self, key):
+        pass
+
+    def keys_with_prefix(self, prefix):
+        return [key for key in self.data if key.startswith(prefix)]
+
+    def scan(self, position, count):
+        stop = position + count
+        keys = [raw.decode('utf-8') for raw in self.table.scan_keys(position, stop)]
+        return (stop if stop < self.table.slots else None), keys
+
+    def expire_batch(self, now, limit):
+        # Sin índice compartido de vencimientos: se recorre la tabla por ventanas
+        keys, self.scan_cursor = self.table.expired(now, self.scan_cursor, limit * 8, limit)
+        for key in keys:
+            self.table.delete(key)
+        return len(keys), len(keys)
+
+
+def _poll_loop(server_ref, stop, interval):
+    """Entregar a los suscriptores locales los mensajes publicados por cualquier proceso"""
+    while not stop.wait(interval):
+        server = server_ref()
+        if server is None:
+            return
+        try:
+            server.poll_messages()
+        except Exception as e:
+            logger.error(f"Error leyendo mensajes compartidos: {e}")
+        del server
+
+
+class SharedMemoryRedis(InMemoryRedis):
+    """InMemoryRedis con el espacio de claves y el pub/sub compartidos entre procesos"""
+
+    SLOTS = 8192  # por shard
+    SLOT_SIZE = 256  # bytes
+    RING_SIZE = 1024  # mensajes retenidos para los suscriptores
+    RING_ENTRY_SIZE = 1024  # bytes por mensaje
+    POLL_INTERVAL = 0.01  # segundos
+
+    def __init__(self, path=None, shards=None, slots=None, slot_size=None):
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryRedis requiere fcntl (sistemas POSIX)")
+        self.path = path or default_path()
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._open(shards or self.SHARDS, slots or self.SLOTS, slot_size or self.SLOT_SIZE)
+        self.ring_lock = Lock()
+        super().__init__(shards=self.shard_count)
+        self.ring_seq = RING_HEADER.unpack_from(self.mm, self.ring_offset)[0]
+        self._poll_stop = Event()
+        Thread(
+            target=_poll_loop,
+            args=(weakref.ref(self), self._poll_stop, self.POLL_INTERVAL),
+            name='shared-redis-pubsub',
+            daemon=True
+        ).start()
+        logger.info(f"Simulador Redis compartido en {self.path}")
+
+    def _open(self, shards, slots, slot_size):
+        """Crear el archivo compartido o adoptar la geometría del existente"""
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self.fd, HEADER.size, 0)
+            if len(header) == HEADER.size and header.startswith(MAGIC):
+                _, shards, slots, slot_size, ring_size, ring_entry_size = HEADER.unpack(header)
+            else:
+                ring_size, ring_entry_size = self.RING_SIZE, self.RING_ENTRY_SIZE
+            self.shard_count = shards
+            self.slots = slots
+            self.slot_size = slot_size
+            self.ring_size = ring_size
+            self.ring_entry_size = ring_entry_size
+            self.shard_bytes = SHARD_HEADER.size + slots * slot_size
+            self.ring_offset = HEADER_SIZE + shards * self.shard_bytes
+            size = self.ring_offset + RING_HEADER.size + ring_size * ring_entry_size
+            if not header.startswith(MAGIC):
+                # Archivo nuevo (disperso: solo ocupa memoria lo que se escribe)
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, shards, slots, slot_size, ring_size, ring_entry_size), 0)
+            self.mm = mmap.mmap(self.fd, size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def _create_shards(self, count):
+        return [
+            SharedShard(SlotTable(self.mm, HEADER_SIZE + index * self.shard_bytes, self.slots, self.slot_size), self.fd, index)
+            for index in range(count)
+        ]
+
+    def _shard_index(self, key):
+        # hash() cambia entre procesos: todos deben elegir el mismo shard
+        return zlib.crc32(hash_tag(key).encode('utf-8')) % len(self.shards)
+
+    def set_maxmemory(self, maxmemory, policy=None, samples=None):
+        raise ResponseError("El backend compartido no desaloja: su capacidad la fijan slots y slot_size")
+
+    def get_memory_stats(self):
+        """Slots ocupados del archivo compartido (el tamaño del archivo es el límite)"""
+        used_slots = 0
+        for shard in self.shards:
+            live, _, continuation = shard.table.counters()
+            used_slots += live + continuation
+        return {
+            'used_memory': used_slots * self.slot_size,
+            'maxmemory': len(self.shards) * self.slots * self.slot_size,
+            'maxmemory_policy': 'noeviction',
+            'evicted_keys': 0,
+            'oom_rejections': 0
+        }
+
+    def _ring_entry(self, seq):
+        return self.ring_offset + RING_HEADER.size + (seq % self.ring_size) * self.ring_entry_size
+
+    def publish(self, channel, message):
+        """Publicar para todos los procesos; devuelve los suscriptores locales"""
+        payload = marshal.dumps((channel, str(message)))
+        if RING_ENTRY.size + len(payload) > self.ring_entry_size:
+            raise ResponseError("Mensaje demasiado grande para el backend compartido")
+        # El byte siguiente a los de los shards bloquea el ring entre procesos
+        with self.ring_lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.shard_count)
+            try:
+                seq = RING_HEADER.unpack_from(self.mm, self.ring_offset)[0] + 1
+                position = self._ring_entry(seq)
+                RING_ENTRY.pack_into(self.mm, position, seq, len(payload))
+                self.mm[position + RING_ENTRY.size:position + RING_ENTRY.size + len(payload)] = payload
+                RING_HEADER.pack_into(self.mm, self.ring_offset, seq)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.shard_count)
+        with self.lock:
+            return len(self.subscribers.get(channel, ()))
+
+    def poll_messages(self):
+        """Entregar los mensajes nuevos del ring a los suscriptores de este proceso"""
+        if RING_HEADER.unpack_from(self.mm, self.ring_offset)[0] == self.ring_seq:
+            return 0
+        messages = []
+        with self.ring_lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_SH, 1, self.shard_count)
+            try:
+                last = RING_HEADER.unpack_from(self.mm, self.ring_offset)[0]
+                # Los mensajes sobrescritos se pierden; los consumidores detectan
+                # el hueco por la secuencia de eventos y se resincronizan
+                for seq in range(max(self.ring_seq + 1, last - self.ring_size + 1), last + 1):
+                    position = self._ring_entry(seq)
+                    entry_seq, length = RING_ENTRY.unpack_from(self.mm, position)
+                    if entry_seq == seq:
+                        body = position + RING_ENTRY.size
+                        messages.append(marshal.loads(self.mm[body:body + length]))
+                self.ring_seq = last
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.shard_count)
+        for channel, message in messages:
+            with self.lock:
+                receivers = list(self.subscribers.get(channel, ()))
+            for subscriber in receivers:
+                subscriber._deliver(channel, message)
+        return len(messages)
@@ -0,0 +1,1003 @@
+#!/usr/bin/env python3
+"""
+Servidor RESP (protocolo de Redis) sobre el simulador en memoria
+- Servidor TCP asyncio que habla RESP2 y RESP3 (HELLO 3): el cliente redis
+  real puede conectarse por localhost sin tener Redis instalado
+- Los comandos se ejecutan sobre un InMemoryRedis, uno detrás de otro en el
+  bucle de eventos (como el hilo principal de Redis)
+- Admite pipelining, MULTI/EXEC, pub/sub y los scripts Lua conocidos
+Permite medir los endpoints /api-redis/* con la red y la serialización de
+redis-py incluidas, igual que contra un Redis real
+
+Uso: python resp_server.py [--host 127.0.0.1] [--port 6379]
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import inspect
+import logging
+import os
+import time
+from threading import Event, Thread
+
+from config import Config
+from redis_alternative import EVICTION_POLICIES, InMemoryRedis, NoScriptError, ResponseError
+
+logger = logging.getLogger(__name__)
+
+SERVER_VERSION = '7.2.0'
+READ_SIZE = 64 * 1024
+MAX_INLINE_SIZE = 64 * 1024
+DATABASES = 16
+
+# Comandos permitidos mientras una conexión RESP2 está suscrita a canales
+SUBSCRIBED_COMMANDS = {'subscribe', 'unsubscribe', 'ping', 'quit', 'reset'}
+# Comandos que no se encolan dentro de MULTI
+TRANSACTION_COMMANDS = {'multi', 'exec', 'discard'}
+
+
+class ProtocolError(Exception):
+    """Petición RESP mal formada (se responde y se cierra la conexión)"""
+
+
+class RespError(Exception):
+    """Error de comando con su prefijo RESP (p.ej. 'ERR ...', 'WRONGTYPE ...')"""
+
+
+class SimpleString(str):
+    """Respuesta de estado (+OK, +PONG, +QUEUED)"""
+
+
+class Push(list):
+    """Mensaje push de pub/sub (RESP3 '>', RESP2 array)"""
+
+
+OK = SimpleString('OK')
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+NOT_INTEGER = "ERR value is not an integer or out of range"
+NOT_FLOAT = "ERR value is not a valid float"
+SYNTAX_ERROR = "ERR syntax error"
+
+
+def format_float(value):
+    """Formato de Redis para un double: '1' en vez de '1.0', 'inf' y '-inf'"""
+    if value != value or value in (float('inf'), float('-inf')):
+        return 'inf' if value > 0 else ('-inf' if value < 0 else 'nan')
+    if value.is_integer() and abs(value) < 1e17:
+        return str(int(value))
+    return repr(value)
+
+
+def encode_reply(value, protocol, out):
+    """Serializar una respuesta en out (lista de bytes)"""
+    if value is None:
+        out.append(b'_\r\n' if protocol == 3 else b'$-1\r\n')
+    elif isinstance(value, SimpleString):
+        out.append(b'+' + value.encode('utf-8') + b'\r\n')
+    elif isinstance(value, str):
+        data = value.encode('utf-8', 'surrogateescape')
+        out.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    elif isinstance(value, bool):
+        out.append(b':1\r\n' if value else b':0\r\n')
+    elif isinstance(value, int):
+        out.append(b':%d\r\n' % value)
+    elif isinstance(value, float):
+        if protocol == 3:
+            out.append(b',' + format_float(value).encode('ascii') + b'\r\n')
+        else:
+            encode_reply(format_float(value), protocol, out)
+    elif isinstance(value, bytes):
+        out.append(b'$%d\r\n%s\r\n' % (len(value), value))
+    elif isinstance(value, RespError):
+        # Los saltos de línea cortarían la respuesta
+        out.append(b'-' + str(value).replace('\r', ' ').replace('\n', ' ').encode('utf-8') + b'\r\n')
+    elif isinstance(value, dict):
+        if protocol == 3:
+            out.append(b'%%%d\r\n' % len(value))
+        else:
+            out.append(b'*%d\r\n' % (len(value) * 2))
+        for field, item in value.items():
+            encode_reply(field, protocol, out)
+            encode_reply(item, protocol, out)
+    elif isinstance(value, (list, tuple)):
+        out.append((b'>%d\r\n' if protocol == 3 and isinstance(value, Push) else b'*%d\r\n') % len(value))
+        for item in value:
+            encode_reply(item, protocol, out)
+    else:
+        encode_reply(str(value), protocol, out)
+
+
+class RequestParser:
+    """Parser incremental de peticiones: arrays de bulk strings o comandos inline"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def feed(self, data):
+        self.buffer += data
+
+    def commands(self):
+        """Comandos completos recibidos hasta ahora (listas de bytes)"""
+        while True:
+            command = self._parse()
+            if command is None:
+                break
+            if command:
+                yield command
+        del self.buffer[:self.position]
+        self.position = 0
+
+    def _parse(self):
+        buffer = self.buffer
+        position = self.position
+        if position >= len(buffer):
+            return None
+        end = buffer.find(b'\r\n', position)
+        if end == -1:
+            if len(buffer) - position > MAX_INLINE_SIZE:
+                raise ProtocolError("too big inline request")
+            return None
+        if buffer[position] != ord('*'):
+            # Comando inline (p.ej. desde telnet)
+            self.position = end + 2
+            return bytes(buffer[position:end]).split()
+        count = self._length(buffer, position, end)
+        position = end + 2
+        args = []
+        for _ in range(count):
+            end = buffer.find(b'\r\n', position)
+            if end == -1:
+                return None
+            if buffer[position] != ord('$'):
+                raise ProtocolError(f"expected '$', got '{chr(buffer[position])}'")
+            length = self._length(buffer, position, end)
+            start = end + 2
+            if len(buffer) < start + length + 2:
+                return None
+            if buffer[start + length:start + length + 2] != b'\r\n':
+                raise ProtocolError("bulk length does not match the data")
+            args.append(bytes(buffer[start:start + length]))
+            position = start + length + 2
+        self.position = position
+        return args
+
+    @staticmethod
+    def _length(buffer, position, end):
+        try:
+            return int(buffer[position + 1:end])
+        except ValueError:
+            raise ProtocolError("invalid multibulk length")
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise RespError(NOT_INTEGER)
+
+
+def _float(value):
+    try:
+        return float(value)
+    except ValueError:
+        raise RespError(NOT_FLOAT)
+
+
+def _pairs(args):
+    if not args or len(args) % 2:
+        raise RespError(SYNTAX_ERROR)
+    return dict(zip(args[::2], args[1::2]))
+
+
+def _flatten(pairs):
+    return [item for pair in pairs for item in pair]
+
+
+class RespConnection:
+    """Una conexión de cliente: parseo, ejecución y respuesta de sus comandos"""
+
+    # nombre -> aridad como en COMMAND de Redis (negativa = mínimo de argumentos)
+    COMMANDS = {
+        'ping': -1, 'echo': 2, 'hello': -1, 'auth': -2, 'select': 2, 'client': -2, 'command': -1,
+        'info': -1, 'dbsize': 1, 'flushdb': -1, 'flushall': -1, 'quit': 1, 'reset': 1, 'config': -2,
+        'time': 1, 'get': 2, 'set': -3, 'setex': 4, 'psetex': 4, 'mget': -2, 'mset': -3, 'incr': 2,
+        'incrby': 3, 'decr': 2, 'decrby': 3, 'exists': -2, 'del': -2, 'unlink': -2, 'ttl': 2,
+        'pttl': 2, 'expire': -3, 'pexpire': -3, 'expireat': -3, 'keys': 2, 'scan': -2,
+        'lpush': -3, 'rpush': -3, 'lpop': -2, 'rpop': -2, 'llen': 2, 'lrange': 4, 'ltrim': 4,
+        'hset': -4, 'hmset': -4, 'hget': 3, 'hmget': -3, 'hgetall': 2, 'hdel': -3, 'hlen': 2,
+        'hexists': 3, 'hincrby': 4, 'zadd': -4, 'zrem': -3, 'zcard': 2, 'zrange': -4,
+        'zrangebyscore': -4, 'zremrangebyscore': 4, 'zscore': 3, 'zpopmin': -2,
+        'xadd': -5, 'xlen': 2, 'xrange': -4, 'xrevrange': -4, 'xdel': -3, 'xtrim': -4, 'xread': -4,
+        'script': -2, 'eval': -3, 'evalsha': -3, 'publish': 3, 'subscribe': -2, 'unsubscribe': -1,
+        'multi': 1, 'exec': 1, 'discard': 1
+    }
+
+    def __init__(self, server, reader, writer, client_id):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.id = client_id
+        self.name = None
+        self.protocol = 2
+        self.db_index = 0
+        self.db = server.database(0)
+        self.authenticated = server.password is None
+        self.transaction = None
+        self.channels = set()
+        self.closing = False
+        self.output = []
+        self.loop = asyncio.get_running_loop()
+
+    async def run(self):
+        parser = RequestParser()
+        try:
+            while not self.closing:
+                data = await self.reader.read(READ_SIZE)
+                if not data:
+                    break
+                parser.feed(data)
+                for args in parser.commands():
+                    reply = self.execute(args)
+                    if inspect.isawaitable(reply):
+                        # Enviar lo pendiente antes de esperar (p.ej. XREAD BLOCK)
+                        await self.flush()
+                        reply = await reply
+                    if reply is not _NO_REPLY:
+                        encode_reply(reply, self.protocol, self.output)
+                    if self.closing:
+                        break
+                await self.flush()
+        except ProtocolError as e:
+            encode_reply(RespError(f"ERR Protocol error: {e}"), self.protocol, self.output)
+            await self.flush()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._unsubscribe_all()
+            self.writer.close()
+
+    async def flush(self):
+        if self.output:
+            self.writer.write(b''.join(self.output))
+            self.output.clear()
+            await self.writer.drain()
+
+    def execute(self, args):
+        """Ejecutar un comando y devolver su respuesta (o un awaitable)"""
+        name = args[0].decode('utf-8', 'replace').lower()
+        args = [arg.decode('utf-8', 'surrogateescape') for arg in args[1:]]
+        self.server.stats['commands'] += 1
+        arity = self.COMMANDS.get(name)
+        if arity is None:
+            return self._error(RespError(f"ERR unknown command '{name}'"))
+        if (arity >= 0 and len(args) + 1 != arity) or (arity < 0 and len(args) + 1 < -arity):
+            return self._error(RespError(f"ERR wrong number of arguments for '{name}' command"))
+        if not self.authenticated and name not in ('auth', 'hello', 'quit'):
+            return self._error(RespError("NOAUTH Authentication required."))
+        if self.channels and self.protocol == 2 and name not in SUBSCRIBED_COMMANDS:
+            return self._error(RespError(f"ERR Can't execute '{name}': only (P|S)SUBSCRIBE / "
+                                         "(P|S)UNSUBSCRIBE / PING / QUIT / RESET are allowed in this context"))
+        if self.transaction is not None and name not in TRANSACTION_COMMANDS:
+            self.transaction.append((name, args))
+            return SimpleString('QUEUED')
+        return self.call(name, args)
+
+    def call(self, name, args):
+        try:
+            return getattr(self, 'cmd_' + name)(*args)
+        except RespError as e:
+            return self._error(e)
+        except NoScriptError as e:
+            return self._error(RespError(f"NOSCRIPT {e}"))
+        except ResponseError as e:
+            message = str(e)
+            prefix = message.split(' ', 1)[0]
+            return self._error(RespError(message if prefix.isupper() else f"ERR {message}"))
+        except ValueError:
+            return self._error(RespError(NOT_INTEGER))
+        except (TypeError, AttributeError):
+            return self._error(RespError(WRONGTYPE))
+        except Exception as e:
+            logger.error(f"Error ejecutando {name.upper()}: {e}")
+            return self._error(RespError(f"ERR {e}"))
+
+    def _error(self, error):
+        self.server.stats['errors'] += 1
+        return error
+
+    # Conexión y servidor
+
+    def cmd_ping(self, message=None):
+        if self.channels and self.protocol == 2:
+            return ['pong', message or '']
+        return SimpleString('PONG') if message is None else message
+
+    def cmd_echo(self, message):
+        return message
+
+    def cmd_hello(self, *args):
+        if args:
+            protocol = _int(args[0])
+            if protocol not in (2, 3):
+                raise RespError("NOPROTO unsupported protocol version")
+            options = list(args[1:])
+            while options:
+                option = options.pop(0).lower()
+                if option == 'auth' and len(options) >= 2:
+                    username, password = options.pop(0), options.pop(0)
+                    # Sin contraseña configurada el usuario por defecto acepta cualquiera
+                    if self.server.password is not None:
+                        self.cmd_auth(username, password)
+                elif option == 'setname' and options:
+                    self.name = options.pop(0)
+                else:
+                    raise RespError(SYNTAX_ERROR)
+            if not self.authenticated:
+                raise RespError("NOAUTH HELLO must be called with the client already authenticated")
+            self.protocol = protocol
+        return {
+            'server': 'redis',
+            'version': SERVER_VERSION,
+            'proto': self.protocol,
+            'id': self.id,
+            'mode': 'standalone',
+            'role': 'master',
+            'modules': []
+        }
+
+    def cmd_auth(self, *args):
+        if self.server.password is None:
+            raise RespError("ERR AUTH <password> called without any password configured for the default user")
+        if args[-1] != self.server.password or len(args) > 2:
+            raise RespError("WRONGPASS invalid username-password pair or user is disabled.")
+        self.authenticated = True
+        return OK
+
+    def cmd_select(self, index):
+        index = _int(index)
+        if not 0 <= index < DATABASES:
+            raise RespError("ERR DB index is out of range")
+        self.db_index = index
+        self.db = self.server.database(index)
+        return OK
+
+    def cmd_client(self, subcommand, *args):
+        subcommand = subcommand.lower()
+        if subcommand == 'setname' and len(args) == 1:
+            self.name = args[0]
+            return OK
+        if subcommand == 'getname':
+            return self.name
+        if subcommand == 'id':
+            return self.id
+        if subcommand == 'setinfo':
+            return OK
+        raise RespError(f"ERR unknown subcommand '{subcommand}'")
+
+    def cmd_command(self, *args):
+        if args and args[0].lower() == 'count':
+            return len(self.COMMANDS)
+        return []
+
+    def cmd_info(self, *sections):
+        return self.server.info(self.db)
+
+    def cmd_dbsize(self):
+        return self.db.dbsize()
+
+    def cmd_flushdb(self, *args):
+        keys = self.db.keys('*')
+        if keys:
+            self.db.delete(*keys)
+        return OK
+
+    def cmd_flushall(self, *args):
+        for index in list(self.server.databases):
+            db = self.server.database(index)
+            keys = db.keys('*')
+            if keys:
+                db.delete(*keys)
+        return OK
+
+    def cmd_quit(self):
+        self.closing = True
+        return OK
+
+    def cmd_reset(self):
+        self._unsubscribe_all()
+        self.transaction = None
+        self.protocol = 2
+        self.db_index = 0
+        self.db = self.server.database(0)
+        self.authenticated = self.server.password is None
+        return SimpleString('RESET')
+
+    def cmd_config(self, subcommand, *args):
+        subcommand = subcommand.lower()
+        if subcommand == 'get' and len(args) == 1:
+            settings = {
+                'maxmemory': str(self.db.maxmemory),
+                'maxmemory-policy': self.db.maxmemory_policy,
+                'maxmemory-samples': str(self.db.shards[0].samples)
+            }
+            return {name: value for name, value in settings.items() if fnmatch.fnmatchcase(name, args[0].lower())}
+        if subcommand == 'set' and len(args) == 2:
+            name, value = args[0].lower(), args[1]
+            if name == 'maxmemory':
+                self.db.set_maxmemory(_int(value))
+            elif name == 'maxmemory-policy' and value in EVICTION_POLICIES:
+                self.db.set_maxmemory(self.db.maxmemory, value)
+            elif name == 'maxmemory-samples':
+                self.db.set_maxmemory(self.db.maxmemory, samples=_int(value))
+            else:
+                raise RespError(f"ERR Unknown option or number of arguments for CONFIG SET - '{name}'")
+            return OK
+        raise RespError(f"ERR unknown subcommand '{subcommand}'")
+
+    def cmd_time(self):
+        now = time.time()
+        return [str(int(now)), str(int(now % 1 * 1000000))]
+
+    # Strings y claves
+
+    @staticmethod
+    def _string(value):
+        if value is not None and not isinstance(value, str):
+            raise RespError(WRONGTYPE)
+        return value
+
+    def cmd_get(self, key):
+        return self._string(self.db.get(key))
+
+    def cmd_set(self, key, value, *options):
+        ttl = None
+        condition = None
+        get = False
+        options = [option.lower() for option in options]
+        position = 0
+        while position < len(options):
+            option = options[position]
+            if option in ('ex', 'px') and position + 1 < len(options) and ttl is None:
+                ttl = _int(options[position + 1])
+                if ttl <= 0:
+                    raise RespError("ERR invalid expire time in 'set' command")
+                ttl = ttl / 1000 if option == 'px' else ttl
+                position += 1
+            elif option in ('nx', 'xx') and condition is None:
+                condition = option
+            elif option == 'get':
+                get = True
+            else:
+                raise RespError(SYNTAX_ERROR)
+            position += 1
+        previous = self._string(self.db.get(key)) if get or condition else None
+        if condition == 'nx' and self.db.exists(key) or condition == 'xx' and not self.db.exists(key):
+            return previous if get else None
+        if ttl is None:
+            self.db.set(key, value)
+        else:
+            self.db.setex(key, ttl, value)
+        return previous if get else OK
+
+    def cmd_setex(self, key, seconds, value):
+        seconds = _int(seconds)
+        if seconds <= 0:
+            raise RespError("ERR invalid expire time in 'setex' command")
+        self.db.setex(key, seconds, value)
+        return OK
+
+    def cmd_psetex(self, key, milliseconds, value):
+        milliseconds = _int(milliseconds)
+        if milliseconds <= 0:
+            raise RespError("ERR invalid expire time in 'psetex' command")
+        self.db.setex(key, milliseconds / 1000, value)
+        return OK
+
+    def cmd_mget(self, *keys):
+        return self.db.mget(keys)
+
+    def cmd_mset(self, *args):
+        self.db.mset(_pairs(args))
+        return OK
+
+    def cmd_incr(self, key):
+        return self.db.incr(key)
+
+    def cmd_incrby(self, key, amount):
+        return self.db.incr(key, _int(amount))
+
+    def cmd_decr(self, key):
+        return self.db.incr(key, -1)
+
+    def cmd_decrby(self, key, amount):
+        return self.db.incr(key, -_int(amount))
+
+    def cmd_exists(self, *keys):
+        return sum(self.db.exists(key) for key in keys)
+
+    def cmd_del(self, *keys):
+        return self.db.delete(*keys)
+
+    cmd_unlink = cmd_del
+
+    def cmd_ttl(self, key):
+        return self.db.ttl(key)
+
+    def cmd_pttl(self, key):
+        ttl = self.db.ttl(key)
+        return ttl * 1000 if ttl >= 0 else ttl
+
+    def cmd_expire(self, key, seconds, *options):
+        return int(bool(self.db.expire(key, _int(seconds))))
+
+    def cmd_pexpire(self, key, milliseconds, *options):
+        return int(bool(self.db.expire(key, _int(milliseconds) / 1000)))
+
+    def cmd_expireat(self, key, timestamp, *options):
+        return int(bool(self.db.expireat(key, _int(timestamp))))
+
+    def cmd_keys(self, pattern):
+        return self.db.keys(pattern)
+
+    def cmd_scan(self, cursor, *options):
+        match = None
+        count = None
+        options = list(options)
+        while options:
+            option = options.pop(0).lower()
+            if option == 'match' and options:
+                match = options.pop(0)
+            elif option == 'count' and options:
+                count = _int(options.pop(0))
+            else:
+                raise RespError(SYNTAX_ERROR)
+        cursor, keys = self.db.scan(_int(cursor), match=match, count=count)
+        return [str(cursor), keys]
+
+    # Listas
+
+    def cmd_lpush(self, key, *values):
+        return self.db.lpush(key, *values)
+
+    def cmd_rpush(self, key, *values):
+        return self.db.rpush(key, *values)
+
+    def cmd_lpop(self, key, count=None):
+        return self.db.lpop(key, _int(count) if count is not None else None)
+
+    def cmd_rpop(self, key, count=None):
+        return self.db.rpop(key, _int(count) if count is not None else None)
+
+    def cmd_llen(self, key):
+        return self.db.llen(key)
+
+    def cmd_lrange(self, key, start, end):
+        return self.db.lrange(key, _int(start), _int(end))
+
+    def cmd_ltrim(self, key, start, end):
+        self.db.ltrim(key, _int(start), _int(end))
+        return OK
+
+    # Hashes
+
+    def cmd_hset(self, key, *args):
+        return self.db.hset(key, mapping=_pairs(args))
+
+    def cmd_hmset(self, key, *args):
+        self.db.hset(key, mapping=_pairs(args))
+        return OK
+
+    def cmd_hget(self, key, field):
+        return self.db.hget(key, field)
+
+    def cmd_hmget(self, key, *fields):
+        return self.db.hmget(key, *fields)
+
+    def cmd_hgetall(self, key):
+        return self.db.hgetall(key)
+
+    def cmd_hdel(self, key, *fields):
+        return self.db.hdel(key, *fields)
+
+    def cmd_hlen(self, key):
+        return self.db.hlen(key)
+
+    def cmd_hexists(self, key, field):
+        return int(self.db.hexists(key, field))
+
+    def cmd_hincrby(self, key, field, amount):
+        return self.db.hincrby(key, field, _int(amount))
+
+    # Conjuntos ordenados
+
+    def _scored(self, items, withscores):
+        if not withscores:
+            return [member for member, _ in items]
+        if self.protocol == 3:
+            return [[member, float(score)] for member, score in items]
+        return _flatten((member, format_float(float(score))) for member, score in items)
+
+    def cmd_zadd(self, key, *args):
+        if len(args) % 2:
+            raise RespError(SYNTAX_ERROR)
+        mapping = {member: _float(score) for score, member in zip(args[::2], args[1::2])}
+        return self.db.zadd(key, mapping)
+
+    def cmd_zrem(self, key, *members):
+        return self.db.zrem(key, *members)
+
+    def cmd_zcard(self, key):
+        return self.db.zcard(key)
+
+    def cmd_zrange(self, key, start, end, *options):
+        options = [option.lower() for option in options]
+        if options not in ([], ['withscores']):
+            raise RespError(SYNTAX_ERROR)
+        items = self.db.zrange(key, _int(start), _int(end), withscores=True)
+        return self._scored(items, bool(options))
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        withscores = False
+        offset = count = None
+        options = list(options)
+        while options:
+            option = options.pop(0).lower()
+            if option == 'withscores':
+                withscores = True
+            elif option == 'limit' and len(options) >= 2:
+                offset, count = _int(options.pop(0)), _int(options.pop(0))
+            else:
+                raise RespError(SYNTAX_ERROR)
+        items = self.db.zrangebyscore(key, low, high, start=offset, num=count, withscores=True)
+        return self._scored(items, withscores)
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        return self.db.zremrangebyscore(key, low, high)
+
+    def cmd_zscore(self, key, member):
+        score = self.db.zscore(key, member)
+        if score is None:
+            return None
+        return float(score) if self.protocol == 3 else format_float(float(score))
+
+    def cmd_zpopmin(self, key, count=None):
+        items = self.db.zpopmin(key, _int(count) if count is not None else None)
+        if self.protocol == 3 and count is None:
+            # RESP3 sin count: un único par plano
+            return _flatten((member, float(score)) for member, score in items)
+        return self._scored(items, True)
+
+    # Streams
+
+    @staticmethod
+    def _entries(entries):
+        return [[entry_id, _flatten(fields.items())] for entry_id, fields in entries]
+
+    @staticmethod
+    def _maxlen(options):
+        """MAXLEN [=|~] n al principio de options; devuelve (maxlen, resto)"""
+        if len(options) < 2 or options[0].lower() != 'maxlen':
+            return None, options
+        position = 2 if options[1] in ('=', '~') else 1
+        if position >= len(options):
+            raise RespError(SYNTAX_ERROR)
+        return _int(options[position]), options[position + 1:]
+
+    def cmd_xadd(self, key, *args):
+        maxlen, args = self._maxlen(list(args))
+        if len(args) < 3 or len(args) % 2 == 0:
+            raise RespError("ERR wrong number of arguments for 'xadd' command")
+        return self.db.xadd(key, _pairs(args[1:]), id=args[0], maxlen=maxlen)
+
+    def cmd_xlen(self, key):
+        return self.db.xlen(key)
+
+    def _count(self, options):
+        if not options:
+            return None
+        if len(options) != 2 or options[0].lower() != 'count':
+            raise RespError(SYNTAX_ERROR)
+        return _int(options[1])
+
+    def cmd_xrange(self, key, low, high, *options):
+        return self._entries(self.db.xrange(key, low, high, count=self._count(options)))
+
+    def cmd_xrevrange(self, key, high, low, *options):
+        return self._entries(self.db.xrevrange(key, high, low, count=self._count(options)))
+
+    def cmd_xdel(self, key, *ids):
+        return self.db.xdel(key, *ids)
+
+    def cmd_xtrim(self, key, *options):
+        maxlen, rest = self._maxlen(list(options))
+        if maxlen is None or rest:
+            raise RespError(SYNTAX_ERROR)
+        return self.db.xtrim(key, maxlen)
+
+    def cmd_xread(self, *args):
+        count = block = None
+        args = list(args)
+        while args and args[0].lower() != 'streams':
+            option = args.pop(0).lower()
+            if option == 'count' and args:
+                count = _int(args.pop(0))
+            elif option == 'block' and args:
+                block = _int(args.pop(0))
+            else:
+                raise RespError(SYNTAX_ERROR)
+        names = args[1:]
+        if not names or len(names) % 2:
+            raise RespError("ERR Unbalanced 'xread' list of streams: for each stream key an ID or '$' must be specified.")
+        half = len(names) // 2
+        streams = dict(zip(names[:half], names[half:]))
+        if block is None:
+            return self._xread_reply(self.db.xread(streams, count=count))
+        # La espera bloqueante se hace fuera del bucle de eventos
+        return self._xread_blocking(streams, count, block)
+
+    async def _xread_blocking(self, streams, count, block):
+        result = await self.loop.run_in_executor(None, lambda: self.db.xread(streams, count=count, block=block))
+        return self._xread_reply(result)
+
+    def _xread_reply(self, result):
+        if not result:
+            return None
+        if self.protocol == 3:
+            return {name: self._entries(entries) for name, entries in result}
+        return [[name, self._entries(entries)] for name, entries in result]
+
+    # Scripts
+
+    def cmd_script(self, subcommand, *args):
+        subcommand = subcommand.lower()
+        if subcommand == 'load' and len(args) == 1:
+            return self.db.script_load(args[0])
+        if subcommand == 'exists':
+            return [int(sha in self.db.scripts) for sha in args]
+        if subcommand == 'flush':
+            with self.db.lock:
+                self.db.scripts.clear()
+            return OK
+        raise RespError(f"ERR unknown subcommand '{subcommand}'")
+
+    def cmd_evalsha(self, sha, numkeys, *args):
+        numkeys = _int(numkeys)
+        if not 0 <= numkeys <= len(args):
+            raise RespError("ERR Number of keys can't be greater than number of args")
+        return self.db.evalsha(sha, numkeys, *args)
+
+    def cmd_eval(self, script, numkeys, *args):
+        return self.cmd_evalsha(self.db.script_load(script), numkeys, *args)
+
+    # Pub/sub
+
+    def cmd_publish(self, channel, message):
+        # Los canales son del servidor, no de cada base de datos
+        return self.server.database(0).publish(channel, message)
+
+    def cmd_subscribe(self, *channels):
+        for channel in channels:
+            if channel not in self.channels:
+                self.server.database(0)._add_subscriber(channel, self)
+                self.channels.add(channel)
+            self._push(['subscribe', channel, len(self.channels)])
+        return self._no_reply()
+
+    def cmd_unsubscribe(self, *channels):
+        if not channels and not self.channels:
+            self._push(['unsubscribe', None, 0])
+        for channel in list(channels or self.channels):
+            self.server.database(0)._remove_subscriber(channel, self)
+            self.channels.discard(channel)
+            self._push(['unsubscribe', channel, len(self.channels)])
+        return self._no_reply()
+
+    def _no_reply(self):
+        # Las confirmaciones de (UN)SUBSCRIBE ya se enviaron como mensajes push
+        return _NO_REPLY
+
+    def _push(self, message):
+        encode_reply(Push(message), self.protocol, self.output)
+
+    def _deliver(self, channel, message):
+        """Recibir una publicación (puede llegar desde otro hilo)"""
+        self.loop.call_soon_threadsafe(self._write_message, channel, message)
+
+    def _write_message(self, channel, message):
+        if channel in self.channels and not self.writer.is_closing():
+            out = []
+            encode_reply(Push(['message', channel, message]), self.protocol, out)
+            self.writer.write(b''.join(out))
+
+    def _unsubscribe_all(self):
+        for channel in self.channels:
+            self.server.database(0)._remove_subscriber(channel, self)
+        self.channels.clear()
+
+    # Transacciones
+
+    def cmd_multi(self):
+        if self.transaction is not None:
+            raise RespError("ERR MULTI calls can not be nested")
+        self.transaction = []
+        return OK
+
+    def cmd_exec(self):
+        if self.transaction is None:
+            raise RespError("ERR EXEC without MULTI")
+        commands, self.transaction = self.transaction, None
+        # El bucle de eventos no atiende a otros clientes mientras tanto
+        return [self.call(name, args) for name, args in commands]
+
+    def cmd_discard(self):
+        if self.transaction is None:
+            raise RespError("ERR DISCARD without MULTI")
+        self.transaction = None
+        return OK
+
+
+class _NoReply:
+    """Marcador: el comando ya escribió sus respuestas"""
+
+
+_NO_REPLY = _NoReply()
+
+
+class RespServer:
+    """Servidor RESP sobre uno o varios InMemoryRedis (uno por base de datos)"""
+
+    def __init__(self, engine=None, host='127.0.0.1', port=6379, password=None):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.databases = {0: engine or InMemoryRedis()}
+        self.next_client_id = 0
+        self.stats = {'connections': 0, 'connected_clients': 0, 'commands': 0, 'errors': 0}
+        self.started_at = time.time()
+        self.server = None
+        self.loop = None
+        self.connections = set()
+        self._thread = None
+
+    def database(self, index):
+        """InMemoryRedis de una base de datos (se crea al seleccionarla por primera vez)"""
+        db = self.databases.get(index)
+        if db is None:
+            db = self.databases[index] = InMemoryRedis()
+        return db
+
+    async def start(self):
+        """Empezar a aceptar conexiones; con port=0 se elige un puerto libre"""
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Servidor RESP escuchando en {self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start_in_thread(self):
+        """Arrancar el servidor en un hilo propio (benchmarks y pruebas); devuelve self"""
+        started = Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start())
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                loop.close()
+
+        self._thread = Thread(target=run, name='resp-server', daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        """Detener un servidor arrancado con start_in_thread()"""
+        if self.loop is None or self.server is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    async def _shutdown(self):
+        self.server.close()
+        for task in list(self.connections):
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    async def _handle(self, reader, writer):
+        self.next_client_id += 1
+        self.stats['connections'] += 1
+        self.stats['connected_clients'] += 1
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            await RespConnection(self, reader, writer, self.next_client_id).run()
+        except asyncio.CancelledError:
+            # Parada del servidor: la conexión ya se cerró en run()
+            pass
+        finally:
+            self.connections.discard(task)
+            self.stats['connected_clients'] -= 1
+
+    def info(self, db):
+        """Texto de INFO con las secciones server, clients, memory, stats y keyspace"""
+        memory = db.get_memory_stats()
+        sections = {
+            'Server': {
+                'redis_version': SERVER_VERSION,
+                'redis_mode': 'standalone',
+                'process_id': os.getpid(),
+                'tcp_port': self.port,
+                'uptime_in_seconds': int(time.time() - self.started_at)
+            },
+            'Clients': {'connected_clients': self.stats['connected_clients']},
+            'Memory': {
+                'used_memory': memory['used_memory'],
+                'maxmemory': memory['maxmemory'],
+                'maxmemory_policy': memory['maxmemory_policy']
+            },
+            'Stats': {
+                'total_connections_received': self.stats['connections'],
+                'total_commands_processed': self.stats['commands'],
+                'total_error_replies': self.stats['errors'],
+                'expired_keys': db.stats['expired_keys'],
+                'evicted_keys': memory['evicted_keys']
+            },
+            'Keyspace': {
+                f"db{index}": f"keys={database.dbsize()},expires=0,avg_ttl=0"
+                for index, database in sorted(self.databases.items()) if database.dbsize()
+            }
+        }
+        lines = []
+        for section, values in sections.items():
+            lines.append(f"# {section}")
+            lines.extend(f"{name}:{value}" for name, value in values.items())
+            lines.append('')
+        return '\r\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor RESP sobre el simulador Redis en memoria")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=Config.REDIS_PORT)
+    parser.add_argument('--password', default=Config.REDIS_PASSWORD)
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from redis_persistence import enable_persistence
+    engine = InMemoryRedis(
+        maxmemory=Config.INMEMORY_MAXMEMORY,
+        maxmemory_policy=Config.INMEMORY_MAXMEMORY_POLICY,
+        maxmemory_samples=Config.INMEMORY_MAXMEMORY_SAMPLES,
+        maxmemory_protected=Config.INMEMORY_MAXMEMORY_PROTECTED
+    )
+    enable_persistence(engine)
+    server = RespServer(engine, options.host, options.port, options.password)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
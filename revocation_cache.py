@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Cachés locales (near cache) invalidadas por pub/sub
+- RevocationCache: resultados de revocación de tokens; las entradas positivas
+  (revocado) viven hasta la expiración del token y las negativas además tienen
+  un TTL corto por si se pierde una invalidación
+- UserCache: filas de usuario consultadas en el camino caliente (refresh, perfil)
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LocalCache:
+    """LRU acotado con expiración por entrada, activo solo con invalidaciones"""
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        # Deshabilitada hasta que el suscriptor de invalidaciones esté activo
+        self.enabled = False
+        # Se incrementa con cada invalidación; evita guardar un resultado leído
+        # del backend antes de una invalidación que llegó durante la lectura
+        self.generation = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'evictions': 0
+        }
+
+    def get(self, key):
+        """Devolver el valor vigente de una clave, None si no hay"""
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def put(self, key, value, expires_at=None, generation=None):
+        """Guardar un valor hasta expires_at (por defecto ahora + ttl)"""
+        if not self.enabled:
+            return
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        if expires_at <= time.time():
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, key):
+        """Descartar la entrada de una clave (p.ej. por un mensaje de invalidación)"""
+        with self.lock:
+            self.generation += 1
+            if self.entries.pop(key, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def enable(self):
+        """Activar la caché partiendo de cero (las invalidaciones previas se perdieron)"""
+        self.clear()
+        self.enabled = True
+
+    def disable(self):
+        """Desactivar la caché; las consultas van directas al backend"""
+        self.enabled = False
+        self.clear()
+
+    def get_metrics(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            'enabled': self.enabled,
+            'size': len(self.entries),
+            'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else 0.0,
+            **self.stats
+        }
+
+
+class RevocationCache(LocalCache):
+    """LRU de jti -> revocado (True/False) acotado por la expiración del token"""
+
+    def __init__(self, max_size=10000, negative_ttl=30):
+        super().__init__(max_size, negative_ttl)
+        self.negative_ttl = negative_ttl
+
+    def set(self, jti, revoked, token_exp=None, generation=None):
+        """Guardar un resultado acotado por la expiración del token"""
+        now = time.time()
+        expires_at = token_exp if token_exp else now + self.negative_ttl
+        if not revoked:
+            expires_at = min(expires_at, now + self.negative_ttl)
+        self.put(jti, revoked, expires_at, generation)
+
+
+class UserCache(LocalCache):
+    """LRU de user_id -> fila de usuario con TTL corto"""
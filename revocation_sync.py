@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Sincronización de revocaciones entre SQL y Redis
+- Escritura en ambos almacenes: las revocaciones de SQL se copian a Redis de
+  forma síncrona antes de responder; las hechas primero en Redis se copian a
+  SQL en segundo plano desde una cola
+- Reconciliador: repuebla Redis con las filas vigentes de revoked_tokens
+  cuando Redis pierde datos (reinicio, caída al simulador o reconexión)
+Mientras Redis está sincronizado, la blocklist puede responder desde Redis
+sin consultar SQL. El marcador SYNC_MARKER_KEY lo comparten todos los
+workers: si una copia a Redis falla se borra, y cada worker deja de confiar
+en Redis (y vacía su caché local) en cuanto lo echa en falta
+"""
+
+import logging
+import time
+from datetime import datetime
+from queue import Full, Queue
+from threading import Event, Lock, Thread
+from config import Config
+from database import Database
+from models import RevokedToken
+from redis_manager import redis_manager, EVENT_REVOKE, STATE_CONNECTED, STATE_FALLBACK
+
+logger = logging.getLogger(__name__)
+
+# Clave sin TTL: si desaparece, Redis perdió sus datos y hay que reconciliar
+SYNC_MARKER_KEY = 'revocation_sync:marker'
+
+MAX_WRITE_ATTEMPTS = 3
+
+# Tokens por MGET al comprobar qué filas de SQL faltan en Redis
+RECONCILE_BATCH_SIZE = 500
+
+# Cada cuánto comprueba un worker que el marcador sigue en Redis (segundos)
+MARKER_CHECK_INTERVAL = 1.0
+
+
+class RevocationSync:
+    """Escritor asíncrono del almacén secundario y reconciliador SQL -> Redis"""
+
+    def __init__(self):
+        self.queue = Queue(maxsize=Config.REVOCATION_QUEUE_SIZE)
+        self.lock = Lock()
+        self.in_sync = False
+        self.synced_client = None
+        self.marker_checked_at = 0.0
+        self.last_reconcile = None
+        self.metrics = {
+            'queued': 0,
+            'written_redis': 0,
+            'written_sql': 0,
+            'write_errors': 0,
+            'reconciliations': 0,
+            'reconciled_tokens': 0
+        }
+        self._stop = Event()
+        self._reconcile_wakeup = Event()
+        self._writer_thread = None
+        self._reconciler_thread = None
+        # Una conexión SQL por hilo: el cursor de mysql.connector no es seguro
+        # entre hilos y la conexión global db la usan los hilos de peticiones
+        self._writer_db = Database()
+        self._reconciler_db = Database()
+        redis_manager.state_listeners.append(self._on_redis_state)
+
+    def start(self):
+        """Iniciar el escritor y el reconciliador en segundo plano (lo llama la aplicación al arrancar)"""
+        if self._writer_thread is not None:
+            return
+        self._writer_thread = Thread(target=self._writer_loop, name='revocation-writer', daemon=True)
+        self._writer_thread.start()
+        self._reconciler_thread = Thread(target=self._reconciler_loop, name='revocation-reconciler', daemon=True)
+        self._reconciler_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._reconcile_wakeup.set()
+
+    def write_redis(self, jti, token_type, user_id, expires_at):
+        """Copiar a Redis de forma síncrona una revocación ya guardada en SQL"""
+        # set_token_revoked también publica la invalidación de cachés locales
+        if self._expired(expires_at) or redis_manager.set_token_revoked(jti, token_type, user_id, expires_at):
+            self._count('written_redis')
+            return True
+        # Redis no la tiene: ningún worker debe confiar en él hasta reconciliar,
+        # ni en los negativos de este jti que tenga en su caché local
+        self._count('write_errors')
+        self.mark_out_of_sync(shared=True)
+        redis_manager.revocation_cache.invalidate(jti)
+        redis_manager.publish_event(EVENT_REVOKE, jti=jti)
+        return False
+
+    def write_sql_async(self, jti, token_type, user_id, expires_at):
+        """Encolar la copia en SQL de una revocación ya guardada en Redis"""
+        self._enqueue((jti, token_type, user_id, expires_at))
+
+    def _enqueue(self, task):
+        try:
+            self.queue.put_nowait(task)
+            self._count('queued')
+        except Full:
+            # Cola llena: un único intento en el hilo que revoca, sin esperas
+            # ni reintentos para no bloquear la petición (contrapresión)
+            logger.warning("Cola de revocaciones llena, escribiendo de forma síncrona")
+            if not self._write(task):
+                logger.error(f"No se pudo copiar a SQL la revocación del token {task[0]}")
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.metrics[name] += amount
+
+    def redis_in_sync(self):
+        """Redis contiene todas las revocaciones vigentes de SQL"""
+        if not (
+            self.in_sync
+            and self.synced_client is redis_manager.redis_client
+            and redis_manager.state in (STATE_CONNECTED, STATE_FALLBACK)
+        ):
+            return False
+        now = time.time()
+        if now - self.marker_checked_at >= MARKER_CHECK_INTERVAL:
+            self.marker_checked_at = now
+            try:
+                present = redis_manager.redis_client.exists(SYNC_MARKER_KEY)
+            except Exception as e:
+                logger.error(f"Error comprobando el marcador de sincronización: {e}")
+                present = False
+            if not present:
+                # Otro worker no pudo copiar una revocación (o Redis perdió datos):
+                # los negativos guardados en la caché local ya no son fiables
+                self.mark_out_of_sync()
+                redis_manager.revocation_cache.clear()
+                return False
+        return True
+
+    def _writer_loop(self):
+        """Aplicar las escrituras encoladas en el almacén secundario"""
+        while not self._stop.is_set():
+            task = self.queue.get()
+            try:
+                # Los reintentos con espera solo ocurren en este hilo
+                for attempt in range(1, MAX_WRITE_ATTEMPTS + 1):
+                    if self._write(task, self._writer_db):
+                        break
+                    if attempt < MAX_WRITE_ATTEMPTS:
+                        self._stop.wait(Config.REDIS_BACKOFF_BASE * (2 ** attempt))
+                else:
+                    logger.error(f"No se pudo copiar a SQL la revocación del token {task[0]}")
+            finally:
+                self.queue.task_done()
+
+    def _write(self, task, database=None):
+        """Copiar a SQL una revocación hecha primero en Redis; False si falla"""
+        if RevokedToken(*task).save(database):
+            self._count('written_sql')
+            return True
+        self._count('write_errors')
+        return False
+
+    @staticmethod
+    def _expired(expires_at):
+        return isinstance(expires_at, datetime) and expires_at <= datetime.now()
+
+    def mark_out_of_sync(self, shared=False):
+        """Forzar una reconciliación y servir desde SQL mientras tanto; con shared
+        se borra el marcador para que los demás workers tampoco confíen en Redis"""
+        self.in_sync = False
+        self._reconcile_wakeup.set()
+        if shared:
+            try:
+                redis_manager.redis_client.delete(SYNC_MARKER_KEY)
+            except Exception as e:
+                logger.error(f"Error borrando el marcador de sincronización: {e}")
+
+    def _on_redis_state(self, state):
+        # Un backend nuevo (reconexión o simulador) no tiene las revocaciones previas
+        if state != STATE_CONNECTED or self.synced_client is not redis_manager.redis_client:
+            self.mark_out_of_sync()
+
+    def _reconciler_loop(self):
+        """Comprobar periódicamente si Redis perdió datos y reconciliar"""
+        while not self._stop.is_set():
+            try:
+                if not self.redis_in_sync() or not redis_manager.redis_client.exists(SYNC_MARKER_KEY):
+                    self.reconcile()
+            except Exception as e:
+                self.in_sync = False
+                logger.error(f"Error en el reconciliador de revocaciones: {e}")
+            self._reconcile_wakeup.wait(Config.REVOCATION_RECONCILE_INTERVAL)
+            self._reconcile_wakeup.clear()
+
+    def reconcile(self):
+        """Repoblar Redis con los tokens revocados vigentes en SQL"""
+        self.in_sync = False
+        client = redis_manager.redis_client
+        start_time = time.time()
+        rows = RevokedToken.get_active(self._reconciler_db)
+        if rows is None:
+            logger.error("No se pudieron leer los tokens revocados de SQL para reconciliar")
+            return False
+
+        restored = 0
+        for start in range(0, len(rows), RECONCILE_BATCH_SIZE):
+            batch = rows[start:start + RECONCILE_BATCH_SIZE]
+            # Un MGET por lote en lugar de un GET por fila
+            revoked = redis_manager.lookup_tokens_revoked([(row['jti'], row['user_id']) for row in batch])
+            if revoked is None:
+                return False
+            for row, present in zip(batch, revoked):
+                if not present and redis_manager.set_token_revoked(
+                    row['jti'], row['token_type'], row['user_id'], row['expires_at'], publish=False
+                ):
+                    restored += 1
+
+        if redis_manager.redis_client is not client:
+            # El backend cambió durante la reconciliación; se repetirá
+            return False
+        client.set(SYNC_MARKER_KEY, datetime.utcnow().isoformat())
+        # Las cachés locales de todos los workers pudieron guardar negativos
+        # de tokens restaurados
+        if restored:
+            redis_manager.request_resync()
+        self.synced_client = client
+        self.in_sync = True
+        self.last_reconcile = time.time()
+        self._count('reconciliations')
+        self._count('reconciled_tokens', restored)
+        logger.info(f"Reconciliación de revocaciones: {restored} de {len(rows)} tokens restaurados en Redis "
+                    f"({(time.time() - start_time) * 1000:.2f}ms)")
+        return True
+
+    def get_metrics(self):
+        return {
+            'redis_in_sync': self.redis_in_sync(),
+            'queue_size': self.queue.qsize(),
+            'last_reconcile': datetime.utcfromtimestamp(self.last_reconcile).isoformat() if self.last_reconcile else None,
+            **self._metrics_snapshot()
+        }
+
+    def _metrics_snapshot(self):
+        with self.lock:
+            return dict(self.metrics)
+
+
+# Instancia global del sincronizador (sus hilos se inician desde app.py)
+revocation_sync = RevocationSync()